@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
@@ -8,6 +8,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@
 import { Textarea } from '@/components/ui/textarea';
 import { Switch } from '@/components/ui/switch';
 import { AlertTriangle, Play, Pause, Settings, Zap, Navigation, Shield } from 'lucide-react';
+import { CONTROL_API, fetchJson, upsertBy, useLiveFeed } from '@/lib/liveFeed';
 
 const TrafficControl = () => {
   const [trafficLights, setTrafficLights] = useState([]);
@@ -22,25 +23,31 @@ const TrafficControl = () => {
     location: ''
   });
 
-  useEffect(() => {
-    // Mock data for demonstration
-    const mockTrafficLights = [
-      { id: 1, light_id: 'TL_001', intersection_name: 'Times Square', current_state: 'GREEN', cycle_duration: 120, is_active: true },
-      { id: 2, light_id: 'TL_002', intersection_name: 'Central Park South', current_state: 'RED', cycle_duration: 90, is_active: true },
-      { id: 3, light_id: 'TL_003', intersection_name: 'Herald Square', current_state: 'GREEN', cycle_duration: 110, is_active: true },
-      { id: 4, light_id: 'TL_004', intersection_name: 'Queens Plaza', current_state: 'YELLOW', cycle_duration: 100, is_active: false },
-      { id: 5, light_id: 'TL_005', intersection_name: 'Brooklyn Bridge', current_state: 'GREEN', cycle_duration: 130, is_active: true },
-    ];
+  const loadSnapshot = useCallback(async () => {
+    try {
+      const [lights, activeSignals] = await Promise.all([
+        fetchJson(`${CONTROL_API}/traffic-lights`),
+        fetchJson(`${CONTROL_API}/signals`),
+      ]);
+      setTrafficLights(lights.traffic_lights);
+      setSignals(activeSignals.signals);
+    } catch (e) {
+      console.error('Failed to load traffic lights', e);
+    }
+  }, []);
 
-    const mockSignals = [
-      { id: 1, signal_type: 'SPEED_LIMIT', message: 'Speed limit reduced to 25 mph due to construction', priority: 'HIGH', is_active: true },
-      { id: 2, signal_type: 'LANE_CLOSURE', message: 'Right lane closed ahead - merge left', priority: 'MEDIUM', is_active: true },
-      { id: 3, signal_type: 'REROUTE', message: 'Alternative route recommended via Broadway', priority: 'LOW', is_active: true },
-    ];
+  useEffect(() => {
+    loadSnapshot();
+  }, [loadSnapshot]);
 
-    setTrafficLights(mockTrafficLights);
-    setSignals(mockSignals);
-  }, []);
+  // State changes made here, by adaptive control or by other operators all arrive on the feed
+  const live = useLiveFeed(CONTROL_API, {
+    topics: ['lights'],
+    onBatch: ({ events }) => {
+      setTrafficLights((current) => upsertBy(current, events.lights, 'light_id'));
+    },
+    onResync: loadSnapshot,
+  });
 
   const getStateColor = (state) => {
     switch (state) {
@@ -61,14 +68,17 @@ const TrafficControl = () => {
     }
   };
 
-  const handleLightStateChange = (lightId, newState) => {
-    setTrafficLights(lights =>
-      lights.map(light =>
-        light.light_id === lightId
-          ? { ...light, current_state: newState }
-          : light
-      )
-    );
+  const handleLightStateChange = async (lightId, newState) => {
+    try {
+      const { traffic_light } = await fetchJson(`${CONTROL_API}/traffic-lights/${lightId}/state`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ state: newState, operator: 'DASHBOARD' }),
+      });
+      setTrafficLights(lights => upsertBy(lights, [traffic_light], 'light_id'));
+    } catch (e) {
+      console.error(`Failed to set ${lightId} to ${newState}`, e);
+    }
   };
 
   const handleEmergencyResponse = () => {
@@ -83,15 +93,14 @@ const TrafficControl = () => {
     }, 10000); // Reset after 10 seconds
   };
 
-  const handleAdaptiveControl = () => {
+  const handleAdaptiveControl = async () => {
     if (adaptiveControl) {
-      // Simulate adaptive control adjustments
-      setTrafficLights(lights =>
-        lights.map(light => ({
-          ...light,
-          cycle_duration: Math.max(60, Math.min(180, light.cycle_duration + (Math.random() - 0.5) * 40))
-        }))
-      );
+      // New cycle durations are pushed back over the live feed
+      try {
+        await fetchJson(`${CONTROL_API}/adaptive-control`, { method: 'POST' });
+      } catch (e) {
+        console.error('Adaptive control cycle failed', e);
+      }
     }
   };
 
@@ -155,6 +164,11 @@ const TrafficControl = () => {
                 EMERGENCY MODE ACTIVE
               </Badge>
             )}
+            
+            <Badge variant={live ? 'outline' : 'secondary'} className="ml-auto flex items-center gap-1">
+              <div className={`w-2 h-2 rounded-full ${live ? 'bg-green-500 animate-pulse' : 'bg-gray-400'}`}></div>
+              {live ? 'Live updates' : 'Reconnecting'}
+            </Badge>
           </div>
         </CardContent>
       </Card>
@@ -1,8 +1,9 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
 import { MapPin, AlertTriangle, Navigation, RefreshCw } from 'lucide-react';
+import { INGESTION_API, CONTROL_API, MAP_BOUNDS, fetchJson, upsertBy, useLiveFeed } from '@/lib/liveFeed';
 
 const TrafficMap = () => {
   const [trafficData, setTrafficData] = useState([]);
@@ -10,33 +11,53 @@ const TrafficMap = () => {
   const [trafficLights, setTrafficLights] = useState([]);
   const [loading, setLoading] = useState(true);
   const [selectedLocation, setSelectedLocation] = useState(null);
+  const [error, setError] = useState(null);
+
+  const loadSnapshot = useCallback(async () => {
+    try {
+      const [readings, incidentList, lights] = await Promise.all([
+        fetchJson(`${INGESTION_API}/traffic-data?limit=500`),
+        fetchJson(`${INGESTION_API}/incidents`),
+        fetchJson(`${CONTROL_API}/traffic-lights`),
+      ]);
+      // Readings come newest first; keep the latest one per sensor
+      setTrafficData(upsertBy([], [...readings.data].reverse(), 'sensor_id'));
+      setIncidents(incidentList.incidents);
+      setTrafficLights(lights.traffic_lights);
+      setError(null);
+    } catch (e) {
+      setError(e.message);
+    } finally {
+      setLoading(false);
+    }
+  }, []);
 
-  // Mock data for demonstration
   useEffect(() => {
-    const mockTrafficData = [
-      { id: 1, sensor_id: 'SENSOR_001', location_lat: 40.7128, location_lng: -74.0060, vehicle_count: 45, average_speed: 35, congestion_level: 'MEDIUM' },
-      { id: 2, sensor_id: 'SENSOR_002', location_lat: 40.7589, location_lng: -73.9851, vehicle_count: 78, average_speed: 22, congestion_level: 'HIGH' },
-      { id: 3, sensor_id: 'SENSOR_003', location_lat: 40.7505, location_lng: -73.9934, vehicle_count: 32, average_speed: 55, congestion_level: 'LOW' },
-      { id: 4, sensor_id: 'SENSOR_004', location_lat: 40.7282, location_lng: -73.7949, vehicle_count: 56, average_speed: 28, congestion_level: 'HIGH' },
-      { id: 5, sensor_id: 'SENSOR_005', location_lat: 40.6892, location_lng: -74.0445, vehicle_count: 23, average_speed: 62, congestion_level: 'LOW' },
-    ];
-
-    const mockIncidents = [
-      { id: 1, incident_type: 'ACCIDENT', location_lat: 40.7589, location_lng: -73.9851, severity: 'HIGH', description: 'Multi-vehicle accident blocking two lanes' },
-      { id: 2, incident_type: 'CONSTRUCTION', location_lat: 40.7282, location_lng: -73.7949, severity: 'MEDIUM', description: 'Road construction reducing traffic to one lane' },
-    ];
-
-    const mockTrafficLights = [
-      { id: 1, light_id: 'TL_001', location_lat: 40.7128, location_lng: -74.0060, current_state: 'GREEN', intersection_name: 'Times Square' },
-      { id: 2, light_id: 'TL_002', location_lat: 40.7589, location_lng: -73.9851, current_state: 'RED', intersection_name: 'Central Park South' },
-      { id: 3, light_id: 'TL_003', location_lat: 40.7505, location_lng: -73.9934, current_state: 'GREEN', intersection_name: 'Herald Square' },
-    ];
-
-    setTrafficData(mockTrafficData);
-    setIncidents(mockIncidents);
-    setTrafficLights(mockTrafficLights);
-    setLoading(false);
-  }, []);
+    loadSnapshot();
+  }, [loadSnapshot]);
+
+  const sensorsLive = useLiveFeed(INGESTION_API, {
+    topics: ['readings', 'incidents'],
+    bbox: MAP_BOUNDS,
+    onBatch: ({ events }) => {
+      setTrafficData((current) => upsertBy(current, events.readings, 'sensor_id'));
+      setIncidents((current) =>
+        upsertBy(current, events.incidents, 'id').filter((incident) => incident.status === 'ACTIVE')
+      );
+    },
+    onResync: loadSnapshot,
+  });
+
+  const lightsLive = useLiveFeed(CONTROL_API, {
+    topics: ['lights'],
+    bbox: MAP_BOUNDS,
+    onBatch: ({ events }) => {
+      setTrafficLights((current) =>
+        upsertBy(current, events.lights, 'light_id').filter((light) => light.is_active)
+      );
+    },
+    onResync: loadSnapshot,
+  });
 
   const getCongestionColor = (level) => {
     switch (level) {
@@ -80,10 +101,22 @@ const TrafficMap = () => {
     <div className="space-y-4">
       <Card>
         <CardHeader>
-          <CardTitle className="flex items-center gap-2">
-            <MapPin className="h-5 w-5" />
-            Traffic Map Overview
+          <CardTitle className="flex items-center justify-between">
+            <span className="flex items-center gap-2">
+              <MapPin className="h-5 w-5" />
+              Traffic Map Overview
+            </span>
+            <Badge variant={sensorsLive && lightsLive ? 'outline' : 'secondary'} className="flex items-center gap-1">
+              <div className={`w-2 h-2 rounded-full ${sensorsLive && lightsLive ? 'bg-green-500 animate-pulse' : 'bg-gray-400'}`}></div>
+              {sensorsLive && lightsLive ? 'Live' : 'Reconnecting'}
+            </Badge>
           </CardTitle>
+          {error && (
+            <p className="text-sm text-red-600 flex items-center gap-1">
+              <AlertTriangle className="h-4 w-4" />
+              Could not load traffic data: {error}
+            </p>
+          )}
         </CardHeader>
         <CardContent>
           {/* Simplified map representation */}
@@ -100,7 +133,7 @@ const TrafficMap = () => {
             {/* Traffic sensors */}
             {trafficData.map((sensor) => (
               <div
-                key={sensor.id}
+                key={sensor.sensor_id}
                 className="absolute transform -translate-x-1/2 -translate-y-1/2 cursor-pointer"
                 style={{
                   left: `${((sensor.location_lng + 74.1) / 0.4) * 100}%`,
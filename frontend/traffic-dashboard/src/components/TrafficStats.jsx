@@ -1,59 +1,117 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useMemo } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, LineChart, Line, PieChart, Pie, Cell } from 'recharts';
 import { TrendingUp, TrendingDown, Car, Clock, AlertTriangle, Activity } from 'lucide-react';
+import { INGESTION_API, CONTROL_API, fetchJson, upsertBy, useLiveFeed } from '@/lib/liveFeed';
+
+const RECENT_ACTIONS = 5;
 
 const TrafficStats = () => {
-  const [stats, setStats] = useState({
-    totalVehicles: 0,
-    averageSpeed: 0,
-    activeIncidents: 0,
-    congestionAreas: 0
-  });
+  const [readings, setReadings] = useState([]);
+  const [hourly, setHourly] = useState({});
+  const [incidents, setIncidents] = useState([]);
+  const [recentActions, setRecentActions] = useState([]);
 
-  const [chartData, setChartData] = useState([]);
-  const [congestionData, setCongestionData] = useState([]);
-  const [hourlyData, setHourlyData] = useState([]);
+  // Running vehicle and speed sums per hour of day, fed by snapshot and stream
+  const addToHourly = (current, newReadings) => {
+    const next = { ...current };
+    newReadings.forEach((reading) => {
+      const hour = `${reading.timestamp.slice(11, 13)}:00`;
+      const bucket = next[hour] || { vehicles: 0, speed: 0, count: 0 };
+      next[hour] = {
+        vehicles: bucket.vehicles + reading.vehicle_count,
+        speed: bucket.speed + reading.average_speed,
+        count: bucket.count + 1,
+      };
+    });
+    return next;
+  };
+
+  const loadSnapshot = useCallback(async () => {
+    try {
+      const [recent, incidentList, actions] = await Promise.all([
+        fetchJson(`${INGESTION_API}/traffic-data?limit=1000`),
+        fetchJson(`${INGESTION_API}/incidents`),
+        fetchJson(`${CONTROL_API}/actions?limit=${RECENT_ACTIONS}`),
+      ]);
+      setReadings(upsertBy([], [...recent.data].reverse(), 'sensor_id'));
+      setHourly(addToHourly({}, recent.data));
+      setIncidents(incidentList.incidents);
+      setRecentActions(actions.actions);
+    } catch (e) {
+      console.error('Failed to load traffic statistics', e);
+    }
+  }, []);
 
   useEffect(() => {
-    // Mock data for demonstration
-    const mockStats = {
-      totalVehicles: 234,
-      averageSpeed: 42.5,
-      activeIncidents: 3,
-      congestionAreas: 2
+    loadSnapshot();
+  }, [loadSnapshot]);
+
+  useLiveFeed(INGESTION_API, {
+    topics: ['readings', 'incidents'],
+    batchMs: 1000,
+    onBatch: ({ events }) => {
+      if (events.readings) {
+        setReadings((current) => upsertBy(current, events.readings, 'sensor_id'));
+        setHourly((current) => addToHourly(current, events.readings));
+      }
+      setIncidents((current) =>
+        upsertBy(current, events.incidents, 'id').filter((incident) => incident.status === 'ACTIVE')
+      );
+    },
+    onResync: loadSnapshot,
+  });
+
+  useLiveFeed(CONTROL_API, {
+    topics: ['actions'],
+    batchMs: 1000,
+    onBatch: ({ events }) => {
+      if (events.actions) {
+        setRecentActions((current) => [...[...events.actions].reverse(), ...current].slice(0, RECENT_ACTIONS));
+      }
+    },
+  });
+
+  const stats = useMemo(() => {
+    const totalVehicles = readings.reduce((sum, reading) => sum + reading.vehicle_count, 0);
+    const speedSum = readings.reduce((sum, reading) => sum + reading.average_speed, 0);
+    return {
+      totalVehicles,
+      averageSpeed: readings.length ? Number((speedSum / readings.length).toFixed(1)) : 0,
+      activeIncidents: incidents.length,
+      congestionAreas: readings.filter((reading) => reading.congestion_level === 'HIGH').length
     };
+  }, [readings, incidents]);
 
-    const mockChartData = [
-      { name: 'SENSOR_001', vehicles: 45, speed: 35 },
-      { name: 'SENSOR_002', vehicles: 78, speed: 22 },
-      { name: 'SENSOR_003', vehicles: 32, speed: 55 },
-      { name: 'SENSOR_004', vehicles: 56, speed: 28 },
-      { name: 'SENSOR_005', vehicles: 23, speed: 62 },
-    ];
-
-    const mockCongestionData = [
-      { name: 'Low', value: 3, color: '#10b981' },
-      { name: 'Medium', value: 1, color: '#f59e0b' },
-      { name: 'High', value: 2, color: '#ef4444' },
-    ];
-
-    const mockHourlyData = [
-      { hour: '00:00', vehicles: 15, speed: 65 },
-      { hour: '06:00', vehicles: 45, speed: 45 },
-      { hour: '08:00', vehicles: 85, speed: 25 },
-      { hour: '12:00', vehicles: 65, speed: 35 },
-      { hour: '17:00', vehicles: 95, speed: 20 },
-      { hour: '20:00', vehicles: 55, speed: 40 },
-      { hour: '23:00', vehicles: 25, speed: 60 },
-    ];
-
-    setStats(mockStats);
-    setChartData(mockChartData);
-    setCongestionData(mockCongestionData);
-    setHourlyData(mockHourlyData);
-  }, []);
+  const chartData = useMemo(() => (
+    [...readings]
+      .sort((a, b) => b.vehicle_count - a.vehicle_count)
+      .slice(0, 10)
+      .map((reading) => ({ name: reading.sensor_id, vehicles: reading.vehicle_count, speed: reading.average_speed }))
+  ), [readings]);
+
+  const congestionData = useMemo(() => (
+    [
+      { name: 'Low', level: 'LOW', color: '#10b981' },
+      { name: 'Medium', level: 'MEDIUM', color: '#f59e0b' },
+      { name: 'High', level: 'HIGH', color: '#ef4444' },
+    ].map(({ name, level, color }) => ({
+      name,
+      color,
+      value: readings.filter((reading) => reading.congestion_level === level).length
+    }))
+  ), [readings]);
+
+  const hourlyData = useMemo(() => (
+    Object.keys(hourly).sort().map((hour) => ({
+      hour,
+      vehicles: Math.round(hourly[hour].vehicles / hourly[hour].count),
+      speed: Math.round(hourly[hour].speed / hourly[hour].count)
+    }))
+  ), [hourly]);
+
+  const highCongestion = readings.filter((reading) => reading.congestion_level === 'HIGH').slice(0, 3);
 
   const StatCard = ({ title, value, icon: Icon, trend, trendValue, unit = '' }) => (
     <Card>
@@ -83,16 +141,12 @@ const TrafficStats = () => {
           title="Total Vehicles"
           value={stats.totalVehicles}
           icon={Car}
-          trend="up"
-          trendValue={12}
         />
         <StatCard
           title="Average Speed"
           value={stats.averageSpeed}
           unit=" mph"
           icon={Activity}
-          trend="down"
-          trendValue={5}
         />
         <StatCard
           title="Active Incidents"
@@ -103,8 +157,6 @@ const TrafficStats = () => {
           title="Congestion Areas"
           value={stats.congestionAreas}
           icon={Clock}
-          trend="down"
-          trendValue={25}
         />
       </div>
 
@@ -184,38 +236,35 @@ const TrafficStats = () => {
         </CardHeader>
         <CardContent>
           <div className="space-y-4">
-            <div className="flex items-center justify-between p-3 bg-red-50 rounded-lg">
-              <div className="flex items-center gap-3">
-                <AlertTriangle className="h-5 w-5 text-red-500" />
-                <div>
-                  <p className="font-medium">High congestion detected</p>
-                  <p className="text-sm text-muted-foreground">SENSOR_002 - Central Park South</p>
+            {highCongestion.map((reading) => (
+              <div key={`reading-${reading.sensor_id}`} className="flex items-center justify-between p-3 bg-red-50 rounded-lg">
+                <div className="flex items-center gap-3">
+                  <AlertTriangle className="h-5 w-5 text-red-500" />
+                  <div>
+                    <p className="font-medium">High congestion detected</p>
+                    <p className="text-sm text-muted-foreground">{reading.sensor_id} - {reading.vehicle_count} vehicles at {reading.average_speed.toFixed(0)} mph</p>
+                  </div>
                 </div>
+                <Badge variant="destructive">HIGH</Badge>
               </div>
-              <Badge variant="destructive">HIGH</Badge>
-            </div>
-            
-            <div className="flex items-center justify-between p-3 bg-yellow-50 rounded-lg">
-              <div className="flex items-center gap-3">
-                <Clock className="h-5 w-5 text-yellow-500" />
-                <div>
-                  <p className="font-medium">Traffic light timing adjusted</p>
-                  <p className="text-sm text-muted-foreground">TL_001 - Times Square</p>
-                </div>
-              </div>
-              <Badge variant="default">MEDIUM</Badge>
-            </div>
-            
-            <div className="flex items-center justify-between p-3 bg-green-50 rounded-lg">
-              <div className="flex items-center gap-3">
-                <TrendingUp className="h-5 w-5 text-green-500" />
-                <div>
-                  <p className="font-medium">Traffic flow improved</p>
-                  <p className="text-sm text-muted-foreground">SENSOR_005 - Brooklyn Bridge</p>
+            ))}
+
+            {recentActions.map((action) => (
+              <div key={`action-${action.id}`} className="flex items-center justify-between p-3 bg-yellow-50 rounded-lg">
+                <div className="flex items-center gap-3">
+                  <Clock className="h-5 w-5 text-yellow-500" />
+                  <div>
+                    <p className="font-medium">{action.action_type.replace(/_/g, ' ').toLowerCase()}</p>
+                    <p className="text-sm text-muted-foreground">{action.target_id} - {new Date(`${action.created_at}Z`).toLocaleTimeString()}</p>
+                  </div>
                 </div>
+                <Badge variant="default">{action.created_by}</Badge>
               </div>
-              <Badge variant="secondary">LOW</Badge>
-            </div>
+            ))}
+
+            {highCongestion.length === 0 && recentActions.length === 0 && (
+              <p className="text-sm text-muted-foreground">No recent activity</p>
+            )}
           </div>
         </CardContent>
       </Card>
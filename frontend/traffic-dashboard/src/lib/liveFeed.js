@@ -0,0 +1,64 @@
+import { useEffect, useRef, useState } from 'react';
+
+export const INGESTION_API = import.meta.env.VITE_INGESTION_API || 'http://localhost:5000/api';
+export const CONTROL_API = import.meta.env.VITE_CONTROL_API || 'http://localhost:5003/api';
+
+// Area drawn by TrafficMap; also used as the stream bounding box
+export const MAP_BOUNDS = { min_lat: 40.6, max_lat: 40.8, min_lng: -74.1, max_lng: -73.7 };
+
+export async function fetchJson(url, options) {
+  const response = await fetch(url, options);
+  if (!response.ok) {
+    throw new Error(`${response.status} ${response.statusText}`);
+  }
+  return response.json();
+}
+
+// Merge streamed items into a list, replacing items with the same key
+export function upsertBy(items, updates, key) {
+  if (!updates || updates.length === 0) return items;
+  const merged = new Map(items.map((item) => [item[key], item]));
+  updates.forEach((update) => merged.set(update[key], update));
+  return Array.from(merged.values());
+}
+
+/*
+ * Subscribe to a service's /stream Server-Sent Events feed.
+ *
+ * onBatch receives { events: { topic: [...] }, dropped } once per server
+ * batch. When dropped > 0 the client missed updates and should refetch its
+ * snapshot; onResync is called for that and after every reconnect.
+ */
+export function useLiveFeed(baseUrl, { topics, bbox, batchMs = 250, onBatch, onResync }) {
+  const [connected, setConnected] = useState(false);
+  const handlers = useRef({ onBatch, onResync });
+  handlers.current = { onBatch, onResync };
+
+  const params = new URLSearchParams({ batch_ms: String(batchMs) });
+  if (topics) params.set('topics', topics.join(','));
+  if (bbox) Object.entries(bbox).forEach(([name, value]) => params.set(name, String(value)));
+  const url = `${baseUrl}/stream?${params}`;
+
+  useEffect(() => {
+    const source = new EventSource(url);
+    let opened = false;
+
+    source.addEventListener('hello', () => {
+      setConnected(true);
+      // The first hello follows the caller's own snapshot fetch
+      if (opened) handlers.current.onResync?.();
+      opened = true;
+    });
+    source.addEventListener('batch', (message) => {
+      const batch = JSON.parse(message.data);
+      handlers.current.onBatch?.(batch);
+      if (batch.dropped > 0) handlers.current.onResync?.();
+    });
+    // EventSource reconnects by itself using the server's retry interval
+    source.onerror = () => setConnected(false);
+
+    return () => source.close();
+  }, [url]);
+
+  return connected;
+}
@@ -0,0 +1,134 @@
+"""Compact columnar binary wire format for bulk reads between services.
+
+Layout (all integers little-endian):
+
+    b'TCOL' | version u8 | 3 pad bytes | header length u32 | header JSON | column buffers
+
+The header lists ``rows`` and, per column, its name, NumPy dtype, byte
+offset and length; buffers start 8-byte aligned so decoding is a
+zero-copy ``np.frombuffer`` per column. String columns are dictionary
+encoded: the buffer holds integer codes and the header carries the
+distinct values. Timestamps travel as int64 epoch microseconds.
+
+Servers pick the format by content negotiation (``Accept:
+application/vnd.traffic.columnar``) and fall back to JSON.
+"""
+import json
+import struct
+
+import numpy as np
+
+MEDIA_TYPE = 'application/vnd.traffic.columnar'
+MAGIC = b'TCOL'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sB3xI')
+ALIGNMENT = 8
+
+
+def wants_columnar(request):
+    """True when an HTTP request prefers the columnar format over JSON"""
+    if request.args.get('format') == 'columnar':
+        return True
+    # JSON is listed first so wildcard Accept headers keep getting JSON
+    return request.accept_mimetypes.best_match(['application/json', MEDIA_TYPE]) == MEDIA_TYPE
+
+
+def dictionary_encode(values):
+    """(codes, distinct values) for a sequence of strings"""
+    values = np.asarray(values, dtype=object)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.uint8), []
+    distinct, codes = np.unique(values.astype(str), return_inverse=True)
+    dtype = np.uint8 if len(distinct) <= 0xFF else np.uint16 if len(distinct) <= 0xFFFF else np.uint32
+    return codes.astype(dtype), distinct.tolist()
+
+
+def timestamps_to_micros(values):
+    """int64 epoch microseconds from datetimes or ISO / SQLite timestamp strings"""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.array(values, dtype='datetime64[us]').astype(np.int64)
+
+
+def encode(columns, dictionaries=None, meta=None):
+    """Serialize equal-length NumPy arrays (name -> array) to bytes.
+
+    ``dictionaries`` maps a column name to the distinct values its integer
+    codes index; ``meta`` is any extra JSON-serializable header data.
+    """
+    rows = len(next(iter(columns.values()))) if columns else 0
+    specs = []
+    buffers = []
+    offset = 0
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+        if len(values) != rows:
+            raise ValueError(f'Column {name} has {len(values)} rows, expected {rows}')
+        data = values.astype(values.dtype.newbyteorder('<'), copy=False).tobytes()
+        specs.append({'name': name, 'dtype': values.dtype.newbyteorder('<').str, 'offset': offset, 'nbytes': len(data)})
+        padding = -len(data) % ALIGNMENT
+        buffers.append(data + b'\0' * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({
+        'rows': rows,
+        'columns': specs,
+        'dictionaries': dictionaries or {},
+        'meta': meta or {}
+    }, separators=(',', ':')).encode()
+    header += b' ' * (-(PREAMBLE.size + len(header)) % ALIGNMENT)
+    return b''.join([PREAMBLE.pack(MAGIC, VERSION, len(header)), header] + buffers)
+
+
+class ColumnarFrame:
+    """Decoded columns: NumPy arrays viewing the payload, plus dictionaries"""
+
+    def __init__(self, rows, columns, dictionaries, meta):
+        self.rows = rows
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.meta = meta
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def strings(self, name):
+        """Dictionary-encoded column as an array of strings (one take, no per-row loop)"""
+        return np.asarray(self.dictionaries[name], dtype=str)[self.columns[name]] if self.rows else np.zeros(0, dtype=str)
+
+    def datetimes(self, name):
+        """Epoch-microsecond column as datetime64[us]"""
+        return self.columns[name].astype('datetime64[us]')
+
+
+def decode(payload):
+    """Parse an encode() payload without copying the column data"""
+    payload = memoryview(payload)
+    magic, version, header_length = PREAMBLE.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError('Not a columnar payload')
+    if version != VERSION:
+        raise ValueError(f'Unsupported columnar version {version}')
+    header = json.loads(bytes(payload[PREAMBLE.size:PREAMBLE.size + header_length]))
+    start = PREAMBLE.size + header_length
+    columns = {}
+    for spec in header['columns']:
+        dtype = np.dtype(spec['dtype'])
+        columns[spec['name']] = np.frombuffer(payload, dtype=dtype, count=spec['nbytes'] // dtype.itemsize,
+                                              offset=start + spec['offset'])
+    return ColumnarFrame(header['rows'], columns, header['dictionaries'], header['meta'])
+
+
+def fetch(session, url, params=None, timeout=None):
+    """GET an endpoint in the columnar format and decode it"""
+    response = session.get(url, params=params, headers={'Accept': MEDIA_TYPE}, timeout=timeout)
+    response.raise_for_status()
+    if response.headers.get('Content-Type', '').split(';')[0] != MEDIA_TYPE:
+        raise ValueError(f'Expected {MEDIA_TYPE}, got {response.headers.get("Content-Type")}')
+    return decode(response.content)
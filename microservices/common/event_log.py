@@ -0,0 +1,530 @@
+"""Durable append-only event log shared by the traffic services.
+
+data-ingestion appends every accepted reading and incident; analysis,
+prediction and control read the log to keep their in-memory state warm
+instead of re-pulling recent rows over HTTP.
+
+FileEventLog keeps one directory per topic with newline-delimited JSON
+segment files named after the offset of their first record
+(``00000000000000000000.log``). Records are ``{"offset", "ts", "data"}``.
+Readers in other processes follow the files directly; a trailing line
+without a newline is an append in progress and is not read yet. Each
+consumer group commits its next offset to ``<topic>/offsets/<group>``
+with an atomic rename. Sealed segments older than the retention period
+are deleted; a consumer whose offset fell off the log resumes at the
+earliest retained record.
+
+There must be a single writer process per directory. MemoryEventLog has
+the same interface and stands in for the files in tests.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_EVENT_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'event_log')
+DEFAULT_SEGMENT_RECORDS = 100000
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+DEFAULT_POLL_SECONDS = 0.5
+DEFAULT_POLL_RECORDS = 5000
+SEGMENT_SUFFIX = '.log'
+READ_CHUNK_BYTES = 1 << 20
+
+
+def event_log_dir():
+    """Log directory shared by all services on a host, overridable with TRAFFIC_EVENT_LOG_DIR"""
+    return os.environ.get('TRAFFIC_EVENT_LOG_DIR', DEFAULT_EVENT_LOG_DIR)
+
+
+def _timestamp(moment):
+    if moment is None:
+        return None
+    if isinstance(moment, datetime):
+        return moment.timestamp() if moment.tzinfo else (moment - datetime(1970, 1, 1)).total_seconds()
+    return float(moment)
+
+
+class FileEventLog:
+    """Segmented newline-delimited JSON log with per-group committed offsets"""
+
+    def __init__(self, directory=None, segment_records=DEFAULT_SEGMENT_RECORDS,
+                 retention_seconds=DEFAULT_RETENTION_SECONDS, fsync=False):
+        self.directory = directory or event_log_dir()
+        self.segment_records = segment_records
+        self.retention_seconds = retention_seconds
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # Writer state per topic: (base offset of the open segment, next offset)
+        self._writers = {}
+        self.appended = 0
+
+    # Layout
+
+    def _topic_dir(self, topic):
+        return os.path.join(self.directory, topic)
+
+    def _segment_path(self, topic, base):
+        return os.path.join(self._topic_dir(topic), f"{base:020d}{SEGMENT_SUFFIX}")
+
+    def segments(self, topic):
+        """Base offsets of the topic's segments, oldest first"""
+        try:
+            names = os.listdir(self._topic_dir(topic))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+    @staticmethod
+    def _count_complete_lines(path):
+        """(complete records, byte length of the complete part) of a segment"""
+        lines = 0
+        complete_bytes = 0
+        position = 0
+        with open(path, 'rb') as handle:
+            while True:
+                chunk = handle.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                newlines = chunk.count(b'\n')
+                if newlines:
+                    lines += newlines
+                    complete_bytes = position + chunk.rindex(b'\n') + 1
+                position += len(chunk)
+        return lines, complete_bytes
+
+    # Writes
+
+    def _writer(self, topic):
+        """Open segment of a topic, recovering after a restart or crash"""
+        writer = self._writers.get(topic)
+        if writer is None:
+            os.makedirs(os.path.join(self._topic_dir(topic), 'offsets'), exist_ok=True)
+            bases = self.segments(topic)
+            if bases:
+                base = bases[-1]
+                path = self._segment_path(topic, base)
+                lines, complete_bytes = self._count_complete_lines(path)
+                # Drop a record half-written by a crashed writer
+                if complete_bytes != os.path.getsize(path):
+                    with open(path, 'r+b') as handle:
+                        handle.truncate(complete_bytes)
+                writer = [base, base + lines]
+            else:
+                writer = [0, 0]
+            self._writers[topic] = writer
+        return writer
+
+    def append(self, topic, events, timestamp=None):
+        """Append event dicts to a topic; returns the offset of the first one"""
+        if not events:
+            return None
+        ts = _timestamp(timestamp) or time.time()
+        with self._lock:
+            writer = self._writer(topic)
+            first = writer[1]
+            pending = list(events)
+            while pending:
+                base, next_offset = writer
+                if next_offset - base >= self.segment_records:
+                    writer[0] = base = next_offset
+                    self._prune(topic)
+                batch = pending[:self.segment_records - (next_offset - base)]
+                pending = pending[len(batch):]
+                lines = []
+                for data in batch:
+                    lines.append(json.dumps({'offset': next_offset, 'ts': ts, 'data': data}, separators=(',', ':')))
+                    next_offset += 1
+                # One write per batch keeps concurrent readers from seeing
+                # interleaved partial records of different batches
+                with open(self._segment_path(topic, base), 'a', encoding='utf-8') as handle:
+                    handle.write('\n'.join(lines) + '\n')
+                    if self.fsync:
+                        handle.flush()
+                        os.fsync(handle.fileno())
+                writer[1] = next_offset
+            self.appended += len(events)
+            return first
+
+    def _prune(self, topic):
+        """Delete sealed segments whose newest record is past retention"""
+        if not self.retention_seconds:
+            return
+        cutoff = time.time() - self.retention_seconds
+        bases = self.segments(topic)
+        for base in bases[:-1]:
+            path = self._segment_path(topic, base)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+            else:
+                break
+
+    # Reads
+
+    def end_offset(self, topic):
+        """Offset the next appended record will get"""
+        with self._lock:
+            if topic in self._writers:
+                return self._writers[topic][1]
+        bases = self.segments(topic)
+        if not bases:
+            return 0
+        lines, _ = self._count_complete_lines(self._segment_path(topic, bases[-1]))
+        return bases[-1] + lines
+
+    def start_offset(self, topic):
+        bases = self.segments(topic)
+        return bases[0] if bases else 0
+
+    def offset_for_time(self, topic, moment):
+        """First offset whose append time is at or after ``moment``"""
+        target = _timestamp(moment)
+        bases = self.segments(topic)
+        # Segments are scanned newest first until one starts before the target
+        for base in reversed(bases):
+            first = self._first_record(topic, base)
+            if first is None or first['ts'] < target:
+                reader = SegmentReader(self, topic, base)
+                while True:
+                    records = reader.read(DEFAULT_POLL_RECORDS, raw=True)
+                    if not records:
+                        return reader.offset
+                    for record in records:
+                        if record['ts'] >= target:
+                            return record['offset']
+        return bases[0] if bases else 0
+
+    def _first_record(self, topic, base):
+        with open(self._segment_path(topic, base), 'rb') as handle:
+            line = handle.readline()
+        return json.loads(line) if line.endswith(b'\n') else None
+
+    def reader(self, topic, offset):
+        return SegmentReader(self, topic, offset)
+
+    # Consumer offsets
+
+    def _offset_path(self, topic, group):
+        return os.path.join(self._topic_dir(topic), 'offsets', group)
+
+    def committed(self, topic, group):
+        try:
+            with open(self._offset_path(topic, group)) as handle:
+                return int(handle.read().strip() or 0)
+        except FileNotFoundError:
+            return None
+
+    def commit(self, topic, group, offset):
+        path = self._offset_path(topic, group)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as handle:
+            handle.write(str(offset))
+        os.replace(tmp_path, path)
+
+    def consumer(self, topic, group, start='committed'):
+        return Consumer(self, topic, group, start)
+
+    def stats(self):
+        topics = {}
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            names = []
+        for topic in names:
+            if not os.path.isdir(self._topic_dir(topic)):
+                continue
+            offsets_dir = os.path.join(self._topic_dir(topic), 'offsets')
+            groups = sorted(name for name in os.listdir(offsets_dir) if not name.endswith('.tmp')) \
+                if os.path.isdir(offsets_dir) else []
+            end = self.end_offset(topic)
+            topics[topic] = {
+                'segments': len(self.segments(topic)),
+                'start_offset': self.start_offset(topic),
+                'end_offset': end,
+                'consumers': {group: {'committed': self.committed(topic, group),
+                                      'lag': end - (self.committed(topic, group) or 0)} for group in groups}
+            }
+        return {'directory': self.directory, 'appended': self.appended, 'topics': topics}
+
+
+class SegmentReader:
+    """Sequential reader over a topic's segments starting at an offset"""
+
+    def __init__(self, log, topic, offset):
+        self.log = log
+        self.topic = topic
+        self.skipped = 0
+        self._base = None
+        self._position = 0
+        self.offset = offset
+        self._seek(offset)
+
+    def _seek(self, offset):
+        bases = self.log.segments(self.topic)
+        if not bases:
+            self._base, self._position, self.offset = None, 0, offset
+            return
+        if offset < bases[0]:
+            # Retention removed the records; resume at the earliest one left
+            self.skipped += bases[0] - offset
+            offset = bases[0]
+        base = bases[bisect.bisect_right(bases, offset) - 1]
+        # Count newlines to find the byte position of the offset's record
+        remaining = offset - base
+        position = 0
+        with open(self.log._segment_path(self.topic, base), 'rb') as handle:
+            while remaining:
+                chunk = handle.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                newlines = chunk.count(b'\n')
+                if newlines < remaining:
+                    remaining -= newlines
+                    if newlines:
+                        position += chunk.rindex(b'\n') + 1
+                    handle.seek(position)
+                    continue
+                end = -1
+                for _ in range(remaining):
+                    end = chunk.index(b'\n', end + 1)
+                position += end + 1
+                remaining = 0
+        self._base = base
+        self._position = position
+        self.offset = offset - remaining
+
+    def read(self, max_records, raw=False):
+        """Up to ``max_records`` complete records as (offset, data), or raw dicts"""
+        records = []
+        while len(records) < max_records:
+            if self._base is None:
+                self._seek(self.offset)
+                if self._base is None:
+                    break
+            path = self.log._segment_path(self.topic, self._base)
+            try:
+                with open(path, 'rb') as handle:
+                    handle.seek(self._position)
+                    while len(records) < max_records:
+                        line = handle.readline()
+                        if not line.endswith(b'\n'):
+                            break
+                        self._position += len(line)
+                        record = json.loads(line)
+                        self.offset = record['offset'] + 1
+                        records.append(record if raw else (record['offset'], record['data']))
+            except FileNotFoundError:
+                # Segment pruned underneath the reader
+                self._seek(self.offset)
+                continue
+            if len(records) >= max_records:
+                break
+            # At the end of this segment; move on only if a newer one exists
+            bases = self.log.segments(self.topic)
+            later = [base for base in bases if base > self._base]
+            if not later or self.offset < later[0]:
+                break
+            self._base, self._position = later[0], 0
+        return records
+
+
+class MemoryEventLog:
+    """In-process stand-in for FileEventLog with the same interface"""
+
+    def __init__(self):
+        self._topics = {}
+        self._offsets = {}
+        self._lock = threading.Lock()
+        self.appended = 0
+
+    def append(self, topic, events, timestamp=None):
+        if not events:
+            return None
+        ts = _timestamp(timestamp) or time.time()
+        with self._lock:
+            records = self._topics.setdefault(topic, [])
+            first = len(records)
+            records.extend({'offset': first + i, 'ts': ts, 'data': data} for i, data in enumerate(events))
+            self.appended += len(events)
+            return first
+
+    def end_offset(self, topic):
+        with self._lock:
+            return len(self._topics.get(topic, ()))
+
+    def start_offset(self, topic):
+        return 0
+
+    def offset_for_time(self, topic, moment):
+        target = _timestamp(moment)
+        with self._lock:
+            records = self._topics.get(topic, [])
+            for record in records:
+                if record['ts'] >= target:
+                    return record['offset']
+            return len(records)
+
+    def reader(self, topic, offset):
+        return MemoryReader(self, topic, offset)
+
+    def committed(self, topic, group):
+        return self._offsets.get((topic, group))
+
+    def commit(self, topic, group, offset):
+        self._offsets[(topic, group)] = offset
+
+    def consumer(self, topic, group, start='committed'):
+        return Consumer(self, topic, group, start)
+
+    def stats(self):
+        with self._lock:
+            topics = {topic: {
+                'segments': 1,
+                'start_offset': 0,
+                'end_offset': len(records),
+                'consumers': {group: {'committed': offset, 'lag': len(records) - offset}
+                              for (offset_topic, group), offset in self._offsets.items() if offset_topic == topic}
+            } for topic, records in self._topics.items()}
+        return {'directory': None, 'appended': self.appended, 'topics': topics}
+
+
+class MemoryReader:
+    def __init__(self, log, topic, offset):
+        self.log = log
+        self.topic = topic
+        self.offset = offset
+        self.skipped = 0
+
+    def read(self, max_records, raw=False):
+        with self.log._lock:
+            records = self.log._topics.get(self.topic, [])[self.offset:self.offset + max_records]
+        self.offset += len(records)
+        return records if raw else [(record['offset'], record['data']) for record in records]
+
+
+class Consumer:
+    """A consumer group's position in one topic.
+
+    ``start`` picks where a new consumer begins: 'committed' (falling back
+    to 'earliest' for a new group), 'earliest', 'latest', or a datetime /
+    epoch seconds to replay everything appended since then.
+    """
+
+    def __init__(self, log, topic, group, start='committed'):
+        self.log = log
+        self.topic = topic
+        self.group = group
+        if start == 'committed':
+            offset = log.committed(topic, group)
+            offset = log.start_offset(topic) if offset is None else offset
+        elif start == 'earliest':
+            offset = log.start_offset(topic)
+        elif start == 'latest':
+            offset = log.end_offset(topic)
+        else:
+            offset = log.offset_for_time(topic, start)
+        self._reader = log.reader(topic, offset)
+
+    @property
+    def position(self):
+        return self._reader.offset
+
+    def poll(self, max_records=DEFAULT_POLL_RECORDS):
+        """Next complete records as (offset, data) pairs"""
+        return self._reader.read(max_records)
+
+    def commit(self):
+        self.log.commit(self.topic, self.group, self.position)
+
+    def lag(self):
+        return max(self.log.end_offset(self.topic) - self.position, 0)
+
+
+class EventSubscriber:
+    """Background thread feeding topics of an event log to handlers.
+
+    ``handlers`` maps topic to a callable taking a list of event dicts. A
+    batch's offset is committed only after its handler returned, so a
+    crashed handler sees the batch again after a restart. Handlers whose
+    state is only durable once saved pass ``auto_commit=False`` and call
+    ``commit(save)`` instead, so the offsets never run ahead of the state.
+    """
+
+    def __init__(self, log, group, handlers, start='committed', poll_interval=DEFAULT_POLL_SECONDS,
+                 max_records=DEFAULT_POLL_RECORDS, auto_commit=True):
+        self.log = log
+        self.group = group
+        self.handlers = dict(handlers)
+        self.auto_commit = auto_commit
+        self.poll_interval = poll_interval
+        self.max_records = max_records
+        self.consumers = {topic: log.consumer(topic, group, start) for topic in self.handlers}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.delivered = {topic: 0 for topic in self.handlers}
+        self.errors = 0
+        self.last_error = None
+
+    def poll_once(self):
+        """Deliver everything currently in the log; returns the number of events"""
+        delivered = 0
+        with self._lock:
+            for topic, consumer in self.consumers.items():
+                while True:
+                    records = consumer.poll(self.max_records)
+                    if not records:
+                        break
+                    self.handlers[topic]([data for _, data in records])
+                    if self.auto_commit:
+                        consumer.commit()
+                    self.delivered[topic] += len(records)
+                    delivered += len(records)
+                    if len(records) < self.max_records:
+                        break
+        return delivered
+
+    def commit(self, before=None):
+        """Commit every topic's position, calling ``before()`` first with delivery paused"""
+        with self._lock:
+            if before is not None:
+                before()
+            for consumer in self.consumers.values():
+                consumer.commit()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'event-subscriber-{self.group}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+            self._stop.wait(self.poll_interval)
+
+    def stats(self):
+        return {
+            'group': self.group,
+            'topics': {topic: {
+                'position': consumer.position,
+                'lag': consumer.lag(),
+                'delivered': self.delivered[topic],
+                'skipped': consumer._reader.skipped
+            } for topic, consumer in self.consumers.items()},
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'running': self._thread is not None and self._thread.is_alive()
+        }
@@ -0,0 +1,137 @@
+"""Conditional GET and response compression for the read endpoints.
+
+Handlers call ``not_modified(*watermark)`` before doing any work. The
+watermark is something cheap that changes whenever the response would:
+max id and row count, an in-memory version counter. It is hashed with
+the request URL, the Accept header and a per-process boot id into a
+strong ETag. When If-None-Match already holds that ETag the handler
+returns the 304 it gets back, skipping the query and serialization. The
+boot id covers in-memory counters restarting from zero. With several
+workers it only costs cache hits, never correctness.
+
+``finalize_response`` is registered as an ``after_request`` hook on each
+blueprint. It sets the ETag on 200 responses and compresses bodies in
+COMPRESSIBLE_TYPES with gzip, or brotli when the ``brotli`` package is
+installed and the client prefers it. Bodies under MIN_COMPRESS_BYTES are
+sent as they are. Streamed bodies are compressed chunk by chunk after
+peeking far enough to know they clear the threshold. Each content
+coding gets its own ETag suffix, since strong ETags name exact bytes.
+"""
+import hashlib
+import itertools
+import json
+import os
+import zlib
+
+from flask import Response, g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+BOOT_ID = os.urandom(8).hex()
+
+
+def make_etag(*watermark):
+    """Strong ETag (unquoted) for the current request URL and Accept header at ``watermark``"""
+    key = json.dumps([BOOT_ID, request.full_path, request.headers.get('Accept'), watermark],
+                     default=str, separators=(',', ':'))
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
+
+
+def not_modified(*watermark):
+    """A 304 response if the client's If-None-Match holds the current ETag, else None.
+
+    The ETag is remembered for finalize_response() either way.
+    """
+    etag = make_etag(*watermark)
+    g.etag = etag
+    for candidate in (etag,) + tuple(f'{etag}-{coding}' for coding in ENCODINGS):
+        if request.if_none_match.contains_weak(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            response.vary.update(('Accept', 'Accept-Encoding'))
+            return response
+    return None
+
+
+def choose_encoding():
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def _compressor(coding):
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits=31 writes the gzip container
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _compressed_stream(chunks, coding):
+    compress, finish = _compressor(coding)
+    for chunk in chunks:
+        data = compress(chunk if isinstance(chunk, bytes) else chunk.encode())
+        if data:
+            yield data
+    yield finish()
+
+
+def _peek(chunks, limit):
+    """(first chunks as bytes, iterator over the rest, whether the limit was reached)"""
+    iterator = iter(chunks)
+    head = []
+    size = 0
+    for chunk in iterator:
+        chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+        head.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            return head, iterator, True
+    return head, iterator, False
+
+
+def compress_response(response):
+    """Compress ``response`` in place when it is large and compressible"""
+    if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = choose_encoding()
+    if coding is None:
+        return response
+
+    if response.is_streamed:
+        head, rest, large = _peek(response.response, MIN_COMPRESS_BYTES)
+        if not large:
+            response.set_data(b''.join(head))
+            return response
+        response.response = _compressed_stream(itertools.chain(head, rest), coding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+        compress, finish = _compressor(coding)
+        response.set_data(compress(data) + finish())
+    response.headers['Content-Encoding'] = coding
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{coding}')
+    return response
+
+
+def finalize_response(response):
+    """after_request hook: ETag from not_modified(), then compression"""
+    etag = g.pop('etag', None)
+    if etag and response.status_code == 200:
+        response.set_etag(etag)
+        response.vary.add('Accept')
+    return compress_response(response)
@@ -0,0 +1,102 @@
+"""Chunked JSON list responses written straight from column tuples.
+
+The list endpoints used to load ORM instances, call ``to_dict()`` per row
+and hand everything to ``jsonify``, which walks the result again to sort
+keys. Here rows are selected as Core tuples, with columns ordered like
+jsonify's sorted keys and DateTimes formatted by SQL, so every chunk of
+rows becomes one C-level ``json.dumps`` call.
+
+The body is byte-for-byte what ``jsonify`` writes: keys sorted at every
+level, ASCII escapes and a trailing newline, with compact separators or, when
+the provider pretty-prints (``compact`` False, or None in debug mode), two
+space indentation. Only a provider configured otherwise (a custom class,
+unsorted keys, non-ASCII output) makes responses fall back to ``jsonify``.
+"""
+import json
+
+from flask import Response, current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import DateTime, String, func, type_coerce
+
+ROWS_PER_CHUNK = 1000
+
+
+def isoformat_sql(column):
+    """SQL equivalent of ``column.isoformat()`` for SQLite DateTime columns.
+
+    SQLAlchemy stores them as 'YYYY-MM-DD HH:MM:SS.ffffff' text; isoformat()
+    uses a 'T' separator and omits a zero microsecond part.
+    """
+    text = type_coerce(column, String)
+    return func.replace(func.replace(text, ' ', 'T'), '.000000', '')
+
+
+def table_fields(table):
+    """(field names, Core columns) for a table's ``to_dict()``, in sorted key order"""
+    columns = sorted(table.columns, key=lambda column: column.key)
+    return (
+        [column.key for column in columns],
+        [isoformat_sql(column).label(column.key) if isinstance(column.type, DateTime) else column
+         for column in columns]
+    )
+
+
+def _dumps(value, sort_keys=True, indent=None):
+    if indent is None:
+        return json.dumps(value, separators=(',', ':'), sort_keys=sort_keys)
+    return json.dumps(value, indent=indent, sort_keys=sort_keys)
+
+
+def _nest(text, indent):
+    """Shift the continuation lines of an indented JSON text one level right"""
+    return text if indent is None else text.replace('\n', '\n' + ' ' * indent)
+
+
+def _jsonify_layout():
+    """(matches, indent) of what ``jsonify`` writes with the app's JSON provider"""
+    provider = current_app.json
+    if not (type(provider) is DefaultJSONProvider and provider.sort_keys and provider.ensure_ascii):
+        return False, None
+    pretty = provider.compact is False or (provider.compact is None and current_app.debug)
+    return True, 2 if pretty else None
+
+
+def encode_body(list_key, items, fields=None, extra=None, rows_per_chunk=ROWS_PER_CHUNK, indent=None):
+    """Yield ``jsonify(dict(extra, **{list_key: [...]}))`` body chunks.
+
+    ``items`` are tuples ordered like the sorted ``fields``, or dicts when
+    ``fields`` is None (their keys are sorted per chunk). ``indent`` mirrors
+    jsonify's pretty-printed layout; None writes compact separators.
+    """
+    extra = extra or {}
+    newline, pad, colon = ('', '', ':') if indent is None else ('\n', ' ' * indent, ': ')
+    yield '{'
+    for position, key in enumerate(sorted([list_key] + list(extra))):
+        prefix = (',' if position else '') + newline + pad
+        if key != list_key:
+            yield f'{prefix}{_dumps(key)}{colon}{_nest(_dumps(extra[key], indent=indent), indent)}'
+            continue
+        yield f'{prefix}{_dumps(key)}{colon}['
+        for start in range(0, len(items), rows_per_chunk):
+            chunk = items[start:start + rows_per_chunk]
+            if fields is None:
+                text = _dumps(chunk, indent=indent)
+            else:
+                # Keys are already in sorted order, so skip sort_keys
+                text = _dumps([dict(zip(fields, row)) for row in chunk], sort_keys=False, indent=indent)
+            # Strip the chunk's own brackets (and their line breaks when indented)
+            text = text[1:-1] if indent is None else pad + _nest(text[2:-2], indent)
+            yield (',' if start else '') + newline + text
+        yield (newline + pad if len(items) else '') + ']'
+    yield newline + '}\n'
+
+
+def list_response(list_key, items, fields=None, **extra):
+    """A 200 response for a list endpoint, streamed in chunks when it matches jsonify"""
+    matches, indent = _jsonify_layout()
+    if not matches:
+        if fields is not None:
+            items = [dict(zip(fields, row)) for row in items]
+        return jsonify(dict(extra, **{list_key: items})), 200
+    return Response(encode_body(list_key, items, fields, extra, indent=indent),
+                    mimetype=current_app.json.mimetype), 200
@@ -0,0 +1,245 @@
+"""In-process publish/subscribe broker behind the services' Server-Sent Events streams.
+
+Publishers hand over batches of events per topic. Each subscriber keeps
+its own topic set and optional bounding box, and a bounded buffer keyed by
+(topic, key): a newer event for the same key replaces the queued one, so a
+light that changes state five times between sends is delivered once with
+its latest state. When a slow client's buffer is full the oldest entry is
+dropped and counted; the client is told how many it missed and can
+re-fetch a snapshot.
+
+A service's routes module calls ``init_blueprint(blueprint, feed)``,
+which serves the feed at /stream and its subscribers at /stream/stats.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, jsonify, request
+
+DEFAULT_BUFFER_SIZE = 5000
+DEFAULT_BATCH_INTERVAL_SECONDS = 0.25
+HEARTBEAT_SECONDS = 15.0
+MAX_SUBSCRIBERS = 256
+
+
+class FeedFull(Exception):
+    """Raised when the subscriber limit is reached"""
+
+
+def parse_bbox(min_lat=None, min_lng=None, max_lat=None, max_lng=None):
+    """(min_lat, min_lng, max_lat, max_lng) or None when no bound is given"""
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    if all(bound is None for bound in bounds):
+        return None
+    return (
+        -90.0 if min_lat is None else min_lat,
+        -180.0 if min_lng is None else min_lng,
+        90.0 if max_lat is None else max_lat,
+        180.0 if max_lng is None else max_lng
+    )
+
+
+class Subscription:
+    """One client's filters and coalescing buffer"""
+
+    def __init__(self, feed, topics, bbox=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.feed = feed
+        self.topics = frozenset(topics)
+        self.bbox = bbox
+        self.buffer_size = buffer_size
+        self.created_at = time.time()
+        self.closed = False
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._dropped_unreported = 0
+
+    def accepts(self, lat, lng):
+        if self.bbox is None or lat is None or lng is None:
+            return True
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+
+    def offer(self, topic, events):
+        """Queue the events this subscriber wants; returns how many were queued"""
+        queued = 0
+        with self._condition:
+            for key, lat, lng, payload in events:
+                if not self.accepts(lat, lng):
+                    continue
+                entry = (topic, key)
+                if entry in self._pending:
+                    # Keep the newest value but move it behind older entries
+                    del self._pending[entry]
+                    self.coalesced += 1
+                elif len(self._pending) >= self.buffer_size:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                    self._dropped_unreported += 1
+                self._pending[entry] = payload
+                queued += 1
+            if queued:
+                self._condition.notify()
+        return queued
+
+    def next_batch(self, timeout):
+        """Wait up to ``timeout`` seconds, then drain the buffer.
+
+        Returns ({topic: [payload, ...]}, dropped since the last batch).
+        """
+        with self._condition:
+            if not self._pending and not self.closed:
+                self._condition.wait(timeout)
+            pending, self._pending = self._pending, OrderedDict()
+            dropped, self._dropped_unreported = self._dropped_unreported, 0
+        batch = {}
+        for (topic, _), payload in pending.items():
+            batch.setdefault(topic, []).append(payload)
+        self.delivered += len(pending)
+        return batch, dropped
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+        self.feed.unsubscribe(self)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'topics': sorted(self.topics),
+                'bbox': list(self.bbox) if self.bbox else None,
+                'queued': len(self._pending),
+                'delivered': self.delivered,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'connected_seconds': round(time.time() - self.created_at, 1)
+            }
+
+
+class LiveFeed:
+    """Fan-out of published events to filtered, bounded subscriptions"""
+
+    def __init__(self, topics, buffer_size=DEFAULT_BUFFER_SIZE, max_subscribers=MAX_SUBSCRIBERS):
+        self.topics = tuple(topics)
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.published = {topic: 0 for topic in self.topics}
+
+    def subscribe(self, topics=None, bbox=None, buffer_size=None):
+        topics = set(topics or self.topics)
+        unknown = topics - set(self.topics)
+        if unknown:
+            raise ValueError(f"Unknown topics: {', '.join(sorted(unknown))}. Must be any of {', '.join(self.topics)}")
+        subscription = Subscription(self, topics, bbox, min(buffer_size or self.buffer_size, self.buffer_size))
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise FeedFull(f'Live feed is limited to {self.max_subscribers} clients')
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, topic, events):
+        """Hand a batch of (key, lat, lng, payload) events to every interested subscriber.
+
+        Cheap when nobody listens, so publishers can call it unconditionally.
+        """
+        with self._lock:
+            subscribers = [subscription for subscription in self._subscribers if topic in subscription.topics]
+            self.published[topic] += len(events)
+        for subscription in subscribers:
+            subscription.offer(topic, events)
+        return len(subscribers)
+
+    def stream(self, subscription, batch_interval=DEFAULT_BATCH_INTERVAL_SECONDS, heartbeat=HEARTBEAT_SECONDS):
+        """Server-Sent Events for a subscription; unsubscribes when the client goes away.
+
+        Every message is one ``batch`` event carrying all updates gathered
+        since the previous one, so the send rate per client is bounded by
+        ``batch_interval`` however fast events are published.
+        """
+        try:
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'topics': sorted(subscription.topics)})}\n\n"
+            while True:
+                batch, dropped = subscription.next_batch(heartbeat)
+                if subscription.closed:
+                    return
+                if not batch and not dropped:
+                    yield ': keepalive\n\n'
+                    continue
+                message = {'events': batch, 'dropped': dropped, 'timestamp': time.time()}
+                yield f"event: batch\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+                time.sleep(batch_interval)
+        finally:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            published = dict(self.published)
+        return {
+            'topics': list(self.topics),
+            'subscribers': len(subscribers),
+            'max_subscribers': self.max_subscribers,
+            'buffer_size': self.buffer_size,
+            'published': published,
+            'clients': [subscription.stats() for subscription in subscribers]
+        }
+
+
+# Flask
+
+def stream_view(feed, before_subscribe=None):
+    """Server-Sent Events feed filtered by ?topics=, a bounding box, ?batch_ms= and ?buffer_size="""
+    try:
+        topics = [topic for topic in request.args.get('topics', '').split(',') if topic]
+        bbox = parse_bbox(
+            request.args.get('min_lat', type=float), request.args.get('min_lng', type=float),
+            request.args.get('max_lat', type=float), request.args.get('max_lng', type=float)
+        )
+        batch_ms = request.args.get('batch_ms', DEFAULT_BATCH_INTERVAL_SECONDS * 1000, type=float)
+        buffer_size = request.args.get('buffer_size', type=int)
+        if before_subscribe is not None:
+            before_subscribe()
+        subscription = feed.subscribe(topics, bbox, buffer_size)
+
+        return Response(
+            feed.stream(subscription, batch_interval=max(batch_ms, 50) / 1000),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FeedFull as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def stats_view(feed):
+    """Live feed subscribers, their filters and buffer usage"""
+    try:
+        return jsonify(feed.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def init_blueprint(blueprint, feed, before_subscribe=None):
+    """Serve ``feed`` at /stream and /stream/stats; ``before_subscribe()`` runs ahead of each subscription"""
+    blueprint.add_url_rule('/stream', 'stream_updates', lambda: stream_view(feed, before_subscribe))
+    blueprint.add_url_rule('/stream/stats', 'get_stream_stats', lambda: stats_view(feed))
@@ -0,0 +1,331 @@
+"""Prometheus metrics shared by the services, served at /metrics.
+
+Each service's main.py calls ``init_app(app)``, which records for
+every request:
+
+    http_request_duration_seconds   histogram by method, route and status,
+                                    until the last byte of a streamed body
+    http_requests_in_flight         gauge by route
+    http_request_sql_queries        histogram of SQL statements per request
+    http_request_sql_seconds        histogram of SQL time per request
+
+SQL is timed with SQLAlchemy cursor events on every Engine in the
+process, so shard and job engines are covered too. Statements count
+towards the request whose context they run in (a ContextVar, which code
+fanning out to threads can carry over with contextvars.copy_context());
+anything else is counted under ``context="background"`` in
+``sql_queries_total`` and ``sql_query_seconds_total``.
+
+Calls to other services are timed with ``with upstream('data-ingestion'):``
+into ``upstream_request_duration_seconds`` by dependency and outcome.
+
+Buffers, queues and caches are exposed by registering their existing
+``stats()`` method with ``register_stats(component, stats)``. Every
+numeric leaf of the returned dict becomes a ``component_stat`` sample
+labelled with the component and the dotted key path, e.g.
+``component_stat{component="event_log",stat="topics.readings.end_offset"}``.
+Stats are only collected when /metrics is scraped.
+
+Recording costs a lock and a bisect per observation, a few microseconds
+per request, so it stays on in production.
+"""
+import bisect
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+                                for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (not yet cumulative) counts, then sum and count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self._values.items())
+        lines = self.header()
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Metrics and stats sources of this process"""
+
+    def __init__(self):
+        self.metrics = []
+        self.stats_sources = {}
+        self.started_at = time.time()
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_stats(self, component, stats):
+        self.stats_sources[component] = stats
+
+    def _stats_lines(self):
+        lines = ['# HELP component_stat Numeric stats of buffers, queues and caches',
+                 '# TYPE component_stat gauge']
+        for component, stats in sorted(self.stats_sources.items()):
+            try:
+                values = stats()
+            except Exception:
+                lines.append(f'component_stat{_labels(("component", "stat"), (component, "collect_error"))} 1')
+                continue
+            for path, value in _numeric_leaves(values):
+                lines.append(f'component_stat{_labels(("component", "stat"), (component, path))} {_number(value)}')
+        return lines
+
+    def _process_lines(self):
+        lines = ['# HELP process_cpu_seconds_total CPU time of this process',
+                 '# TYPE process_cpu_seconds_total counter',
+                 f'process_cpu_seconds_total {_number(time.process_time())}',
+                 '# HELP process_start_time_seconds Start time of this process',
+                 '# TYPE process_start_time_seconds gauge',
+                 f'process_start_time_seconds {_number(self.started_at)}']
+        try:
+            with open('/proc/self/statm') as statm:
+                resident = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            lines += ['# HELP process_resident_memory_bytes Resident memory of this process',
+                      '# TYPE process_resident_memory_bytes gauge',
+                      f'process_resident_memory_bytes {resident}']
+        except (OSError, ValueError, IndexError):
+            pass
+        return lines
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        lines += self._stats_lines()
+        lines += self._process_lines()
+        return '\n'.join(lines) + '\n'
+
+
+def _numeric_leaves(value, path=''):
+    """(dotted path, number) of every int, float or bool in nested dicts; lists and strings are skipped"""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _numeric_leaves(child, f'{path}.{key}' if path else str(key))
+    elif isinstance(value, bool):
+        yield path, int(value)
+    elif isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value)):
+        yield path, value
+
+
+registry = Registry()
+request_duration = registry.add(Histogram(
+    'http_request_duration_seconds', 'Request latency until the response is closed',
+    ('method', 'route', 'status')))
+requests_in_flight = registry.add(Gauge(
+    'http_requests_in_flight', 'Requests being handled or streamed', ('route',)))
+request_sql_queries = registry.add(Histogram(
+    'http_request_sql_queries', 'SQL statements executed per request', ('route',), QUERY_COUNT_BUCKETS))
+request_sql_seconds = registry.add(Histogram(
+    'http_request_sql_seconds', 'SQL execution time per request', ('route',)))
+sql_queries = registry.add(Counter(
+    'sql_queries_total', 'SQL statements executed', ('context',)))
+sql_seconds = registry.add(Counter(
+    'sql_query_seconds_total', 'SQL execution time', ('context',)))
+upstream_duration = registry.add(Histogram(
+    'upstream_request_duration_seconds', 'Latency of calls to other services', ('dependency', 'outcome')))
+
+# [statements, seconds] of the current request
+_request_sql = contextvars.ContextVar('request_sql', default=None)
+
+
+def register_stats(component, stats):
+    registry.register_stats(component, stats)
+
+
+@contextmanager
+def upstream(dependency):
+    """Time a call to another service, e.g. ``with upstream('traffic-analysis'): requests.get(...)``"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        upstream_duration.observe(time.perf_counter() - started, (dependency, outcome))
+
+
+# SQL
+
+_REQUEST = ('request',)
+_BACKGROUND = ('background',)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info['metrics_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info.pop('metrics_started', 0.0)
+    totals = _request_sql.get()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += elapsed
+    labels = _BACKGROUND if totals is None else _REQUEST
+    sql_queries.inc(labels)
+    sql_seconds.inc(labels, elapsed)
+
+
+_sql_listening = False
+_sql_lock = threading.Lock()
+
+
+def instrument_sql():
+    global _sql_listening
+    with _sql_lock:
+        if not _sql_listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _sql_listening = True
+
+
+# Flask
+
+def _before_request():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    environ = request.environ
+    environ['metrics.route'] = route
+    environ['metrics.started'] = time.perf_counter()
+    environ['metrics.sql'] = [0, 0.0]
+    environ['metrics.sql_token'] = _request_sql.set(environ['metrics.sql'])
+    requests_in_flight.inc((route,))
+
+
+def _finish(environ, status):
+    if environ.get('metrics.finished') or 'metrics.route' not in environ:
+        return
+    environ['metrics.finished'] = True
+    route = environ['metrics.route']
+    statements, seconds = environ['metrics.sql']
+    request_duration.observe(time.perf_counter() - environ['metrics.started'], (environ['REQUEST_METHOD'], route, status))
+    request_sql_queries.observe(statements, (route,))
+    request_sql_seconds.observe(seconds, (route,))
+    requests_in_flight.dec((route,))
+
+
+def _after_request(response):
+    environ = request.environ
+    if 'metrics.route' in environ:
+        environ['metrics.closing'] = True
+        status = str(response.status_code)
+        if response.is_streamed:
+            # The body is still being produced; finish when the server closes the response
+            response.call_on_close(lambda: _finish(environ, status))
+        else:
+            _finish(environ, status)
+    return response
+
+
+def _teardown_request(exc):
+    environ = request.environ
+    token = environ.pop('metrics.sql_token', None)
+    if token is not None:
+        try:
+            _request_sql.reset(token)
+        except ValueError:
+            pass
+    if not environ.get('metrics.closing'):
+        # after_request did not run (an unhandled error), so nothing will close the response
+        _finish(environ, '500')
+
+
+def metrics_view():
+    return Response(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+    """Instrument ``app``'s requests and the process's SQL, and serve /metrics"""
+    instrument_sql()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,77 @@
+"""Newline-delimited JSON streaming for large reads between services.
+
+Servers write one JSON record per line, flushed in chunks of about
+``chunk_bytes``, and finish with an end marker line carrying the record
+count. Because the status line is sent before the rows are read, a
+failure part-way through can only cut the stream short. Clients detect
+that by the missing end marker and raise IncompleteStream instead of
+treating a partial result as complete.
+
+Clients iterate records as they arrive (``iter_records``), so neither
+side ever holds the whole result set.
+"""
+import json
+
+MEDIA_TYPE = 'application/x-ndjson'
+DEFAULT_CHUNK_BYTES = 64 * 1024
+END_MARKER = '__end__'
+
+
+class IncompleteStream(ValueError):
+    """The stream ended before its end marker"""
+
+
+def wants_ndjson(request):
+    """True when an HTTP request prefers NDJSON over a single JSON document"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    # JSON is listed first so wildcard Accept headers keep getting JSON
+    return request.accept_mimetypes.best_match(['application/json', MEDIA_TYPE]) == MEDIA_TYPE
+
+
+def encode_records(records, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Yield NDJSON byte chunks for an iterable of JSON-serializable records"""
+    lines = []
+    size = 0
+    count = 0
+    for record in records:
+        line = json.dumps(record, separators=(',', ':'))
+        lines.append(line)
+        size += len(line) + 1
+        count += 1
+        if size >= chunk_bytes:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+            size = 0
+    lines.append(json.dumps({END_MARKER: True, 'count': count}))
+    yield ('\n'.join(lines) + '\n').encode()
+
+
+def iter_lines(chunks):
+    """Complete lines from an iterable of byte chunks; an unterminated tail is dropped"""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+
+
+def decode_records(chunks):
+    """Yield records from NDJSON byte chunks; raise IncompleteStream if truncated"""
+    for line in iter_lines(chunks):
+        record = json.loads(line)
+        if END_MARKER in record:
+            return
+        yield record
+    raise IncompleteStream('NDJSON stream ended without its end marker')
+
+
+def iter_records(session, url, params=None, timeout=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """GET an endpoint as NDJSON and yield its records while they download"""
+    with session.get(url, params=params, headers={'Accept': MEDIA_TYPE}, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        if response.headers.get('Content-Type', '').split(';')[0] != MEDIA_TYPE:
+            raise ValueError(f'Expected {MEDIA_TYPE}, got {response.headers.get("Content-Type")}')
+        yield from decode_records(response.iter_content(chunk_size=chunk_bytes))
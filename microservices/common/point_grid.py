@@ -0,0 +1,94 @@
+"""Uniform grid index over projected points, for matching points to a route.
+
+Route travel time estimation matches sensors to a polyline and emergency
+corridors match traffic lights to one; both project latitude/longitude to
+metres and look up candidate points in the grid cells around pieces of the
+route.
+"""
+import numpy as np
+
+METRES_PER_DEGREE = 6371008.8 * np.pi / 180.0
+
+
+def project(lats, lngs, ref_lat):
+    """Equirectangular projection to metres around ref_lat (accurate at city scale)"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    return lngs * METRES_PER_DEGREE * np.cos(np.radians(ref_lat)), lats * METRES_PER_DEGREE
+
+
+def expand_ranges(starts, counts):
+    """Concatenate arange(start, start + count) for every (start, count) pair.
+
+    Returns (pair index, value) arrays with one entry per generated value.
+    """
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    return owner, np.repeat(starts - offsets, counts) + np.arange(total)
+
+
+class PointGrid:
+    """Uniform grid over projected points stored in CSR layout.
+
+    Points are sorted by cell id so the members of a cell are a contiguous
+    slice of ``order``. Only occupied cells are stored: ``cells`` holds their
+    sorted ids and ``cell_start``/``cell_end`` their slices, so memory grows
+    with the number of points, not the area they span (one sensor reporting
+    0,0 next to city data would otherwise need a cell table the size of the
+    globe).
+    """
+
+    def __init__(self, x, y, cell_m):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.cell_m = float(cell_m)
+
+        if len(self.x):
+            self.min_x, self.min_y = self.x.min(), self.y.min()
+        else:
+            self.min_x = self.min_y = 0.0
+        cx, cy = self.cell_index(self.x, self.y)
+        self.nx = int(cx.max()) + 1 if len(cx) else 1
+        self.ny = int(cy.max()) + 1 if len(cy) else 1
+
+        cell_ids = cx * self.ny + cy
+        self.order = np.argsort(cell_ids, kind='stable')
+        sorted_ids = cell_ids[self.order]
+        self.cells = np.unique(sorted_ids)
+        self.cell_start = np.searchsorted(sorted_ids, self.cells, side='left')
+        self.cell_end = np.searchsorted(sorted_ids, self.cells, side='right')
+
+    def cell_index(self, x, y):
+        """Integer (column, row) grid coordinates of projected points"""
+        cx = np.floor((x - self.min_x) / self.cell_m).astype(np.int64)
+        cy = np.floor((y - self.min_y) / self.cell_m).astype(np.int64)
+        return cx, cy
+
+    def candidates(self, min_x, min_y, max_x, max_y):
+        """Candidate (box index, point index) pairs for a batch of query boxes"""
+        cx0, cy0 = self.cell_index(min_x, min_y)
+        cx1, cy1 = self.cell_index(max_x, max_y)
+        cx0, cy0 = np.clip(cx0, 0, self.nx - 1), np.clip(cy0, 0, self.ny - 1)
+        cx1, cy1 = np.clip(cx1, 0, self.nx - 1), np.clip(cy1, 0, self.ny - 1)
+
+        # Boxes entirely outside the grid cover no cells
+        width = np.where((max_x < self.min_x) | (min_x > self.min_x + self.nx * self.cell_m), 0, cx1 - cx0 + 1)
+        height = np.where((max_y < self.min_y) | (min_y > self.min_y + self.ny * self.cell_m), 0, cy1 - cy0 + 1)
+        width, height = np.maximum(width, 0), np.maximum(height, 0)
+
+        box, local = expand_ranges(np.zeros(len(width), dtype=np.int64), width * height)
+        rows = np.maximum(height[box], 1)
+        cell_ids = (cx0[box] + local // rows) * self.ny + cy0[box] + local % rows
+
+        if not len(self.cells):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Empty cells are not stored and yield no points
+        slot = np.minimum(np.searchsorted(self.cells, cell_ids), len(self.cells) - 1)
+        occupied = self.cells[slot] == cell_ids
+        starts = np.where(occupied, self.cell_start[slot], 0)
+        counts = np.where(occupied, self.cell_end[slot] - self.cell_start[slot], 0)
+        cell_owner, positions = expand_ranges(starts, counts)
+        return box[cell_owner], self.order[positions]
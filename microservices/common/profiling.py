@@ -0,0 +1,445 @@
+"""Request profiling shared by the services, read at /admin/profiles.
+
+Each service's main.py calls ``init_app(app)``, which adds two ways of
+seeing where a request's time goes:
+
+On demand, a request is run under cProfile when it carries a signed
+``X-Profile`` header, or when an admin armed its route with
+``POST /admin/profiles/arm {"route": "/api/incident-impact", "count": 3}``.
+The profile is stored and its id returned in the ``X-Profile-Id``
+response header.
+
+Always, a sampler thread takes the stack of every in-flight request
+every PROFILING_SAMPLE_INTERVAL seconds (0.01) while there are any, and
+the slowest PROFILING_SLOW_KEEP (5) requests of each route keep their
+folded stacks. A sample walks each in-flight request's frames (about
+6 microseconds for 60 frames) and nothing runs per Python call, so it
+stays on in production.
+
+Tokens are ``<expires>.<hex HMAC-SHA256 of "<expires>:<scope>">`` keyed
+with PROFILING_KEY (app config or environment), where the scope is the
+request path to profile, or ``admin`` for the /admin/profiles endpoints
+(sent as ``X-Admin-Token``). Without a key neither is accepted. Mint one
+with ``python -m common.profiling /api/incident-impact``.
+
+    GET  /admin/profiles              slowest requests per route and captured profiles
+    GET  /admin/profiles/<id>         one profile; ?format=json|text|folded, ?limit=
+    POST /admin/profiles/arm          profile the next requests of a route
+"""
+import argparse
+import cProfile
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from flask import Response, current_app, jsonify, request
+
+SAMPLE_INTERVAL = 0.01
+SLOW_KEEP = 5
+CAPTURE_KEEP = 32
+MAX_STACKS = 256
+MAX_DEPTH = 128
+MAX_ARMED = 100
+TOKEN_TTL_SECONDS = 300
+ADMIN_SCOPE = 'admin'
+
+
+class ProfilingUnauthorized(Exception):
+    pass
+
+
+# Tokens
+
+def _signature(key, expires, scope):
+    return hmac.new(key.encode(), f"{expires}:{scope}".encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(key, scope, ttl=TOKEN_TTL_SECONDS):
+    expires = int(time.time() + ttl)
+    return f"{expires}.{_signature(key, expires, scope)}"
+
+
+def verify_token(key, token, scope):
+    if not key or not token:
+        return False
+    try:
+        expires, signature = token.split('.', 1)
+        expires = int(expires)
+    except ValueError:
+        return False
+    # Compared as bytes: compare_digest rejects non-ASCII str, and headers arrive as latin-1
+    return expires >= time.time() and hmac.compare_digest(signature.encode('latin-1', 'replace'),
+                                                          _signature(key, expires, scope).encode())
+
+
+def profiling_key():
+    return current_app.config.get('PROFILING_KEY') or os.environ.get('PROFILING_KEY')
+
+
+# Profiles
+
+@lru_cache(maxsize=4096)
+def _function_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    """What is kept of one request: its stack samples and, when captured, its cProfile stats"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, route, method, path):
+        self.id = str(next(self._ids))
+        self.route = route
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.stacks = {}
+        self.samples = 0
+        self.profiler = None
+        self.profile_stats = None
+
+    def add_stack(self, stack):
+        """Count one sample of ``stack``, the code objects from the innermost frame out"""
+        self.samples += 1
+        if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+            stack = ()
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 2) if self.duration is not None else None,
+            'samples': self.samples,
+            'cprofile': self.profile_stats is not None
+        }
+
+    def top_stacks(self, limit):
+        """(function names from the outermost frame in, samples) of the most sampled stacks"""
+        stacks = sorted(list(self.stacks.items()), key=lambda item: -item[1])[:limit]
+        return [([_function_name(code) for code in reversed(stack)] if stack else ['(other stacks)'], count)
+                for stack, count in stacks]
+
+    def folded(self):
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.top_stacks(len(self.stacks)))
+
+    def top_functions(self, limit):
+        rows = sorted(self.profile_stats.items(), key=lambda item: -item[1][3])[:limit]
+        return [{
+            'function': f"{name} ({os.path.basename(filename)}:{line})",
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3)
+        } for (filename, line, name), (primitive_calls, calls, tottime, cumtime, _) in rows]
+
+    def pstats_text(self, limit):
+        output = io.StringIO()
+        pstats.Stats(_StatsSnapshot(self.profile_stats), stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def to_dict(self, limit):
+        result = self.summary()
+        result['stacks'] = [{'stack': stack, 'samples': count} for stack, count in self.top_stacks(limit)]
+        if self.profile_stats is not None:
+            result['functions'] = self.top_functions(limit)
+        return result
+
+
+class _StatsSnapshot:
+    """Stored cProfile stats in the shape pstats.Stats loads (it empties what it loads)"""
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def create_stats(self):
+        self.stats = dict(self._stats)
+
+
+class Profiler:
+    """Stack sampler of in-flight requests, the slowest of each route, and captured profiles"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, slow_keep=SLOW_KEEP, capture_keep=CAPTURE_KEEP):
+        self.interval = interval
+        self.slow_keep = slow_keep
+        self.active = {}
+        self.slowest = {}
+        self.captured = deque(maxlen=capture_keep)
+        self.armed = {}
+        self.sampled = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _ensure_sampler(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._sample_loop, name='request-sampler', daemon=True)
+                    self._thread.start()
+
+    @staticmethod
+    def _stack(frame):
+        # Code objects only; they are named when a profile is read
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        return tuple(stack)
+
+    def _sample_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while self.active:
+                time.sleep(self.interval)
+                frames = sys._current_frames()
+                for ident, profile in list(self.active.items()):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.add_stack(self._stack(frame))
+                self.sampled += 1
+                # Don't keep the requests' frames, and their locals, alive while sleeping
+                frames = frame = None
+
+    def start(self, profile, capture):
+        """Start sampling ``profile`` on this thread and, if ``capture``, run cProfile over it"""
+        if capture:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                profile.profiler = profiler
+            except ValueError:
+                # Another profiler is active (one per process from Python 3.12)
+                pass
+        if self.slow_keep > 0:
+            self._ensure_sampler()
+            self.active[threading.get_ident()] = profile
+            self._wake.set()
+
+    def finish(self, profile, ident, status):
+        profile.duration = time.perf_counter() - profile.started
+        profile.status = status
+        self.active.pop(ident, None)
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            profile.profiler.create_stats()
+            profile.profile_stats = profile.profiler.stats
+            profile.profiler = None
+            with self._lock:
+                self.captured.append(profile)
+        if self.slow_keep > 0:
+            with self._lock:
+                slowest = self.slowest.setdefault(profile.route, [])
+                entry = (profile.duration, int(profile.id), profile)
+                if len(slowest) < self.slow_keep:
+                    heapq.heappush(slowest, entry)
+                elif profile.duration > slowest[0][0]:
+                    heapq.heapreplace(slowest, entry)
+
+    def arm(self, route, count):
+        with self._lock:
+            self.armed[route] = self.armed.get(route, 0) + count
+            return self.armed[route]
+
+    def take_armed(self, route):
+        if route not in self.armed:
+            return False
+        with self._lock:
+            remaining = self.armed.get(route, 0)
+            if remaining <= 0:
+                return False
+            if remaining == 1:
+                del self.armed[route]
+            else:
+                self.armed[route] = remaining - 1
+            return True
+
+    def find(self, profile_id):
+        with self._lock:
+            for profile in self.captured:
+                if profile.id == profile_id:
+                    return profile
+            for slowest in self.slowest.values():
+                for _, _, profile in slowest:
+                    if profile.id == profile_id:
+                        return profile
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self.active),
+                'sample_rounds': self.sampled,
+                'routes': len(self.slowest),
+                'slow_kept': sum(len(slowest) for slowest in self.slowest.values()),
+                'captured': len(self.captured),
+                'armed': sum(self.armed.values())
+            }
+
+    def overview(self):
+        with self._lock:
+            return {
+                'interval_seconds': self.interval,
+                'slow_keep': self.slow_keep,
+                'slowest': {route: [profile.summary() for _, _, profile in sorted(slowest, reverse=True)]
+                            for route, slowest in sorted(self.slowest.items())},
+                'captured': [profile.summary() for profile in reversed(self.captured)],
+                'armed': dict(self.armed)
+            }
+
+
+profiler = Profiler(float(os.environ.get('PROFILING_SAMPLE_INTERVAL', SAMPLE_INTERVAL)),
+                    int(os.environ.get('PROFILING_SLOW_KEEP', SLOW_KEEP)))
+
+
+# Flask
+
+def _before_request():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    capture = False
+    token = request.headers.get('X-Profile')
+    if token is not None:
+        capture = verify_token(profiling_key(), token, request.path)
+    elif profiler.armed:
+        capture = profiler.take_armed(route)
+    profile = RequestProfile(route, request.method, request.path)
+    environ = request.environ
+    environ['profiling.profile'] = profile
+    environ['profiling.thread'] = threading.get_ident()
+    profiler.start(profile, capture)
+
+
+def _finish(environ, status):
+    profile = environ.pop('profiling.profile', None)
+    if profile is not None:
+        profiler.finish(profile, environ['profiling.thread'], status)
+
+
+def _after_request(response):
+    environ = request.environ
+    profile = environ.get('profiling.profile')
+    if profile is not None:
+        environ['profiling.closing'] = True
+        if profile.profiler is not None:
+            response.headers['X-Profile-Id'] = profile.id
+        status = str(response.status_code)
+        if response.is_streamed:
+            # The body is still being produced; finish when the server closes the response
+            response.call_on_close(lambda: _finish(environ, status))
+        else:
+            _finish(environ, status)
+    return response
+
+
+def _teardown_request(exc):
+    environ = request.environ
+    if not environ.get('profiling.closing'):
+        # after_request did not run (an unhandled error), so nothing will close the response
+        _finish(environ, '500')
+
+
+def _authorize():
+    if not profiling_key():
+        raise ProfilingUnauthorized('Profiling is disabled: PROFILING_KEY is not configured')
+    if not verify_token(profiling_key(), request.headers.get('X-Admin-Token'), ADMIN_SCOPE):
+        raise ProfilingUnauthorized('A valid X-Admin-Token is required')
+
+
+def profiles_view():
+    """Slowest requests per route and the captured profiles, newest first"""
+    try:
+        _authorize()
+        return jsonify(profiler.overview())
+    except ProfilingUnauthorized as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def profile_view(profile_id):
+    """One profile as JSON, pstats text (captured only) or folded stacks for flame graphs"""
+    try:
+        _authorize()
+        profile = profiler.find(profile_id)
+        if profile is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        limit = request.args.get('limit', 40, type=int)
+        output = request.args.get('format', 'json')
+        if output == 'folded':
+            return Response(profile.folded(), mimetype='text/plain')
+        if output == 'text':
+            if profile.profile_stats is None:
+                return jsonify({'error': 'Profile has no cProfile stats, only stack samples'}), 400
+            return Response(profile.pstats_text(limit), mimetype='text/plain')
+        if output != 'json':
+            return jsonify({'error': 'format must be json, text or folded'}), 400
+        return jsonify(profile.to_dict(limit))
+    except ProfilingUnauthorized as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def arm_view():
+    """Capture cProfile profiles of the next ``count`` requests to ``route``"""
+    try:
+        _authorize()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object with route and count'}), 400
+        route = data.get('route')
+        count = int(data.get('count', 1))
+        if not route or not 1 <= count <= MAX_ARMED:
+            return jsonify({'error': f"route and a count of 1 to {MAX_ARMED} are required"}), 400
+        if route not in {rule.rule for rule in current_app.url_map.iter_rules()}:
+            return jsonify({'error': f"Unknown route {route}"}), 400
+        return jsonify({'route': route, 'armed': profiler.arm(route, count)})
+    except ProfilingUnauthorized as e:
+        return jsonify({'error': str(e)}), 403
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def init_app(app):
+    """Sample ``app``'s requests, honour profiling requests, and serve /admin/profiles"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/admin/profiles', 'profiles', profiles_view)
+    app.add_url_rule('/admin/profiles/<profile_id>', 'profile', profile_view)
+    app.add_url_rule('/admin/profiles/arm', 'arm_profiling', arm_view, methods=['POST'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mint a profiling token signed with PROFILING_KEY')
+    parser.add_argument('scope', help=f"request path to profile, or '{ADMIN_SCOPE}' for /admin/profiles")
+    parser.add_argument('--ttl', type=int, default=TOKEN_TTL_SECONDS, help='seconds the token is valid')
+    args = parser.parse_args(argv)
+    key = os.environ.get('PROFILING_KEY')
+    if not key:
+        raise SystemExit('PROFILING_KEY is not set')
+    print(make_token(key, args.scope, args.ttl))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Rolling in-memory window of recent readings and active incidents.
+
+Fed from the ingestion event log by an EventSubscriber; replaces the
+"fetch the newest N rows" calls the services used to make on every
+request. Readings older than the window, or beyond ``max_readings``, are
+evicted from the front in arrival order.
+
+Observers (``add_observer``) get ``readings_added(readings)`` and
+``readings_evicted(readings)`` calls under the window's lock, so derived
+aggregates can be maintained incrementally instead of recomputed.
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from common.event_log import EventSubscriber
+
+DEFAULT_WINDOW_SECONDS = 3600
+DEFAULT_MAX_READINGS = 200000
+
+
+def reading_time(reading):
+    """Epoch seconds of a TrafficData.to_dict() timestamp (naive UTC)"""
+    return (datetime.fromisoformat(reading['timestamp']) - datetime(1970, 1, 1)).total_seconds()
+
+
+class ReadingWindow:
+    """Readings from the last ``window_seconds`` plus incidents by id"""
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, max_readings=DEFAULT_MAX_READINGS):
+        self.window_seconds = window_seconds
+        self.max_readings = max_readings
+        self._readings = deque()
+        self._incidents = {}
+        self._lock = threading.Lock()
+        # Bumped on every change so derived views can be cached
+        self.version = 0
+        self.max_reading_id = 0
+        self.subscriber = None
+        self.observers = []
+
+    def add_readings(self, readings):
+        with self._lock:
+            for reading in readings:
+                self._readings.append((reading_time(reading), reading))
+                if reading.get('id') and reading['id'] > self.max_reading_id:
+                    self.max_reading_id = reading['id']
+            for observer in self.observers:
+                observer.readings_added(readings)
+            self._evict(time.time())
+            self.version += 1
+
+    def add_incidents(self, incidents):
+        with self._lock:
+            for incident in incidents:
+                self._incidents[incident['id']] = incident
+            self.version += 1
+
+    def _evict(self, now):
+        cutoff = now - self.window_seconds
+        readings = self._readings
+        evicted = []
+        while readings and (readings[0][0] < cutoff or len(readings) > self.max_readings):
+            evicted.append(readings.popleft()[1])
+        if evicted:
+            for observer in self.observers:
+                observer.readings_evicted(evicted)
+            self.version += 1
+
+    def add_observer(self, observer):
+        """Register an observer and hand it the readings already in the window"""
+        with self._lock:
+            observer.readings_added([reading for _, reading in self._readings])
+            self.observers.append(observer)
+
+    def watermark(self, since_seconds=None):
+        """Version after evicting expired readings; changes whenever readings() or incidents() would.
+
+        Readings age out of a ``since_seconds`` range without a version bump,
+        so for one the result is (version, readings in range), which together
+        pin down what readings(since_seconds=...) returns.
+        """
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            if since_seconds is None:
+                return self.version
+            cutoff = now - since_seconds
+            count = 0
+            for ts, _ in reversed(self._readings):
+                if ts < cutoff:
+                    break
+                count += 1
+            return self.version, count
+
+    def readings(self, limit=None, since_seconds=None):
+        """Readings newest first, like GET /traffic-data"""
+        with self._lock:
+            self._evict(time.time())
+            cutoff = time.time() - since_seconds if since_seconds is not None else None
+            newest_first = []
+            for ts, reading in reversed(self._readings):
+                if cutoff is not None and ts < cutoff:
+                    break
+                newest_first.append(reading)
+                if limit is not None and len(newest_first) >= limit:
+                    break
+            return newest_first
+
+    def incidents(self, status='ACTIVE'):
+        with self._lock:
+            return sorted((incident for incident in self._incidents.values() if incident.get('status') == status),
+                          key=lambda incident: incident['reported_at'], reverse=True)
+
+    def follow(self, log, group):
+        """Replay the window from the log, then keep following it in the background"""
+        self.subscriber = EventSubscriber(
+            log, group, {'readings': self.add_readings, 'incidents': self.add_incidents},
+            start=time.time() - self.window_seconds
+        )
+        # Incidents stay relevant until resolved, so replay all that are retained
+        self.subscriber.consumers['incidents'] = log.consumer('incidents', group, start='earliest')
+        self.subscriber.poll_once()
+        self.subscriber.start()
+        return self.subscriber
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'readings': len(self._readings),
+                'incidents': len(self._incidents),
+                'window_seconds': self.window_seconds,
+                'max_readings': self.max_readings,
+                'max_reading_id': self.max_reading_id,
+                'oldest': datetime.utcfromtimestamp(self._readings[0][0]).isoformat() if self._readings else None
+            }
+        stats['subscriber'] = self.subscriber.stats() if self.subscriber else None
+        return stats
@@ -0,0 +1,93 @@
+"""Constant-memory aggregates for streams of readings.
+
+Analysis used to collect every value into per-sensor lists before
+reducing them; these accumulate as records arrive instead, so memory
+grows with the number of groups rather than the number of readings.
+"""
+from collections import Counter
+
+
+class RunningStats:
+    """Count, sum, mean, min and max of a stream of numbers"""
+
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        # Stays an int while only ints are added, like sum()
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Fold in another RunningStats, e.g. a partial from another shard"""
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class SensorStats:
+    """Running vehicle count, speed and congestion level tallies for one group of readings"""
+
+    __slots__ = ('location', 'sensor_id', 'vehicle_count', 'speed', 'congestion_score', 'congestion_levels')
+
+    def __init__(self, reading):
+        self.location = {'lat': reading['location_lat'], 'lng': reading['location_lng']}
+        self.sensor_id = reading['sensor_id']
+        self.vehicle_count = RunningStats()
+        self.speed = RunningStats()
+        self.congestion_score = RunningStats()
+        self.congestion_levels = Counter()
+
+    def add(self, reading):
+        self.vehicle_count.add(reading['vehicle_count'])
+        self.speed.add(reading['average_speed'])
+        # Higher vehicle count + lower speed = higher congestion
+        self.congestion_score.add(reading['vehicle_count'] / max(reading['average_speed'], 1))
+        self.congestion_levels[reading['congestion_level']] += 1
+
+    def merge(self, other):
+        self.vehicle_count.merge(other.vehicle_count)
+        self.speed.merge(other.speed)
+        self.congestion_score.merge(other.congestion_score)
+        self.congestion_levels.update(other.congestion_levels)
+
+    def most_common_congestion(self):
+        return self.congestion_levels.most_common(1)[0][0]
+
+
+def aggregate_by(readings, key):
+    """SensorStats per key(reading), consuming ``readings`` one at a time"""
+    groups = {}
+    for reading in readings:
+        group_key = key(reading)
+        stats = groups.get(group_key)
+        if stats is None:
+            stats = groups[group_key] = SensorStats(reading)
+        stats.add(reading)
+    return groups
+
+
+def merge_groups(groups, partial):
+    """Merge aggregate_by() results from another partition into ``groups``"""
+    for key, stats in partial.items():
+        if key in groups:
+            groups[key].merge(stats)
+        else:
+            groups[key] = stats
+    return groups
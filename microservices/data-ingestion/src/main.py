@@ -2,16 +2,23 @@ import os
 import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Modules shared between the services, e.g. the ingestion event log
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from common import metrics, profiling
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.traffic import traffic_bp
+from src.routes.traffic import traffic_bp, get_event_log, live_feed
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 CORS(app)
+# Prometheus metrics of every request, SQL statement and registered buffer, at /metrics
+metrics.init_app(app)
+# Slow-request stack samples and on-demand cProfile captures, at /admin/profiles
+profiling.init_app(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(traffic_bp, url_prefix='/api')
@@ -22,6 +29,12 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    # Open the event log other services follow, seeding it on first start
+    get_event_log()
+
+metrics.register_stats('live_feed', live_feed.stats)
+metrics.register_stats('event_log', lambda: get_event_log().stats())
+metrics.register_stats('request_profiler', profiling.profiler.stats)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -13,7 +13,7 @@ class TrafficData(db.Model):
     vehicle_count = db.Column(db.Integer, nullable=False)
     average_speed = db.Column(db.Float, nullable=False)
     congestion_level = db.Column(db.String(20), nullable=False)  # LOW, MEDIUM, HIGH
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     
     def to_dict(self):
         return {
@@ -1,9 +1,176 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from src.models.traffic_data import db, TrafficData, TrafficIncident
-from datetime import datetime
+from src.services.shards import ShardSet, MaintenanceRunning, PartialInsert
+from src.services.archive import ReadingArchive, DEFAULT_ARCHIVE_AFTER_DAYS, to_micros, naive_utc, \
+    column_rows as archive_rows
+from common.event_log import FileEventLog
+from common.live_feed import LiveFeed, init_blueprint as init_live_feed
+from common import columnar, ndjson, json_rows, http_cache
+import numpy as np
+from datetime import datetime, timedelta
+from operator import itemgetter
+import os
 import random
+import threading
 
 traffic_bp = Blueprint('traffic', __name__)
+# ETags for list endpoints and gzip/brotli for large JSON bodies
+traffic_bp.after_request(http_cache.finalize_response)
+
+# New readings and incidents pushed to dashboard clients, see /stream
+live_feed = LiveFeed(('readings', 'incidents'))
+
+# Every accepted reading and incident is appended to the event log that
+# analysis, prediction and control follow. Tests can set the EVENT_LOG app
+# config key to a MemoryEventLog; EVENT_LOG_DIR overrides the directory.
+event_log = None
+_event_log_init_lock = threading.Lock()
+EVENT_LOG_SEED_BATCH = 10000
+
+# Readings are split over region shards (see services/shards.py). The
+# shard map lives in SHARDS_DIR, by default next to the service database;
+# without one every reading stays in the service database.
+shards = None
+_shards_init_lock = threading.Lock()
+DEFAULT_SHARDS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database')
+
+# Readings older than a few days move to compressed cold storage (see
+# services/archive.py), in ARCHIVE_DIR or an archive directory next to the shards
+archive = None
+_archive_init_lock = threading.Lock()
+
+# Readings accepted per POST /traffic-data/bulk
+MAX_BULK_ITEMS = 5000
+
+# Rows fetched per cursor batch when streaming /traffic-data as NDJSON
+NDJSON_BATCH_ROWS = 1000
+
+# Core columns behind to_dict(), for the JSON list endpoints
+TRAFFIC_DATA_FIELDS, TRAFFIC_DATA_COLUMNS = json_rows.table_fields(TrafficData.__table__)
+INCIDENT_FIELDS, INCIDENT_COLUMNS = json_rows.table_fields(TrafficIncident.__table__)
+
+# The same columns in to_dict() key order, for NDJSON records
+TRAFFIC_DATA_RECORD_FIELDS = [column.key for column in TrafficData.__table__.columns]
+TRAFFIC_DATA_RECORD_COLUMNS = [
+    json_rows.isoformat_sql(column).label(column.key) if column.key == 'timestamp' else column
+    for column in TrafficData.__table__.columns
+]
+
+def parse_timestamp(value):
+    """ISO 8601 query parameter as naive UTC; offsets such as 'Z' are converted"""
+    return naive_utc(datetime.fromisoformat(value))
+
+def shards_directory():
+    database = db.engine.url.database
+    return current_app.config.get('SHARDS_DIR') or (
+        os.path.dirname(os.path.abspath(database)) if database and database != ':memory:' else DEFAULT_SHARDS_DIR)
+
+def get_shards():
+    """The reading shards, loaded from the shard map on first use"""
+    global shards
+    if shards is None:
+        with _shards_init_lock:
+            if shards is None:
+                reading_shards = ShardSet.load(shards_directory(), db.engine)
+                # Archived readings keep their ids, which must not be handed out again
+                reading_shards.ids.advance(get_archive().max_id() + 1)
+                shards = reading_shards
+    return shards
+
+def get_archive():
+    """Cold storage of aged readings"""
+    global archive
+    if archive is None:
+        with _archive_init_lock:
+            if archive is None:
+                archive = ReadingArchive(
+                    current_app.config.get('ARCHIVE_DIR') or os.path.join(shards_directory(), 'archive'))
+    return archive
+
+def get_event_log():
+    """The ingestion event log, seeded from the database on first use"""
+    global event_log
+    if event_log is None:
+        with _event_log_init_lock:
+            if event_log is None:
+                log = current_app.config.get('EVENT_LOG') or FileEventLog(current_app.config.get('EVENT_LOG_DIR'))
+                seed_event_log(log)
+                event_log = log
+    return event_log
+
+def seed_event_log(log):
+    """Carry existing readings and incidents over into an empty log once"""
+    if not log.end_offset('readings'):
+        reading_archive = get_archive()
+        for segment in reading_archive.segments():
+            log.append('readings', [dict(zip(TRAFFIC_DATA_RECORD_FIELDS, row)) for row in archive_rows(
+                reading_archive.segment_columns(segment[3]), TRAFFIC_DATA_RECORD_FIELDS)])
+        reading_shards = get_shards()
+        id_index = TRAFFIC_DATA_RECORD_FIELDS.index('id')
+        last_id = 0
+        while True:
+            rows = reading_shards.merge(reading_shards.execute(
+                db.select(*TRAFFIC_DATA_RECORD_COLUMNS).where(TrafficData.id > last_id)
+                .order_by(TrafficData.id).limit(EVENT_LOG_SEED_BATCH)
+            ), key=itemgetter(id_index), limit=EVENT_LOG_SEED_BATCH, id_index=id_index)
+            if not rows:
+                break
+            log.append('readings', [dict(zip(TRAFFIC_DATA_RECORD_FIELDS, row)) for row in rows])
+            last_id = rows[-1][id_index]
+    if not log.end_offset('incidents'):
+        last_id = 0
+        while True:
+            rows = TrafficIncident.query.filter(TrafficIncident.id > last_id).order_by(
+                TrafficIncident.id).limit(EVENT_LOG_SEED_BATCH).all()
+            if not rows:
+                break
+            log.append('incidents', [row.to_dict() for row in rows])
+            last_id = rows[-1].id
+
+def publish_readings(readings):
+    """Append committed reading dicts to the event log and the live feed"""
+    get_event_log().append('readings', readings)
+    live_feed.publish('readings', [
+        (reading['sensor_id'], reading['location_lat'], reading['location_lng'], reading) for reading in readings
+    ])
+
+def publish_incident(incident):
+    get_event_log().append('incidents', [incident])
+    live_feed.publish('incidents', [(incident['id'], incident['location_lat'], incident['location_lng'], incident)])
+
+def congestion_level(vehicle_count, average_speed):
+    """Congestion level based on vehicle count and speed"""
+    if vehicle_count > 50 and average_speed < 30:
+        return 'HIGH'
+    if vehicle_count > 30 or average_speed < 50:
+        return 'MEDIUM'
+    return 'LOW'
+
+def reading_row(sensor_id, location_lat, location_lng, vehicle_count, average_speed, timestamp=None):
+    """Column values of a new reading, ready for ShardSet.insert"""
+    return {
+        'sensor_id': sensor_id,
+        'location_lat': location_lat,
+        'location_lng': location_lng,
+        'vehicle_count': vehicle_count,
+        'average_speed': average_speed,
+        'congestion_level': congestion_level(vehicle_count, average_speed),
+        'timestamp': timestamp or datetime.utcnow()
+    }
+
+def store_readings(rows):
+    """Write reading rows to their shards and publish them; returns their dicts"""
+    # Open (and seed) the event log before adding rows, so they are not carried over twice
+    get_event_log()
+    try:
+        get_shards().insert(rows)
+    except PartialInsert as e:
+        # Readings already committed on other shards must still reach the log
+        publish_readings([TrafficData(**row).to_dict() for row in e.rows])
+        raise
+    readings = [TrafficData(**row).to_dict() for row in rows]
+    publish_readings(readings)
+    return readings
 
 @traffic_bp.route('/traffic-data', methods=['POST'])
 def ingest_traffic_data():
@@ -17,52 +184,284 @@ def ingest_traffic_data():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        # Determine congestion level based on vehicle count and speed
-        congestion_level = 'LOW'
-        if data['vehicle_count'] > 50 and data['average_speed'] < 30:
-            congestion_level = 'HIGH'
-        elif data['vehicle_count'] > 30 or data['average_speed'] < 50:
-            congestion_level = 'MEDIUM'
+        reading, = store_readings([reading_row(
+            data['sensor_id'], data['location_lat'], data['location_lng'],
+            data['vehicle_count'], data['average_speed']
+        )])
         
-        traffic_data = TrafficData(
-            sensor_id=data['sensor_id'],
-            location_lat=data['location_lat'],
-            location_lng=data['location_lng'],
-            vehicle_count=data['vehicle_count'],
-            average_speed=data['average_speed'],
-            congestion_level=congestion_level
-        )
+        return jsonify({
+            'message': 'Traffic data ingested successfully',
+            'data': reading
+        }), 201
         
-        db.session.add(traffic_data)
-        db.session.commit()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@traffic_bp.route('/traffic-data/bulk', methods=['POST'])
+def ingest_traffic_data_bulk():
+    """Ingest a batch of sensor readings in one request"""
+    try:
+        data = request.get_json()
+        items = data.get('readings') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of readings'}), 400
+        if len(items) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} items per request'}), 413
+        
+        required_fields = ['sensor_id', 'location_lat', 'location_lng', 'vehicle_count', 'average_speed']
+        for index, item in enumerate(items):
+            for field in required_fields:
+                if field not in item:
+                    return jsonify({'error': f'Reading {index}: missing required field: {field}'}), 400
+        
+        readings = store_readings([reading_row(
+            item['sensor_id'], item['location_lat'], item['location_lng'],
+            item['vehicle_count'], item['average_speed']
+        ) for item in items])
         
         return jsonify({
-            'message': 'Traffic data ingested successfully',
-            'data': traffic_data.to_dict()
+            'message': f'Ingested {len(readings)} traffic data entries',
+            'count': len(readings),
+            'first_id': readings[0]['id'] if readings else None
         }), 201
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @traffic_bp.route('/traffic-data', methods=['GET'])
 def get_traffic_data():
     """Get traffic data with optional filtering"""
     try:
+        reading_shards = get_shards()
+        reading_archive = get_archive()
+        
+        # Readings are appended at the top of the id range and only ever
+        # trimmed from the bottom, so the id bounds of every shard move with
+        # each write. Each bound is a primary key lookup, unlike count().
+        cached = http_cache.not_modified(reading_archive.version, *(bound for rows in reading_shards.execute(db.select(
+            db.select(db.func.min(TrafficData.id)).scalar_subquery(),
+            db.select(db.func.max(TrafficData.id)).scalar_subquery()
+        )) for bound in rows[0]))
+        if cached:
+            return cached
+        
         # Query parameters
         sensor_id = request.args.get('sensor_id')
         limit = request.args.get('limit', 100, type=int)
+        since_id = request.args.get('since_id', type=int)
+        since = request.args.get('since', type=parse_timestamp)
+        until = request.args.get('until', type=parse_timestamp)
         
-        query = TrafficData.query
+        conditions = []
+        sensor_ids = None
+        horizon = None
         
         if sensor_id:
-            query = query.filter(TrafficData.sensor_id == sensor_id)
+            # A comma-separated list selects several sensors, e.g. for chart series
+            sensor_ids = sensor_id.split(',')
+            if len(sensor_ids) > 1:
+                conditions.append(TrafficData.sensor_id.in_(sensor_ids))
+            else:
+                conditions.append(TrafficData.sensor_id == sensor_id)
+        
+        if since is not None:
+            conditions.append(TrafficData.timestamp >= since)
+        if until is not None:
+            conditions.append(TrafficData.timestamp < until)
+        
+        if since_id is not None:
+            # Incremental consumers page forward through readings in id order,
+            # stopping short of ids that may still be committing on another shard
+            conditions.append(TrafficData.id > since_id)
+            horizon = reading_shards.ids.horizon()
+            if horizon is not None:
+                conditions.append(TrafficData.id < horizon)
+            order_by, sort_key, reverse = TrafficData.id.asc(), 'id', False
+        else:
+            order_by, sort_key, reverse = TrafficData.timestamp.desc(), 'timestamp', True
+        
+        # Archived readings are merged in as one more sorted source. The
+        # limit-th row of any shard bounds how far into the archive to look,
+        # so recent pages usually stop at the archive's block index.
+        archive_since = to_micros(since) if since is not None else None
+        archive_until = to_micros(until) if until is not None else None
+        id_below = horizon
+        if limit > 0:
+            sort_column = TrafficData.id if since_id is not None else TrafficData.timestamp
+            bounds = [rows[0][0] for rows in reading_shards.execute(
+                db.select(sort_column).where(*conditions).order_by(order_by).offset(limit - 1).limit(1)
+            ) if rows]
+            if bounds and since_id is not None:
+                id_below = min(bounds) if id_below is None else min(id_below, min(bounds))
+            elif bounds:
+                archive_since = max(archive_since or 0, to_micros(max(bounds)))
+        archived = reading_archive.query(
+            sensor_ids, archive_since, archive_until, since_id, id_below,
+            order='id' if since_id is not None else 'timestamp', limit=limit if limit >= 0 else None
+        )
+        
+        def select_readings(columns, fields, timestamp_style='iso'):
+            """Each shard's first ``limit`` matching rows, the archived ones and how to merge them"""
+            statement = db.select(*columns).where(*conditions).order_by(order_by).limit(limit)
+            extra = [archive_rows(archived, fields, timestamp_style)] if len(archived['id']) else []
+            return statement, extra, itemgetter(fields.index(sort_key)), fields.index('id')
+        
+        if columnar.wants_columnar(request):
+            statement, extra, key, id_index = select_readings(
+                TRAFFIC_DATA_COLUMNAR_COLUMNS, TRAFFIC_DATA_COLUMNAR_FIELDS, 'sql')
+            rows = reading_shards.merge(reading_shards.execute(statement) + extra, key, reverse, limit, id_index)
+            return columnar_response(traffic_data_columns(rows))
+        
+        if ndjson.wants_ndjson(request):
+            # Rows are read from each shard's cursor in batches while the response streams
+            statement, extra, key, id_index = select_readings(TRAFFIC_DATA_RECORD_COLUMNS, TRAFFIC_DATA_RECORD_FIELDS)
+            rows = reading_shards.stream(statement, key, reverse, limit, id_index, NDJSON_BATCH_ROWS, extra)
+            return Response(stream_with_context(ndjson.encode_records(
+                dict(zip(TRAFFIC_DATA_RECORD_FIELDS, row)) for row in rows
+            )), mimetype=ndjson.MEDIA_TYPE, headers={'Vary': 'Accept'})
         
-        traffic_data = query.order_by(TrafficData.timestamp.desc()).limit(limit).all()
+        statement, extra, key, id_index = select_readings(TRAFFIC_DATA_COLUMNS, TRAFFIC_DATA_FIELDS)
+        rows = reading_shards.merge(reading_shards.execute(statement) + extra, key, reverse, limit, id_index)
+        
+        return json_rows.list_response('data', rows, TRAFFIC_DATA_FIELDS, count=len(rows))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def columnar_response(payload):
+    return Response(payload, mimetype=columnar.MEDIA_TYPE, headers={'Vary': 'Accept'})
+
+# Columns behind the columnar encoding; the stored timestamp text is parsed in bulk by NumPy
+TRAFFIC_DATA_COLUMNAR_FIELDS = ['id', 'sensor_id', 'location_lat', 'location_lng', 'vehicle_count',
+                                'average_speed', 'congestion_level', 'timestamp']
+TRAFFIC_DATA_COLUMNAR_COLUMNS = [
+    db.cast(TrafficData.timestamp, db.String).label('timestamp') if field == 'timestamp'
+    else TrafficData.__table__.c[field] for field in TRAFFIC_DATA_COLUMNAR_FIELDS
+]
+
+def traffic_data_columns(rows):
+    """Encode TRAFFIC_DATA_COLUMNAR_COLUMNS rows as columns without building per-row dicts or datetimes"""
+    ids, sensor_ids, lats, lngs, vehicle_counts, speeds, levels, timestamps = zip(*rows) if rows else ((),) * 8
+    sensor_codes, sensor_dictionary = columnar.dictionary_encode(sensor_ids)
+    level_codes, level_dictionary = columnar.dictionary_encode(levels)
+    return columnar.encode({
+        'id': np.array(ids, dtype=np.int64),
+        'sensor_id': sensor_codes,
+        'location_lat': np.array(lats, dtype=np.float64),
+        'location_lng': np.array(lngs, dtype=np.float64),
+        'vehicle_count': np.array(vehicle_counts, dtype=np.int32),
+        'average_speed': np.array(speeds, dtype=np.float64),
+        'congestion_level': level_codes,
+        'timestamp_us': columnar.timestamps_to_micros(timestamps)
+    }, dictionaries={'sensor_id': sensor_dictionary, 'congestion_level': level_dictionary})
+
+def _grid_index(column, cell_size):
+    """SQL floor(column / cell_size); CAST alone truncates negatives towards zero"""
+    scaled = column / cell_size
+    truncated = db.cast(scaled, db.Integer)
+    return truncated - db.case((scaled < truncated, 1), else_=0)
+
+@traffic_bp.route('/traffic-conditions', methods=['GET'])
+def get_traffic_conditions():
+    """Get current traffic conditions aggregated per grid cell"""
+    try:
+        cell_size = request.args.get('cell_size', 0.0025, type=float)
+        window_minutes = request.args.get('window_minutes', 15, type=int)
+        
+        if cell_size <= 0:
+            return jsonify({'error': 'cell_size must be positive'}), 400
+        
+        since = datetime.utcnow() - timedelta(minutes=window_minutes)
+        row = _grid_index(TrafficData.location_lat, cell_size).label('row')
+        col = _grid_index(TrafficData.location_lng, cell_size).label('col')
+        
+        # Shards return sums, so a cell split over several shards averages correctly
+        query = db.select(
+            row,
+            col,
+            db.func.count(TrafficData.id),
+            db.func.sum(TrafficData.vehicle_count),
+            db.func.sum(TrafficData.average_speed),
+            db.func.sum(db.case((TrafficData.congestion_level == 'HIGH', 1), else_=0))
+        ).where(TrafficData.timestamp >= since)
+        
+        # Optional bounding box, used by zoned control cycles
+        min_lat = request.args.get('min_lat', type=float)
+        max_lat = request.args.get('max_lat', type=float)
+        min_lng = request.args.get('min_lng', type=float)
+        max_lng = request.args.get('max_lng', type=float)
+        if min_lat is not None:
+            query = query.where(TrafficData.location_lat >= min_lat)
+        if max_lat is not None:
+            query = query.where(TrafficData.location_lat <= max_lat)
+        if min_lng is not None:
+            query = query.where(TrafficData.location_lng >= min_lng)
+        if max_lng is not None:
+            query = query.where(TrafficData.location_lng <= max_lng)
+        
+        totals = {}
+        for shard_cells in get_shards().execute(query.group_by(row, col)):
+            for cell_row, cell_col, reading_count, vehicle_sum, speed_sum, high_count in shard_cells:
+                total = totals.setdefault((cell_row, cell_col), [0, 0, 0.0, 0])
+                total[0] += reading_count
+                total[1] += vehicle_sum
+                total[2] += speed_sum
+                total[3] += high_count or 0
+        cells = [
+            (cell_row, cell_col, reading_count, vehicle_sum / reading_count, speed_sum / reading_count, high_count)
+            for (cell_row, cell_col), (reading_count, vehicle_sum, speed_sum, high_count) in sorted(totals.items())
+        ]
+        
+        if columnar.wants_columnar(request):
+            cell_rows, cell_cols, reading_counts, avg_vehicle_counts, avg_speeds, high_counts = \
+                zip(*cells) if cells else ((),) * 6
+            return columnar_response(columnar.encode({
+                'row': np.array(cell_rows, dtype=np.int64),
+                'col': np.array(cell_cols, dtype=np.int64),
+                'reading_count': np.array(reading_counts, dtype=np.int64),
+                'avg_vehicle_count': np.array(avg_vehicle_counts, dtype=np.float64),
+                'avg_speed': np.array(avg_speeds, dtype=np.float64),
+                'high_congestion_count': np.array([count or 0 for count in high_counts], dtype=np.int64)
+            }, meta={
+                'cell_size': cell_size,
+                'window_minutes': window_minutes,
+                'timestamp': datetime.utcnow().isoformat()
+            }))
+        
+        return jsonify({
+            'cell_size': cell_size,
+            'window_minutes': window_minutes,
+            'cells': [{
+                'row': cell_row,
+                'col': cell_col,
+                'reading_count': reading_count,
+                'avg_vehicle_count': avg_vehicle_count,
+                'avg_speed': avg_speed,
+                'high_congestion_count': int(high_count or 0)
+            } for cell_row, cell_col, reading_count, avg_vehicle_count, avg_speed, high_count in cells],
+            'count': len(cells),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@traffic_bp.route('/traffic-data/watermark', methods=['GET'])
+def get_traffic_data_watermark():
+    """Get the newest traffic data id so consumers can detect new readings cheaply"""
+    try:
+        reading_shards = get_shards()
+        max_id = max([rows[0][0] or 0 for rows in reading_shards.execute(db.select(db.func.max(TrafficData.id)))]
+                     + [get_archive().max_id()])
+        # Ids below the oldest pending write are not final until it commits
+        horizon = reading_shards.ids.horizon()
+        if horizon is not None:
+            max_id = min(max_id, horizon - 1)
         
         return jsonify({
-            'data': [data.to_dict() for data in traffic_data],
-            'count': len(traffic_data)
+            'max_id': max_id or 0,
+            'timestamp': datetime.utcnow().isoformat()
         }), 200
         
     except Exception as e:
@@ -79,6 +478,8 @@ def report_incident():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
+        get_event_log()
+        
         incident = TrafficIncident(
             incident_type=data['incident_type'],
             location_lat=data['location_lat'],
@@ -90,9 +491,12 @@ def report_incident():
         db.session.add(incident)
         db.session.commit()
         
+        reported = incident.to_dict()
+        publish_incident(reported)
+        
         return jsonify({
             'message': 'Incident reported successfully',
-            'incident': incident.to_dict()
+            'incident': reported
         }), 201
         
     except Exception as e:
@@ -106,18 +510,34 @@ def get_incidents():
         status = request.args.get('status', 'ACTIVE')
         limit = request.args.get('limit', 50, type=int)
         
-        incidents = TrafficIncident.query.filter(
-            TrafficIncident.status == status
-        ).order_by(TrafficIncident.reported_at.desc()).limit(limit).all()
+        # A new incident or a status change moves one of these
+        cached = http_cache.not_modified(*db.session.query(
+            db.func.max(TrafficIncident.id), db.func.count(TrafficIncident.id)
+        ).filter(TrafficIncident.status == status).one())
+        if cached:
+            return cached
         
-        return jsonify({
-            'incidents': [incident.to_dict() for incident in incidents],
-            'count': len(incidents)
-        }), 200
+        rows = db.session.execute(
+            db.select(*INCIDENT_COLUMNS).where(TrafficIncident.status == status)
+            .order_by(TrafficIncident.reported_at.desc()).limit(limit)
+        ).all()
+        
+        return json_rows.list_response('incidents', rows, INCIDENT_FIELDS, count=len(rows))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# GET /stream and /stream/stats
+init_live_feed(traffic_bp, live_feed)
+
+@traffic_bp.route('/event-log/stats', methods=['GET'])
+def get_event_log_stats():
+    """Get event log offsets and consumer group lag per topic"""
+    try:
+        return jsonify(get_event_log().stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @traffic_bp.route('/simulate-data', methods=['POST'])
 def simulate_traffic_data():
     """Simulate traffic data for testing purposes"""
@@ -133,33 +553,15 @@ def simulate_traffic_data():
             {'sensor_id': 'SENSOR_005', 'lat': 40.6892, 'lng': -74.0445},
         ]
         
-        created_data = []
-        
+        rows = []
         for _ in range(count):
             location = random.choice(sensor_locations)
-            vehicle_count = random.randint(10, 100)
-            average_speed = random.uniform(20, 80)
-            
-            # Determine congestion level
-            congestion_level = 'LOW'
-            if vehicle_count > 50 and average_speed < 30:
-                congestion_level = 'HIGH'
-            elif vehicle_count > 30 or average_speed < 50:
-                congestion_level = 'MEDIUM'
-            
-            traffic_data = TrafficData(
-                sensor_id=location['sensor_id'],
-                location_lat=location['lat'],
-                location_lng=location['lng'],
-                vehicle_count=vehicle_count,
-                average_speed=average_speed,
-                congestion_level=congestion_level
-            )
-            
-            db.session.add(traffic_data)
-            created_data.append(traffic_data.to_dict())
+            rows.append(reading_row(
+                location['sensor_id'], location['lat'], location['lng'],
+                random.randint(10, 100), random.uniform(20, 80)
+            ))
         
-        db.session.commit()
+        created_data = store_readings(rows)
         
         return jsonify({
             'message': f'Successfully created {count} simulated traffic data entries',
@@ -167,5 +569,69 @@ def simulate_traffic_data():
         }), 201
         
     except Exception as e:
-        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@traffic_bp.route('/archive', methods=['GET'])
+def get_archive_stats():
+    """Get archive segments, their size and the last migration"""
+    try:
+        return jsonify(get_archive().stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@traffic_bp.route('/archive/migrate', methods=['POST'])
+def migrate_to_archive():
+    """Move readings older than a number of days to the archive in the background"""
+    try:
+        data = request.get_json(silent=True) or {}
+        older_than_days = data.get('older_than_days', DEFAULT_ARCHIVE_AFTER_DAYS)
+        
+        if not isinstance(older_than_days, (int, float)) or older_than_days < 0:
+            return jsonify({'error': 'older_than_days must be a non-negative number'}), 400
+        
+        # Counted from the start of today, so a daily run archives whole days
+        before = datetime.combine(datetime.utcnow().date(), datetime.min.time()) - timedelta(days=older_than_days)
+        migration = get_archive().start_migration(get_shards(), before)
+        
+        return jsonify({
+            'message': f'Archiving readings older than {before.isoformat()} in the background',
+            'migration': migration
+        }), 202
+        
+    except MaintenanceRunning as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@traffic_bp.route('/shards', methods=['GET'])
+def get_shard_stats():
+    """Get reading shards, their row counts and the routing rules"""
+    try:
+        return jsonify(get_shards().stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@traffic_bp.route('/shards', methods=['POST'])
+def add_shard():
+    """Add a reading shard and rebalance existing readings onto it in the background"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'name' not in data:
+            return jsonify({'error': 'Missing required field: name'}), 400
+        
+        rebalance = get_shards().add_shard(
+            data['name'], data.get('path'), regions=data.get('regions'), sensors=data.get('sensors')
+        )
+        
+        return jsonify({
+            'message': f"Shard '{data['name']}' added, rebalancing in the background",
+            'rebalance': rebalance
+        }), 202
+        
+    except MaintenanceRunning as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
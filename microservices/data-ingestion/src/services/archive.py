@@ -0,0 +1,487 @@
+"""Cold storage of aged readings as compressed per-sensor blocks.
+
+Readings older than a few days are moved out of the shards into segment
+files under the archive directory, one or more per day, named
+``<day>.<min id>-<max id>.tsa``. A segment holds blocks of at most
+BLOCK_ROWS readings of one sensor in time order, followed by a JSON block
+index (sensor, row count, byte range, time and id range per block) and a
+fixed footer pointing at it. Queries read the index and decompress only
+the blocks whose sensor, time and id ranges match.
+
+Columns are encoded Gorilla-style, but with byte-aligned NumPy passes in
+place of bit streams so a block decodes without a Python loop per value:
+
+    id, vehicle_count   delta from the previous value
+    timestamp           delta-of-delta (0 for a regular reporting interval)
+    speed, lat, lng     XOR with the previous float's bits, stored as byte
+                        planes with all-zero planes left out
+    congestion_level    one byte per reading
+
+Integers are zigzagged and stored at the narrowest width (0, 1, 2, 4 or
+8 bytes) that holds the block's largest value, then the whole block is
+zlib-compressed, which squeezes the runs of zero bytes the deltas leave.
+Every value round-trips exactly, floats included.
+
+Migration moves rows shard by shard, oldest day first, one segment of at
+most SEGMENT_ROWS rows at a time: the segment is written and fsynced
+before its rows are deleted from the shard. A crash in between leaves
+the rows in both places; reads drop duplicate ids, and the next run
+archives them again under the same segment name.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import String, cast, func, select
+
+from common.columnar import timestamps_to_micros
+from src.models.traffic_data import TrafficData
+from src.services.shards import MaintenanceRunning
+
+MAGIC = b'TSA1'
+FOOTER = struct.Struct('<QI4s')
+BLOCK_HEADER = struct.Struct('<Iqqq')
+FLOAT_HEADER = struct.Struct('<QB')
+SEGMENT_SUFFIX = '.tsa'
+BLOCK_ROWS = 4096
+SEGMENT_ROWS = 500000
+FETCH_ROWS = 50000
+DELETE_BATCH = 5000
+ZLIB_LEVEL = 6
+INDEX_CACHE_SEGMENTS = 256
+DEFAULT_ARCHIVE_AFTER_DAYS = 3
+EPOCH = datetime(1970, 1, 1)
+
+COLUMNS = ('id', 'sensor_id', 'location_lat', 'location_lng', 'vehicle_count', 'average_speed',
+           'congestion_level', 'timestamp_us')
+
+
+def naive_utc(value):
+    """``value`` as the naive UTC datetime readings are stored with; aware datetimes are converted"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_micros(value):
+    """Epoch microseconds of a datetime, naive ones taken as UTC"""
+    return (naive_utc(value) - EPOCH) // timedelta(microseconds=1)
+
+
+def day_of(micros):
+    return str(np.datetime64(int(micros), 'us').astype('datetime64[D]'))
+
+
+def format_timestamps(micros, style='iso'):
+    """Timestamp strings as ``datetime.isoformat()`` ('iso') or as SQLite stores them ('sql')"""
+    stamps = np.asarray(micros, dtype=np.int64).astype('datetime64[us]')
+    text = np.datetime_as_string(stamps, unit='us')
+    if style == 'sql':
+        return np.char.replace(text, 'T', ' ').tolist()
+    whole = np.asarray(micros) % 1000000 == 0
+    if whole.any():
+        text[whole] = np.datetime_as_string(stamps[whole], unit='s')
+    return text.tolist()
+
+
+def column_rows(columns, fields, timestamp_style='iso'):
+    """Row tuples in ``fields`` order, 'timestamp' formatted like the matching SQL columns"""
+    values = []
+    for field in fields:
+        if field == 'timestamp':
+            values.append(format_timestamps(columns['timestamp_us'], timestamp_style))
+        else:
+            values.append(columns[field].tolist())
+    return list(zip(*values))
+
+
+# Encoding
+
+def _zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def _pack_ints(values):
+    encoded = _zigzag(values)
+    largest = int(encoded.max()) if len(encoded) else 0
+    width = next(width for width in (0, 1, 2, 4, 8) if largest < 1 << (8 * width))
+    if width == 0:
+        return b'\x00'
+    return bytes([width]) + encoded.astype(f'<u{width}').tobytes()
+
+
+def _unpack_ints(data, offset, count):
+    width = data[offset]
+    offset += 1
+    if width == 0:
+        return np.zeros(count, dtype=np.int64), offset
+    values = np.frombuffer(data, dtype=f'<u{width}', count=count, offset=offset).astype(np.uint64)
+    return _unzigzag(values), offset + width * count
+
+
+def _pack_floats(values):
+    bits = np.ascontiguousarray(values, dtype='<f8').view(np.uint64)
+    xored = bits[1:] ^ bits[:-1]
+    planes = xored.view(np.uint8).reshape(-1, 8).T
+    present = planes.any(axis=1)
+    mask = int(np.packbits(present, bitorder='little')[0])
+    return FLOAT_HEADER.pack(int(bits[0]), mask) + planes[present].tobytes()
+
+
+def _unpack_floats(data, offset, count):
+    first, mask = FLOAT_HEADER.unpack_from(data, offset)
+    offset += FLOAT_HEADER.size
+    present = np.unpackbits(np.array([mask], dtype=np.uint8), bitorder='little').astype(bool)
+    planes = np.zeros((8, count - 1), dtype=np.uint8)
+    size = int(present.sum()) * (count - 1)
+    if size:
+        planes[present] = np.frombuffer(data, dtype=np.uint8, count=size, offset=offset).reshape(-1, count - 1)
+    xored = np.r_[np.uint64(first), np.ascontiguousarray(planes.T).view(np.uint64).ravel()]
+    return np.bitwise_xor.accumulate(xored).view(np.float64), offset + size
+
+
+def encode_block(ids, micros, vehicles, speeds, lats, lngs, levels):
+    """Compressed bytes of one sensor's readings in time order"""
+    deltas = np.diff(micros, prepend=micros[0])
+    return zlib.compress(b''.join([
+        BLOCK_HEADER.pack(len(ids), int(ids[0]), int(micros[0]), int(vehicles[0])),
+        _pack_ints(np.diff(ids, prepend=ids[0])),
+        _pack_ints(np.diff(deltas, prepend=0)),
+        _pack_ints(np.diff(vehicles, prepend=vehicles[0])),
+        _pack_floats(speeds),
+        _pack_floats(lats),
+        _pack_floats(lngs),
+        levels.astype(np.uint8).tobytes()
+    ]), ZLIB_LEVEL)
+
+
+def decode_block(payload):
+    """(id, timestamp_us, vehicle_count, average_speed, location_lat, location_lng, level code) arrays"""
+    data = zlib.decompress(payload)
+    count, first_id, first_micros, first_vehicles = BLOCK_HEADER.unpack_from(data)
+    offset = BLOCK_HEADER.size
+    id_deltas, offset = _unpack_ints(data, offset, count)
+    second_deltas, offset = _unpack_ints(data, offset, count)
+    vehicle_deltas, offset = _unpack_ints(data, offset, count)
+    speeds, offset = _unpack_floats(data, offset, count)
+    lats, offset = _unpack_floats(data, offset, count)
+    lngs, offset = _unpack_floats(data, offset, count)
+    levels = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+    return (first_id + np.cumsum(id_deltas), first_micros + np.cumsum(np.cumsum(second_deltas)),
+            first_vehicles + np.cumsum(vehicle_deltas), speeds, lats, lngs, levels)
+
+
+def concat(parts):
+    """One column dict out of several, empty when there are none"""
+    if not parts:
+        return {column: np.zeros(0, dtype=object if column in ('sensor_id', 'congestion_level') else np.int64)
+                for column in COLUMNS}
+    return {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+
+
+def take(columns, index):
+    return {column: values[index] for column, values in columns.items()}
+
+
+class ReadingArchive:
+    """Segment files of archived readings in ``directory``"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._segments = []
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.migration_status = None
+        for name in os.listdir(directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                self._add_segment(name)
+
+    def _add_segment(self, name):
+        day, id_range = name[:-len(SEGMENT_SUFFIX)].split('.')
+        min_id, max_id = (int(value) for value in id_range.split('-'))
+        if (day, min_id, max_id, name) not in self._segments:
+            self._segments.append((day, min_id, max_id, name))
+            self._segments.sort()
+
+    def max_id(self):
+        with self._lock:
+            return max((segment[2] for segment in self._segments), default=0)
+
+    # Writing
+
+    def write_segment(self, columns):
+        """Write one day's readings (column arrays) as a segment file; returns its name"""
+        micros = columns['timestamp_us']
+        day = day_of(micros.min())
+        if day_of(micros.max()) != day:
+            raise ValueError('A segment holds the readings of a single day')
+        sensors, sensor_codes = np.unique(columns['sensor_id'].astype(str), return_inverse=True)
+        levels, level_codes = np.unique(columns['congestion_level'].astype(str), return_inverse=True)
+        order = np.lexsort((micros, sensor_codes))
+        sensor_codes = sensor_codes[order]
+        # Blocks break at each sensor change and every BLOCK_ROWS readings of a sensor
+        run_starts = np.flatnonzero(np.r_[True, sensor_codes[1:] != sensor_codes[:-1]])
+        starts = np.unique(np.concatenate([np.arange(start, end, BLOCK_ROWS) for start, end in
+                                           zip(run_starts, np.r_[run_starts[1:], len(order)])]))
+        ends = np.r_[starts[1:], len(order)]
+
+        ids = columns['id'][order].astype(np.int64)
+        name = f"{day}.{int(ids.min())}-{int(ids.max())}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        index = {'day': day, 'levels': levels.tolist(), 'blocks': []}
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(MAGIC)
+            offset = len(MAGIC)
+            for start, end in zip(starts, ends):
+                block = slice(start, end)
+                block_micros = micros[order[block]].astype(np.int64)
+                payload = encode_block(
+                    ids[block], block_micros, columns['vehicle_count'][order[block]].astype(np.int64),
+                    columns['average_speed'][order[block]], columns['location_lat'][order[block]],
+                    columns['location_lng'][order[block]], level_codes[order[block]]
+                )
+                handle.write(payload)
+                index['blocks'].append({
+                    'sensor_id': str(sensors[sensor_codes[start]]),
+                    'rows': int(end - start),
+                    'offset': offset,
+                    'length': len(payload),
+                    'first_us': int(block_micros[0]),
+                    'last_us': int(block_micros[-1]),
+                    'min_id': int(ids[block].min()),
+                    'max_id': int(ids[block].max())
+                })
+                offset += len(payload)
+            encoded_index = json.dumps(index, separators=(',', ':')).encode()
+            handle.write(encoded_index)
+            handle.write(FOOTER.pack(offset, len(encoded_index), MAGIC))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self._add_segment(name)
+            self._indexes.pop(name, None)
+            self.version += 1
+        return name
+
+    # Reading
+
+    def _index(self, name):
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is not None:
+                self._indexes.move_to_end(name)
+                return index
+        with open(os.path.join(self.directory, name), 'rb') as handle:
+            handle.seek(-FOOTER.size, os.SEEK_END)
+            offset, length, magic = FOOTER.unpack(handle.read(FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{name} is not an archive segment")
+            handle.seek(offset)
+            index = json.loads(handle.read(length))
+        with self._lock:
+            self._indexes[name] = index
+            while len(self._indexes) > INDEX_CACHE_SEGMENTS:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _read(self, name, blocks, levels):
+        """Decoded column dict of the given index blocks of one segment"""
+        parts = []
+        with open(os.path.join(self.directory, name), 'rb') as handle:
+            for block in blocks:
+                handle.seek(block['offset'])
+                ids, micros, vehicles, speeds, lats, lngs, level_codes = decode_block(handle.read(block['length']))
+                parts.append({
+                    'id': ids,
+                    'sensor_id': np.full(len(ids), block['sensor_id'], dtype=object),
+                    'location_lat': lats,
+                    'location_lng': lngs,
+                    'vehicle_count': vehicles,
+                    'average_speed': speeds,
+                    'congestion_level': levels[level_codes],
+                    'timestamp_us': micros
+                })
+        return concat(parts)
+
+    def segment_columns(self, name):
+        """Every reading of a segment"""
+        index = self._index(name)
+        return self._read(name, index['blocks'], np.array(index['levels'], dtype=object))
+
+    def segments(self):
+        with self._lock:
+            return list(self._segments)
+
+    def query(self, sensor_ids=None, since=None, until=None, since_id=None, id_below=None,
+              order='timestamp', limit=None):
+        """Matching readings as a column dict, newest first (order='timestamp') or by id.
+
+        ``since``/``until`` are epoch microseconds, ``until`` and ``id_below``
+        exclusive. At most ``limit`` rows, duplicate ids removed.
+        """
+        segments = self.segments()
+        if since is not None:
+            first_day = day_of(since)
+            segments = [segment for segment in segments if segment[0] >= first_day]
+        if until is not None:
+            last_day = day_of(until - 1)
+            segments = [segment for segment in segments if segment[0] <= last_day]
+        if since_id is not None:
+            segments = [segment for segment in segments if segment[2] > since_id]
+        if id_below is not None:
+            segments = [segment for segment in segments if segment[1] < id_below]
+        if not segments:
+            return concat([])
+        wanted = set(sensor_ids) if sensor_ids else None
+
+        def matches(name):
+            index = self._index(name)
+            blocks = [block for block in index['blocks'] if
+                      (wanted is None or block['sensor_id'] in wanted)
+                      and (since is None or block['last_us'] >= since)
+                      and (until is None or block['first_us'] < until)
+                      and (since_id is None or block['max_id'] > since_id)
+                      and (id_below is None or block['min_id'] < id_below)]
+            if not blocks:
+                return None
+            columns = self._read(name, blocks, np.array(index['levels'], dtype=object))
+            keep = np.ones(len(columns['id']), dtype=bool)
+            if since is not None:
+                keep &= columns['timestamp_us'] >= since
+            if until is not None:
+                keep &= columns['timestamp_us'] < until
+            if since_id is not None:
+                keep &= columns['id'] > since_id
+            if id_below is not None:
+                keep &= columns['id'] < id_below
+            return take(columns, keep)
+
+        parts = []
+        found = 0
+        if order == 'timestamp':
+            # Days never overlap, so once the newer days hold ``limit`` rows older ones cannot contribute
+            for day in sorted({segment[0] for segment in segments}, reverse=True):
+                for segment in segments:
+                    if segment[0] == day:
+                        part = matches(segment[3])
+                        if part is not None:
+                            parts.append(part)
+                            found += len(part['id'])
+                if limit is not None and found >= limit:
+                    break
+            columns = concat(parts)
+            ordered = np.argsort(-columns['timestamp_us'], kind='stable')
+        else:
+            # Segments by first id: stop once ``limit`` rows are below every later segment's ids
+            lowest = np.zeros(0, dtype=np.int64)
+            for _, min_id, _, name in sorted(segments, key=lambda segment: segment[1]):
+                if limit is not None and len(lowest) >= limit and min_id > lowest[limit - 1]:
+                    break
+                part = matches(name)
+                if part is not None:
+                    parts.append(part)
+                    lowest = np.sort(np.concatenate([lowest, part['id']])) if limit is not None else lowest
+            columns = concat(parts)
+            ordered = np.argsort(columns['id'], kind='stable')
+        columns = take(columns, ordered)
+        _, first = np.unique(columns['id'], return_index=True)
+        if len(first) < len(columns['id']):
+            columns = take(columns, np.sort(first))
+        return take(columns, slice(0, limit))
+
+    def stats(self):
+        segments = self.segments()
+        return {
+            'directory': self.directory,
+            'segments': len(segments),
+            'days': len({segment[0] for segment in segments}),
+            'oldest_day': segments[0][0] if segments else None,
+            'newest_day': segments[-1][0] if segments else None,
+            'bytes': sum(os.path.getsize(os.path.join(self.directory, segment[3])) for segment in segments),
+            'max_id': self.max_id(),
+            'migration': self.migration_status
+        }
+
+    # Migration
+
+    def start_migration(self, shard_set, before):
+        """Move readings older than ``before`` out of every shard in the background.
+
+        Raises MaintenanceRunning while a migration or shard rebalance runs,
+        since rows copied to a new shard mid-migration would be archived twice.
+        """
+        shard_set.begin_maintenance('archive migration')
+        with self._lock:
+            self.migration_status = {'status': 'running', 'before': before.isoformat(), 'started_at': time.time(),
+                                     'finished_at': None, 'rows': 0, 'segments': 0, 'error': None}
+        threading.Thread(target=self._migrate, args=(shard_set, before), name='archive-migration',
+                         daemon=True).start()
+        return self.migration_status
+
+    def _migrate(self, shard_set, before):
+        status = self.migration_status
+        try:
+            for shard in list(shard_set.shards.values()):
+                while True:
+                    moved = self.migrate_batch(shard, before)
+                    if not moved:
+                        break
+                    status['rows'] += moved
+                    status['segments'] += 1
+            status['status'] = 'succeeded'
+        except Exception as e:
+            status.update(status='failed', error=str(e))
+        finally:
+            status['finished_at'] = time.time()
+            shard_set.end_maintenance()
+
+    def migrate_batch(self, shard, before):
+        """Archive up to SEGMENT_ROWS of a shard's oldest day before ``before``; returns the rows moved"""
+        table = TrafficData.__table__
+        oldest = shard.execute(select(func.min(table.c.timestamp)).where(table.c.timestamp < before))[0][0]
+        if oldest is None:
+            return 0
+        day_start = datetime.combine(oldest.date(), datetime.min.time())
+        day_end = min(day_start + timedelta(days=1), before)
+        statement = select(
+            table.c.id, table.c.sensor_id, table.c.location_lat, table.c.location_lng, table.c.vehicle_count,
+            table.c.average_speed, table.c.congestion_level, cast(table.c.timestamp, String)
+        ).where(table.c.timestamp >= day_start, table.c.timestamp < day_end).order_by(
+            table.c.timestamp).limit(SEGMENT_ROWS)
+        parts = []
+        with shard.engine.connect() as connection:
+            for chunk in connection.execution_options(yield_per=FETCH_ROWS).execute(statement).partitions():
+                ids, sensor_ids, lats, lngs, vehicles, speeds, levels, stamps = zip(*chunk)
+                parts.append({
+                    'id': np.array(ids, dtype=np.int64),
+                    'sensor_id': np.array(sensor_ids, dtype=object),
+                    'location_lat': np.array(lats, dtype=np.float64),
+                    'location_lng': np.array(lngs, dtype=np.float64),
+                    'vehicle_count': np.array(vehicles, dtype=np.int64),
+                    'average_speed': np.array(speeds, dtype=np.float64),
+                    'congestion_level': np.array(levels, dtype=object),
+                    'timestamp_us': timestamps_to_micros(stamps)
+                })
+        columns = concat(parts)
+        if not len(columns['id']):
+            return 0
+        self.write_segment(columns)
+        ids = columns['id'].tolist()
+        for start in range(0, len(ids), DELETE_BATCH):
+            with shard.write_lock, shard.engine.begin() as connection:
+                connection.execute(table.delete().where(table.c.id.in_(ids[start:start + DELETE_BATCH])))
+        return len(ids)
@@ -0,0 +1,402 @@
+"""Region sharding of traffic readings over several SQLite databases.
+
+Readings are routed to a shard by, in order: an explicit sensor-to-shard
+mapping, the first region bounding box containing the reading, or
+rendezvous hashing of its region grid cell (``cell_size`` degrees) over
+all shard names. Hashing keeps a district on one shard and moves only
+about 1/N of the cells when a shard is added.
+
+Each shard is its own database file with its own engine and writer
+lock, so ingestion into different regions never queues behind one
+SQLite writer. The ``default`` shard is the service database itself,
+which keeps a single-shard deployment exactly as it was.
+
+Ids stay global and increasing: they are allocated in-process before
+the rows are written. ``IdAllocator.horizon`` is the first id of the
+oldest allocation still being written. Id-ordered readers (``since_id``,
+the watermark) stop below it, so they never skip a row that commits late
+on another shard. This assumes one ingestion process.
+
+Reads scatter the same statement to every shard in parallel and merge the
+per-shard results in order. Rows are deduplicated by id, which covers a
+row that is briefly on two shards while it is being moved.
+
+Adding a shard takes effect for new writes immediately: reads already
+cover every shard, so nothing has to stop. A background rebalance then
+moves rows whose owner changed, in id batches, with INSERT OR IGNORE on
+the target before the delete on the source. Rerunning it after a crash
+finishes the job.
+"""
+import contextvars
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from sqlalchemy import create_engine, event, func, select
+
+from src.models.traffic_data import TrafficData
+
+DEFAULT_SHARD = 'default'
+DEFAULT_CELL_SIZE = 0.05
+SHARD_MAP_FILE = 'shards.json'
+REBALANCE_BATCH = 5000
+
+
+def region_cell(lat, lng, cell_size):
+    return math.floor(lat / cell_size), math.floor(lng / cell_size)
+
+
+def rendezvous(key, names):
+    """Name with the highest hash for ``key``; stable as names are added"""
+    return max(names, key=lambda name: hashlib.blake2b(f"{name}|{key}".encode(), digest_size=8).digest())
+
+
+def unique_ids(rows, id_index=0):
+    seen = set()
+    for row in rows:
+        if row[id_index] not in seen:
+            seen.add(row[id_index])
+            yield row
+
+
+class MaintenanceRunning(Exception):
+    """Raised when a shard rebalance or archive migration is already running"""
+
+
+class PartialInsert(Exception):
+    """Raised when a shard write failed after other shards committed theirs; ``rows`` are the committed ones"""
+
+    def __init__(self, rows, error):
+        super().__init__(f"Stored {len(rows)} rows before a shard write failed: {error}")
+        self.rows = rows
+
+
+class ShardMap:
+    """Shards and the rules routing a reading to one of them"""
+
+    def __init__(self, shards=None, cell_size=DEFAULT_CELL_SIZE, regions=None, sensors=None):
+        # name -> database path, None for the service database
+        self.shards = dict(shards or {DEFAULT_SHARD: None})
+        self.cell_size = cell_size
+        # [{'shard': name, 'bbox': [min_lat, min_lng, max_lat, max_lng]}, ...]
+        self.regions = list(regions or [])
+        self.sensors = dict(sensors or {})
+        self._names = sorted(self.shards)
+
+    def owner(self, sensor_id, lat, lng):
+        shard = self.sensors.get(sensor_id)
+        if shard is not None:
+            return shard
+        for region in self.regions:
+            min_lat, min_lng, max_lat, max_lng = region['bbox']
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                return region['shard']
+        row, col = region_cell(lat, lng, self.cell_size)
+        return rendezvous(f"{row},{col}", self._names)
+
+    def validate(self):
+        for region in self.regions:
+            if not isinstance(region, dict) or 'shard' not in region or len(region.get('bbox') or ()) != 4:
+                raise ValueError("Regions need a 'shard' and a 'bbox' of [min_lat, min_lng, max_lat, max_lng]")
+        unknown = {region['shard'] for region in self.regions} | set(self.sensors.values())
+        unknown -= set(self.shards)
+        if unknown:
+            raise ValueError(f"Unknown shards in routing rules: {', '.join(sorted(unknown))}")
+        if self.cell_size <= 0:
+            raise ValueError('cell_size must be positive')
+
+    def to_dict(self):
+        return {'shards': self.shards, 'cell_size': self.cell_size, 'regions': self.regions, 'sensors': self.sensors}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('shards'), data.get('cell_size', DEFAULT_CELL_SIZE), data.get('regions'), data.get('sensors'))
+
+
+class IdAllocator:
+    """Global reading ids handed out before the rows are written to their shards"""
+
+    def __init__(self, next_id=1):
+        self.next_id = next_id
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, count):
+        with self._lock:
+            first = self.next_id
+            self.next_id += count
+            self._pending[first] = count
+            return first
+
+    def peek(self):
+        """The id the next allocation will start at"""
+        with self._lock:
+            return self.next_id
+
+    def advance(self, next_id):
+        """Never hand out ids below ``next_id``, e.g. ones already moved to the archive"""
+        with self._lock:
+            self.next_id = max(self.next_id, next_id)
+
+    def complete(self, first):
+        with self._lock:
+            del self._pending[first]
+
+    def horizon(self):
+        """First id of the oldest allocation not yet written, or None when all are"""
+        with self._lock:
+            return min(self._pending) if self._pending else None
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+class Shard:
+    """One shard database and its writer"""
+
+    def __init__(self, name, path, engine):
+        self.name = name
+        self.path = path
+        self.engine = engine
+        self.write_lock = threading.Lock()
+        self.rows_written = 0
+        self.write_seconds = 0.0
+
+    @classmethod
+    def open(cls, name, path):
+        engine = create_engine(f"sqlite:///{path}", connect_args={'check_same_thread': False})
+        event.listen(engine, 'connect', _sqlite_pragmas)
+        TrafficData.__table__.create(engine, checkfirst=True)
+        return cls(name, path, engine)
+
+    def insert(self, rows, ignore_existing=False):
+        statement = TrafficData.__table__.insert()
+        if ignore_existing:
+            statement = statement.prefix_with('OR IGNORE')
+        started = time.perf_counter()
+        with self.write_lock, self.engine.begin() as connection:
+            connection.execute(statement, rows)
+        self.write_seconds += time.perf_counter() - started
+        self.rows_written += len(rows)
+
+    def execute(self, statement):
+        with self.engine.connect() as connection:
+            return connection.execute(statement).all()
+
+
+class ShardSet:
+    """All shards of the readings table, routing writes and scattering reads"""
+
+    def __init__(self, shard_map, default_engine, directory):
+        shard_map.validate()
+        self.map = shard_map
+        self.directory = directory
+        self.shards = {}
+        for name, path in shard_map.shards.items():
+            self.shards[name] = Shard(name, None, default_engine) if path is None else Shard.open(name, path)
+        self.read_workers = max(4, len(self.shards))
+        self._pool = ThreadPoolExecutor(max_workers=self.read_workers, thread_name_prefix='shard-read')
+        self._admin_lock = threading.Lock()
+        self.rebalance_status = None
+        # The background job moving rows between shards or out of them, one at a time
+        self.maintenance = None
+        self._maintenance_lock = threading.Lock()
+        max_ids = self.scatter(lambda shard: shard.execute(select(TrafficData.__table__.c.id).order_by(
+            TrafficData.__table__.c.id.desc()).limit(1)))
+        self.ids = IdAllocator(max((rows[0][0] for rows in max_ids if rows), default=0) + 1)
+
+    @classmethod
+    def load(cls, directory, default_engine):
+        """Shards from ``directory``/shards.json, or just the service database"""
+        path = os.path.join(directory, SHARD_MAP_FILE)
+        shard_map = ShardMap()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as handle:
+                shard_map = ShardMap.from_dict(json.load(handle))
+        return cls(shard_map, default_engine, directory)
+
+    def save_map(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, SHARD_MAP_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(self.map.to_dict(), handle, indent=2)
+        os.replace(path + '.tmp', path)
+
+    # Writes
+
+    def insert(self, rows):
+        """Assign global ids to row dicts (in place) and write each to its shard.
+
+        Shards commit separately, so if one fails after others committed,
+        PartialInsert carries the rows that were stored.
+        """
+        if not rows:
+            return rows
+        first = self.ids.allocate(len(rows))
+        try:
+            shard_map = self.map
+            by_shard = {}
+            for offset, row in enumerate(rows):
+                row['id'] = first + offset
+                by_shard.setdefault(shard_map.owner(row['sensor_id'], row['location_lat'], row['location_lng']),
+                                    []).append(row)
+            committed = []
+            for name, shard_rows in by_shard.items():
+                try:
+                    self.shards[name].insert(shard_rows)
+                except Exception as e:
+                    if committed:
+                        raise PartialInsert(committed, e) from e
+                    raise
+                committed += shard_rows
+        finally:
+            self.ids.complete(first)
+        return rows
+
+    # Reads
+
+    def scatter(self, query):
+        """``query(shard)`` on every shard in parallel; results in shard order"""
+        shards = list(self.shards.values())
+        if len(shards) == 1:
+            return [query(shards[0])]
+        # Each task runs in a copy of the caller's context, so per-request
+        # instrumentation (common.metrics) still sees the shard queries
+        contexts = [contextvars.copy_context() for _ in shards]
+        return list(self._pool.map(lambda context, shard: context.run(query, shard), contexts, shards))
+
+    def execute(self, statement):
+        """Rows of ``statement`` from every shard, one list per shard"""
+        return self.scatter(lambda shard: shard.execute(statement))
+
+    @staticmethod
+    def merge(results, key, reverse=False, limit=None, id_index=0):
+        """Merge per-shard results sorted by ``key`` into one list, dropping duplicate ids"""
+        # A negative limit means no limit, as for SQLite's LIMIT
+        limit = None if limit is not None and limit < 0 else limit
+        if len(results) == 1:
+            return list(islice(results[0], limit))
+        return list(islice(unique_ids(heapq.merge(*results, key=key, reverse=reverse), id_index), limit))
+
+    def stream(self, statement, key, reverse=False, limit=None, id_index=0, batch_rows=1000, extra=()):
+        """Like ``merge(execute(statement))``, reading each shard's cursor in batches as the result is consumed.
+
+        ``extra`` are further sorted row sequences merged in, e.g. archived readings.
+        """
+        def shard_rows(shard):
+            with shard.engine.connect() as connection:
+                yield from connection.execution_options(yield_per=batch_rows).execute(statement)
+        sources = [shard_rows(shard) for shard in self.shards.values()] + list(extra)
+        rows = heapq.merge(*sources, key=key, reverse=reverse)
+        return islice(unique_ids(rows, id_index), None if limit is not None and limit < 0 else limit)
+
+    def stats(self):
+        table = TrafficData.__table__
+        counts = self.scatter(lambda shard: shard.execute(select(func.count(table.c.id)))[0][0])
+        return {
+            'cell_size': self.map.cell_size,
+            'next_id': self.ids.peek(),
+            'shards': {shard.name: {
+                'path': shard.path,
+                'rows': rows,
+                'rows_written': shard.rows_written,
+                'write_seconds': round(shard.write_seconds, 3)
+            } for shard, rows in zip(self.shards.values(), counts)},
+            'regions': self.map.regions,
+            'sensors': len(self.map.sensors),
+            'rebalance': self.rebalance_status
+        }
+
+    # Adding shards
+
+    def add_shard(self, name, path=None, regions=None, sensors=None):
+        """Add a shard and start moving the rows it now owns to it in the background"""
+        with self._admin_lock:
+            if name in self.shards:
+                raise ValueError(f"Shard '{name}' already exists")
+            path = path or os.path.join(self.directory, f"traffic_{name}.db")
+            shard_map = ShardMap(dict(self.map.shards, **{name: path}), self.map.cell_size,
+                                 self.map.regions + list(regions or []), dict(self.map.sensors, **(sensors or {})))
+            shard_map.validate()
+            self.begin_maintenance('shard rebalance')
+            try:
+                shard = Shard.open(name, path)
+            except Exception:
+                self.end_maintenance()
+                raise
+            # Reads must see the new shard before any write is routed to it
+            self.shards = dict(self.shards, **{name: shard})
+            self.map = shard_map
+            self.save_map()
+            if self.read_workers < len(self.shards):
+                self.read_workers = len(self.shards)
+                pool, self._pool = self._pool, ThreadPoolExecutor(max_workers=self.read_workers,
+                                                                  thread_name_prefix='shard-read')
+                pool.shutdown(wait=False)
+            return self.start_rebalance()
+
+    def begin_maintenance(self, job):
+        """Claim the shards for ``job``, or raise MaintenanceRunning while another job has them"""
+        with self._maintenance_lock:
+            if self.maintenance is not None:
+                raise MaintenanceRunning(f"{self.maintenance.capitalize()} is already running")
+            self.maintenance = job
+
+    def end_maintenance(self):
+        self.maintenance = None
+
+    def start_rebalance(self):
+        """Move rows to the shards that now own them; the caller holds begin_maintenance"""
+        # Writes routed by the previous map all have ids below this
+        routed_before = self.ids.peek()
+        self.rebalance_status = {'status': 'running', 'started_at': time.time(), 'finished_at': None,
+                                 'scanned': 0, 'moved': 0, 'error': None}
+        threading.Thread(target=self._rebalance, args=(routed_before,), name='shard-rebalance', daemon=True).start()
+        return self.rebalance_status
+
+    def _rebalance(self, routed_before):
+        status = self.rebalance_status
+        try:
+            while (self.ids.horizon() or routed_before) < routed_before:
+                time.sleep(0.01)
+            table = TrafficData.__table__
+            for shard in list(self.shards.values()):
+                last_id = 0
+                while True:
+                    rows = shard.execute(select(table.c.id, table.c.sensor_id, table.c.location_lat, table.c.location_lng)
+                                         .where(table.c.id > last_id).order_by(table.c.id).limit(REBALANCE_BATCH))
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    moves = {}
+                    for row_id, sensor_id, lat, lng in rows:
+                        owner = self.map.owner(sensor_id, lat, lng)
+                        if owner != shard.name:
+                            moves.setdefault(owner, []).append(row_id)
+                    for owner, ids in moves.items():
+                        self._move(shard, self.shards[owner], ids)
+                        status['moved'] += len(ids)
+                    status['scanned'] += len(rows)
+            status['status'] = 'succeeded'
+        except Exception as e:
+            status.update(status='failed', error=str(e))
+        finally:
+            status['finished_at'] = time.time()
+            self.end_maintenance()
+
+    def _move(self, source, target, ids):
+        table = TrafficData.__table__
+        rows = [dict(row._mapping) for row in source.execute(select(table).where(table.c.id.in_(ids)))]
+        target.insert(rows, ignore_existing=True)
+        with source.write_lock, source.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.id.in_(ids)))
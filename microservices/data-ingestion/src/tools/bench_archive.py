@@ -0,0 +1,154 @@
+"""Benchmark the cold-storage archive: compression ratio and decode throughput.
+
+Seeds a throwaway database with several days of readings shaped like
+real sensor feeds (fixed positions, a regular reporting interval with a
+little clock jitter, speeds to 0.1 km/h, vehicle counts drifting), then
+archives all of it and reports:
+
+    sqlite_bytes      database file size holding the readings (with indexes)
+    archive_bytes     total size of the segment files
+    ratio             sqlite_bytes / archive_bytes
+    raw_ratio         fixed-width column bytes (8 per number, 1 per level,
+                      the sensor id string) / archive_bytes
+    decode            rows/s decoding every segment back to columns
+    sensor_day_query  ms to read one sensor's day through ReadingArchive.query
+
+Every archived value is checked against the database.
+
+Usage (from the data-ingestion directory):
+
+    python -m src.tools.bench_archive --sensors 100 --days 3 --interval 60
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import numpy as np
+from sqlalchemy import String, cast, create_engine, select
+
+from src.models.traffic_data import TrafficData
+from src.routes.traffic import congestion_level
+from src.services.archive import ReadingArchive, concat, to_micros
+from src.services.shards import Shard
+
+INSERT_BATCH = 50000
+
+
+def seed(engine, sensors, days, interval, seed_value):
+    rng = random.Random(seed_value)
+    start = datetime.combine(datetime.utcnow().date(), datetime.min.time()) - timedelta(days=days + 1)
+    steps = int(days * 86400 / interval)
+    batch = []
+    table = TrafficData.__table__
+    for sensor in range(sensors):
+        lat = 40.6 + rng.uniform(0, 0.2)
+        lng = -74.1 + rng.uniform(0, 0.4)
+        vehicles = rng.randint(5, 60)
+        for step in range(steps):
+            vehicles = max(0, vehicles + rng.randint(-3, 3))
+            speed = round(max(3.0, 70 - vehicles * 0.8 + rng.uniform(-5, 5)), 1)
+            batch.append({
+                'sensor_id': f"SENSOR_{sensor:04d}",
+                'location_lat': lat,
+                'location_lng': lng,
+                'vehicle_count': vehicles,
+                'average_speed': speed,
+                'congestion_level': congestion_level(vehicles, speed),
+                'timestamp': start + timedelta(seconds=step * interval, milliseconds=rng.randint(0, 50))
+            })
+            if len(batch) >= INSERT_BATCH:
+                with engine.begin() as connection:
+                    connection.execute(table.insert(), batch)
+                batch = []
+    if batch:
+        with engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+    return sensors * steps, start
+
+
+def expected_columns(engine):
+    table = TrafficData.__table__
+    with engine.connect() as connection:
+        rows = connection.execute(select(
+            table.c.id, table.c.vehicle_count, table.c.average_speed, table.c.location_lat, table.c.location_lng,
+            table.c.congestion_level, table.c.sensor_id, cast(table.c.timestamp, String)
+        ).order_by(table.c.id)).all()
+    ids, vehicles, speeds, lats, lngs, levels, sensor_ids, stamps = zip(*rows)
+    return {
+        'id': np.array(ids), 'vehicle_count': np.array(vehicles), 'average_speed': np.array(speeds),
+        'location_lat': np.array(lats), 'location_lng': np.array(lngs), 'congestion_level': np.array(levels),
+        'sensor_id': np.array(sensor_ids), 'timestamp_us': np.array(stamps, dtype='datetime64[us]').astype(np.int64)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--interval', type=float, default=60, help='seconds between readings of a sensor')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, 'bench.db')
+        engine = create_engine(f"sqlite:///{database_path}")
+        TrafficData.__table__.create(engine)
+        rows, start = seed(engine, args.sensors, args.days, args.interval, args.seed)
+        expected = expected_columns(engine)
+        sqlite_bytes = os.path.getsize(database_path)
+
+        archive = ReadingArchive(os.path.join(tmp, 'archive'))
+        shard = Shard('default', database_path, engine)
+        before = start + timedelta(days=args.days + 1)
+        started = time.perf_counter()
+        moved = 0
+        while True:
+            batch = archive.migrate_batch(shard, before)
+            if not batch:
+                break
+            moved += batch
+        migrate_seconds = time.perf_counter() - started
+        if moved != rows:
+            raise SystemExit(f"Archived {moved} of {rows} rows")
+        segments = archive.segments()
+        archive_bytes = sum(os.path.getsize(os.path.join(archive.directory, segment[3])) for segment in segments)
+
+        started = time.perf_counter()
+        decoded = concat([archive.segment_columns(segment[3]) for segment in segments])
+        decode_seconds = time.perf_counter() - started
+        order = np.argsort(decoded['id'])
+        for column, values in expected.items():
+            if not np.array_equal(decoded[column][order].astype(values.dtype), values):
+                raise SystemExit(f"Archived column {column} differs from the database")
+
+        day = start + timedelta(days=1)
+        started = time.perf_counter()
+        day_rows = len(archive.query(['SENSOR_0000'], to_micros(day), to_micros(day + timedelta(days=1)))['id'])
+        query_seconds = time.perf_counter() - started
+
+        raw_bytes = rows * (8 * 6 + 1) + sum(len(sensor_id) for sensor_id in expected['sensor_id'])
+        report = {
+            'rows': rows,
+            'segments': len(segments),
+            'sqlite_bytes': sqlite_bytes,
+            'archive_bytes': archive_bytes,
+            'bytes_per_row': {'sqlite': round(sqlite_bytes / rows, 1), 'archive': round(archive_bytes / rows, 2)},
+            'ratio': round(sqlite_bytes / archive_bytes, 1),
+            'raw_ratio': round(raw_bytes / archive_bytes, 1),
+            'migrate_rows_per_second': round(rows / migrate_seconds),
+            'decode_rows_per_second': round(rows / decode_seconds),
+            'sensor_day_query': {'rows': day_rows, 'ms': round(query_seconds * 1000, 1)}
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark the Core/chunked JSON list endpoints against the ORM path.
+
+Seeds a throwaway database with readings and incidents, then times
+GET /api/traffic-data and /api/incidents at the given limit next to the
+previous implementation (ORM instances, to_dict() per row, jsonify),
+served from a baseline blueprint. Response bodies must be identical.
+
+Usage (from the data-ingestion directory):
+
+    python -m src.tools.bench_list_endpoints --limit 10000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from flask import Blueprint, jsonify, request
+from src.models.traffic_data import db, TrafficData, TrafficIncident
+from src.tools.bench_wire_format import make_app, seed
+
+baseline_bp = Blueprint('baseline', __name__)
+
+
+@baseline_bp.route('/traffic-data', methods=['GET'])
+def baseline_traffic_data():
+    limit = request.args.get('limit', 100, type=int)
+    traffic_data = TrafficData.query.order_by(TrafficData.timestamp.desc()).limit(limit).all()
+    return jsonify({
+        'data': [data.to_dict() for data in traffic_data],
+        'count': len(traffic_data)
+    }), 200
+
+
+@baseline_bp.route('/incidents', methods=['GET'])
+def baseline_incidents():
+    limit = request.args.get('limit', 50, type=int)
+    incidents = TrafficIncident.query.filter(
+        TrafficIncident.status == 'ACTIVE'
+    ).order_by(TrafficIncident.reported_at.desc()).limit(limit).all()
+    return jsonify({
+        'incidents': [incident.to_dict() for incident in incidents],
+        'count': len(incidents)
+    }), 200
+
+
+def seed_incidents(count, seed_value):
+    rng = random.Random(seed_value)
+    # Whole seconds exercise isoformat() dropping a zero microsecond part
+    now = datetime.utcnow().replace(microsecond=0)
+    db.session.execute(TrafficIncident.__table__.insert(), [{
+        'incident_type': rng.choice(['ACCIDENT', 'CONSTRUCTION', 'WEATHER']),
+        'location_lat': 40.7 + rng.uniform(-0.1, 0.1),
+        'location_lng': -73.9 + rng.uniform(-0.2, 0.2),
+        'severity': rng.choice(['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']),
+        'description': rng.choice([None, 'Lane blocked "northbound"', 'Chaussée glissante — verglas']),
+        'status': 'ACTIVE',
+        'reported_at': now - timedelta(seconds=i, microseconds=rng.choice([0, 250000])),
+        'resolved_at': rng.choice([None, now])
+    } for i in range(count)])
+    db.session.commit()
+
+
+def timed(client, path, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        body = response.get_data()
+        best = min(best, time.perf_counter() - started)
+        if response.status_code != 200:
+            raise SystemExit(body)
+    return best, body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--limit', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    report = {'limit': args.limit, 'endpoints': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        app.register_blueprint(baseline_bp, url_prefix='/baseline')
+        with app.app_context():
+            db.create_all()
+            seed(args.limit, args.seed)
+            seed_incidents(args.limit, args.seed)
+        client = app.test_client()
+
+        for path in (f"/traffic-data?limit={args.limit}", f"/incidents?limit={args.limit}"):
+            orm_seconds, orm_body = timed(client, '/baseline' + path, args.repeat)
+            core_seconds, core_body = timed(client, '/api' + path, args.repeat)
+            if orm_body != core_body:
+                raise SystemExit(f"{path}: response bodies differ")
+            report['endpoints'][path.split('?')[0]] = {
+                'bytes': len(core_body),
+                'orm_ms': round(orm_seconds * 1000, 1),
+                'core_ms': round(core_seconds * 1000, 1),
+                'speedup': round(orm_seconds / core_seconds, 1)
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
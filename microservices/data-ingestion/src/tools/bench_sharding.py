@@ -0,0 +1,112 @@
+"""Benchmark reading ingest throughput against the number of region shards.
+
+For each shard count, a throwaway ShardSet with that many SQLite shard
+files is fed the same readings from several writer threads through
+ShardSet.insert, the path POST /traffic-data and /traffic-data/bulk
+take. Each batch comes from the sensors of one district, the way a
+district gateway posts them, so with more shards concurrent batches
+mostly land on different writers instead of queueing behind one.
+
+The report gives rows/s per shard count, the speedup over one shard and
+how evenly the readings spread. Throughput is bounded by the disk's
+fsync rate and by CPU; on a single core the gain comes from overlapping
+commits, not from parallel inserts.
+
+Usage (from the data-ingestion directory):
+
+    python -m src.tools.bench_sharding --rows 200000 --shards 1 2 4 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from src.routes.traffic import reading_row
+from src.services.shards import ShardMap, ShardSet
+
+DISTRICTS = 64
+SENSORS_PER_DISTRICT = 20
+CELL_SIZE = 0.025
+
+
+def make_batches(rows, batch_rows, seed_value):
+    """Batches of reading rows, each from the sensors of one district"""
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    districts = [(40.6 + (index // 8) * CELL_SIZE, -74.1 + (index % 8) * CELL_SIZE) for index in range(DISTRICTS)]
+    batches = []
+    for start in range(0, rows, batch_rows):
+        district = rng.randrange(DISTRICTS)
+        lat, lng = districts[district]
+        batches.append([reading_row(
+            f"SENSOR_{district:02d}_{rng.randrange(SENSORS_PER_DISTRICT):02d}",
+            lat + rng.uniform(0, CELL_SIZE), lng + rng.uniform(0, CELL_SIZE),
+            rng.randint(0, 100), rng.uniform(5, 80), now - timedelta(seconds=start + offset)
+        ) for offset in range(min(batch_rows, rows - start))])
+    return batches
+
+
+def run(shard_count, batches, threads, directory):
+    shard_map = ShardMap({f"shard_{index}": os.path.join(directory, f"shard_{index}.db")
+                          for index in range(shard_count)}, cell_size=CELL_SIZE)
+    shard_set = ShardSet(shard_map, None, directory)
+    remaining = iter([[dict(row) for row in batch] for batch in batches])
+    lock = threading.Lock()
+
+    def writer():
+        while True:
+            with lock:
+                batch = next(remaining, None)
+            if batch is None:
+                return
+            shard_set.insert(batch)
+
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+
+    rows = sum(len(batch) for batch in batches)
+    per_shard = [shard['rows'] for shard in shard_set.stats()['shards'].values()]
+    if sum(per_shard) != rows:
+        raise SystemExit(f"{shard_count} shards: stored {sum(per_shard)} of {rows} rows")
+    return {
+        'seconds': round(seconds, 2),
+        'rows_per_second': round(rows / seconds),
+        'largest_shard_share': round(max(per_shard) / rows, 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-rows', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    batches = make_batches(args.rows, args.batch_rows, args.seed)
+    report = {'rows': args.rows, 'batch_rows': args.batch_rows, 'threads': args.threads, 'shards': {}}
+    for shard_count in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            report['shards'][shard_count] = run(shard_count, batches, args.threads, tmp)
+    baseline = report['shards'][args.shards[0]]['rows_per_second']
+    for result in report['shards'].values():
+        result['speedup'] = round(result['rows_per_second'] / baseline, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark peak memory of buffered JSON vs streamed NDJSON reads.
+
+Seeds a throwaway database, then for each mode serves one
+GET /api/traffic-data?limit=N from a fresh server process and consumes
+it from a fresh client process. The client folds every reading into
+per-sensor running aggregates (common.running_stats), the way
+traffic-analysis does:
+
+    json    response.json()['data'], then aggregate the list
+    ndjson  ndjson.iter_records() fed straight into the aggregates
+
+Each process reports its baseline (after imports) and peak RSS, so the
+growth attributable to the request is visible on both sides.
+
+Usage (from the data-ingestion directory):
+
+    python -m src.tools.bench_streaming --rows 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import requests
+
+from common import ndjson
+from common.running_stats import aggregate_by
+
+MODES = ('json', 'ndjson')
+
+
+def peak_rss_mb():
+    # ru_maxrss carries over the forking parent's peak, VmHWM starts afresh at exec
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def serve_one(database_path):
+    """Serve a single request, then report this process's memory"""
+    from werkzeug.serving import make_server
+    from src.tools.bench_wire_format import make_app
+
+    app = make_app(database_path)
+    server = make_server('127.0.0.1', 0, app)
+    baseline = peak_rss_mb()
+    print(server.server_port, flush=True)
+    server.handle_request()
+    print(json.dumps({'baseline_rss_mb': baseline, 'peak_rss_mb': peak_rss_mb()}), flush=True)
+
+
+def consume(mode, url):
+    """Aggregate every reading from ``url`` and report memory and timing"""
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    if mode == 'json':
+        response = requests.get(url, headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        readings = response.json()['data']
+    else:
+        readings = ndjson.iter_records(requests, url)
+    sensors = aggregate_by(readings, key=lambda reading: reading['sensor_id'])
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak_rss_mb(),
+        'seconds': round(elapsed, 2),
+        'sensors': len(sensors),
+        'readings': sum(stats.vehicle_count.count for stats in sensors.values()),
+        'vehicle_total': sum(stats.vehicle_count.total for stats in sensors.values())
+    }), flush=True)
+
+
+def run_mode(mode, database_path, rows):
+    command = [sys.executable, '-m', 'src.tools.bench_streaming']
+    server = subprocess.Popen(command + ['--serve', database_path], stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(server.stdout.readline())
+        url = f"http://127.0.0.1:{port}/api/traffic-data?limit={rows}"
+        client = subprocess.run(command + ['--consume', mode, url], stdout=subprocess.PIPE, text=True, check=True)
+        server_report = json.loads(server.stdout.readline())
+    finally:
+        server.wait(timeout=60)
+    return {'server': server_report, 'client': json.loads(client.stdout)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--serve', metavar='DATABASE', help=argparse.SUPPRESS)
+    parser.add_argument('--consume', nargs=2, metavar=('MODE', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve_one(args.serve)
+    if args.consume:
+        return consume(*args.consume)
+
+    from src.models.traffic_data import db
+    from src.tools.bench_wire_format import make_app, seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, 'bench.db')
+        with make_app(database_path).app_context():
+            db.create_all()
+            seed(args.rows, args.seed)
+        report = {'rows': args.rows}
+        for mode in args.modes:
+            report[mode] = run_mode(mode, database_path, args.rows)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark the JSON and columnar wire formats of GET /api/traffic-data.
+
+Seeds a throwaway database with readings, then for each row count
+fetches them through the test client in both formats and decodes them
+into NumPy arrays the way a consuming service would: json.loads plus a
+per-column list comprehension for JSON, columnar.decode for the binary
+format. Reports payload bytes, server time and client decode time.
+
+Usage (from the data-ingestion directory):
+
+    python -m src.tools.bench_wire_format --rows 10000 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from flask import Flask
+from common import columnar
+from common.event_log import MemoryEventLog
+from src.models.traffic_data import db, TrafficData
+from src.routes.traffic import traffic_bp
+
+SENSORS = 500
+LEVELS = ['LOW', 'MEDIUM', 'HIGH']
+
+
+def make_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{database_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['EVENT_LOG'] = MemoryEventLog()
+    db.init_app(app)
+    app.register_blueprint(traffic_bp, url_prefix='/api')
+    return app
+
+
+def seed(rows, seed_value, batch_rows=100000):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    for start in range(0, rows, batch_rows):
+        db.session.execute(TrafficData.__table__.insert(), [{
+            'sensor_id': f"SENSOR_{rng.randrange(SENSORS):04d}",
+            'location_lat': 40.7 + rng.uniform(-0.1, 0.1),
+            'location_lng': -73.9 + rng.uniform(-0.2, 0.2),
+            'vehicle_count': rng.randint(0, 100),
+            'average_speed': rng.uniform(5, 80),
+            'congestion_level': rng.choice(LEVELS),
+            'timestamp': now - timedelta(seconds=i)
+        } for i in range(start, min(start + batch_rows, rows))])
+        db.session.commit()
+
+
+def decode_json(payload):
+    readings = json.loads(payload)['data']
+    return {
+        'id': np.array([reading['id'] for reading in readings], dtype=np.int64),
+        'sensor_id': np.array([reading['sensor_id'] for reading in readings]),
+        'location_lat': np.array([reading['location_lat'] for reading in readings], dtype=np.float64),
+        'location_lng': np.array([reading['location_lng'] for reading in readings], dtype=np.float64),
+        'vehicle_count': np.array([reading['vehicle_count'] for reading in readings], dtype=np.int32),
+        'average_speed': np.array([reading['average_speed'] for reading in readings], dtype=np.float64),
+        'congestion_level': np.array([reading['congestion_level'] for reading in readings]),
+        'timestamp': np.array([reading['timestamp'] for reading in readings], dtype='datetime64[us]')
+    }
+
+
+def decode_columnar(payload):
+    frame = columnar.decode(payload)
+    columns = dict(frame.columns)
+    columns['sensor_id'] = frame.strings('sensor_id')
+    columns['congestion_level'] = frame.strings('congestion_level')
+    columns['timestamp'] = frame.datetimes('timestamp_us')
+    return columns
+
+
+def timed_get(client, path, headers, decode, repeat):
+    best_server = best_decode = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        best_server = min(best_server, time.perf_counter() - started)
+        if response.status_code != 200:
+            raise SystemExit(response.get_data(as_text=True))
+        payload = response.get_data()
+        started = time.perf_counter()
+        columns = decode(payload)
+        best_decode = min(best_decode, time.perf_counter() - started)
+    return {
+        'bytes': len(payload),
+        'server_ms': round(best_server * 1000, 1),
+        'decode_ms': round(best_decode * 1000, 1)
+    }, columns
+
+
+def run_rows(rows, repeat, seed_value):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            seed(rows, seed_value)
+        client = app.test_client()
+        path = f"/api/traffic-data?limit={rows}"
+
+        as_json, json_columns = timed_get(client, path, {'Accept': 'application/json'}, decode_json, repeat)
+        as_columnar, columnar_columns = timed_get(client, path, {'Accept': columnar.MEDIA_TYPE}, decode_columnar, repeat)
+
+    # Both formats must carry the same readings
+    for name, values in json_columns.items():
+        if not np.array_equal(values, columnar_columns[name]):
+            raise SystemExit(f"Column {name} differs between formats")
+
+    return {
+        'rows': rows,
+        'json': as_json,
+        'columnar': as_columnar,
+        'size_ratio': round(as_json['bytes'] / as_columnar['bytes'], 1),
+        'end_to_end_speedup': round((as_json['server_ms'] + as_json['decode_ms']) /
+                                    (as_columnar['server_ms'] + as_columnar['decode_ms']), 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+    print(json.dumps([run_rows(rows, args.repeat, args.seed) for rows in args.rows], indent=2))
+
+
+if __name__ == '__main__':
+    main()
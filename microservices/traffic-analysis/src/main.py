@@ -1,17 +1,25 @@
+import multiprocessing
 import os
 import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Modules shared between the services, e.g. the ingestion event log
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from common import metrics, profiling
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.analysis import analysis_bp
+from src.routes.analysis import analysis_bp, get_reading_window, reading_tiles, tile_cache, slice_cache
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 CORS(app)
+# Prometheus metrics of every request, SQL statement and registered buffer, at /metrics
+metrics.init_app(app)
+# Slow-request stack samples and on-demand cProfile captures, at /admin/profiles
+profiling.init_app(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(analysis_bp, url_prefix='/api')
@@ -20,8 +28,18 @@ app.register_blueprint(analysis_bp, url_prefix='/api')
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
-with app.app_context():
-    db.create_all()
+# Analysis job worker processes import this script too; only the service starts up
+if multiprocessing.current_process().name == 'MainProcess':
+    with app.app_context():
+        db.create_all()
+        # Replay recent readings from the ingestion event log and keep following it
+        get_reading_window()
+
+metrics.register_stats('reading_window', lambda: get_reading_window().stats())
+metrics.register_stats('live_tiles', reading_tiles.stats)
+metrics.register_stats('tile_cache', tile_cache.stats)
+metrics.register_stats('tile_slice_cache', slice_cache.stats)
+metrics.register_stats('request_profiler', profiling.profiler.stats)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -1,83 +1,85 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app
+import numpy as np
+import os
 import requests
 import statistics
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
 import json
+from common.event_log import FileEventLog
+from common.reading_window import ReadingWindow, reading_time
+from common.running_stats import aggregate_by
+from common import columnar, http_cache, metrics
+from src.services.downsample import METHODS, downsample, group_series
+from src.services.job_manager import JobManager, JobQueueFull, STATUSES, FINISHED
+from src.services.long_window import impact_score, location_key, summarize_hotspots, summarize_patterns
+from src.services.tiles import ReadingTiles, ResponseCache, TileSet, TILE_CELLS, valid_tile
 
 analysis_bp = Blueprint('analysis', __name__)
 
-# Configuration for data ingestion service
+# Readings older than the in-memory window are read from data-ingestion
 DATA_INGESTION_URL = "http://localhost:5000/api"
+# ETags from the reading window version and gzip/brotli for large JSON bodies
+analysis_bp.after_request(http_cache.finalize_response)
+
+# Readings and incidents are kept in memory from the ingestion event log
+# instead of being re-fetched from data-ingestion on every request. Tests can
+# set the EVENT_LOG app config key to a MemoryEventLog.
+READING_WINDOW_SECONDS = 3600
+reading_window = ReadingWindow(READING_WINDOW_SECONDS)
+_reading_window_init_lock = threading.Lock()
+# Heatmap tiles of the reading window, updated as readings arrive and expire
+reading_tiles = ReadingTiles()
+
+def get_reading_window():
+    """The reading window, replayed from the event log and following it"""
+    if reading_window.subscriber is None:
+        with _reading_window_init_lock:
+            if reading_window.subscriber is None:
+                reading_window.add_observer(reading_tiles)
+                reading_window.follow(get_event_log(), 'traffic-analysis')
+    return reading_window
+
+def get_event_log():
+    return current_app.config.get('EVENT_LOG') or FileEventLog(current_app.config.get('EVENT_LOG_DIR'))
+
+def window_seconds():
+    """?window_minutes= in seconds, or None for the whole window"""
+    window_minutes = request.args.get('window_minutes', type=float)
+    return window_minutes * 60 if window_minutes else None
+
+def window_readings():
+    """Readings from the last ?window_minutes= (default: the whole window), newest first"""
+    return get_reading_window().readings(since_seconds=window_seconds())
+
+def window_not_modified():
+    """A 304 if the readings of ?window_minutes= and the incidents are unchanged since the client's ETag"""
+    seconds = window_seconds()
+    watermark = get_reading_window().watermark(seconds)
+    return http_cache.not_modified(seconds, *watermark) if seconds else http_cache.not_modified(watermark)
 
 @analysis_bp.route('/traffic-patterns', methods=['GET'])
 def analyze_traffic_patterns():
     """Analyze traffic patterns from ingested data"""
     try:
-        # Get traffic data from data ingestion service
-        response = requests.get(f"{DATA_INGESTION_URL}/traffic-data?limit=100")
+        cached = window_not_modified()
+        if cached:
+            return cached
         
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch traffic data'}), 500
-        
-        traffic_data = response.json()['data']
+        # Get traffic data from the in-memory window
+        traffic_data = window_readings()
         
         if not traffic_data:
             return jsonify({'message': 'No traffic data available for analysis'}), 200
         
-        # Analyze patterns by sensor
-        sensor_analysis = {}
-        congestion_summary = {'LOW': 0, 'MEDIUM': 0, 'HIGH': 0}
-        
-        for data in traffic_data:
-            sensor_id = data['sensor_id']
-            
-            if sensor_id not in sensor_analysis:
-                sensor_analysis[sensor_id] = {
-                    'vehicle_counts': [],
-                    'speeds': [],
-                    'congestion_levels': [],
-                    'location': {
-                        'lat': data['location_lat'],
-                        'lng': data['location_lng']
-                    }
-                }
-            
-            sensor_analysis[sensor_id]['vehicle_counts'].append(data['vehicle_count'])
-            sensor_analysis[sensor_id]['speeds'].append(data['average_speed'])
-            sensor_analysis[sensor_id]['congestion_levels'].append(data['congestion_level'])
-            
-            # Count congestion levels
-            congestion_summary[data['congestion_level']] += 1
-        
-        # Calculate statistics for each sensor
-        analysis_results = {}
-        for sensor_id, data in sensor_analysis.items():
-            analysis_results[sensor_id] = {
-                'location': data['location'],
-                'avg_vehicle_count': round(statistics.mean(data['vehicle_counts']), 2),
-                'max_vehicle_count': max(data['vehicle_counts']),
-                'min_vehicle_count': min(data['vehicle_counts']),
-                'avg_speed': round(statistics.mean(data['speeds']), 2),
-                'max_speed': max(data['speeds']),
-                'min_speed': min(data['speeds']),
-                'most_common_congestion': max(set(data['congestion_levels']), 
-                                            key=data['congestion_levels'].count),
-                'data_points': len(data['vehicle_counts'])
-            }
+        # Analyze patterns by sensor, one pass with running aggregates
+        sensor_analysis = aggregate_by(traffic_data, key=lambda data: data['sensor_id'])
         
         return jsonify({
             'analysis_timestamp': datetime.utcnow().isoformat(),
-            'total_data_points': len(traffic_data),
-            'congestion_summary': congestion_summary,
-            'sensor_analysis': analysis_results,
-            'overall_stats': {
-                'avg_vehicle_count': round(statistics.mean([d['vehicle_count'] for d in traffic_data]), 2),
-                'avg_speed': round(statistics.mean([d['average_speed'] for d in traffic_data]), 2)
-            }
+            **summarize_patterns(sensor_analysis)
         }), 200
         
-    except requests.RequestException as e:
-        return jsonify({'error': f'Failed to connect to data ingestion service: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -85,74 +87,25 @@ def analyze_traffic_patterns():
 def identify_congestion_hotspots():
     """Identify areas with high congestion"""
     try:
-        # Get traffic data
-        response = requests.get(f"{DATA_INGESTION_URL}/traffic-data?limit=200")
+        cached = window_not_modified()
+        if cached:
+            return cached
         
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch traffic data'}), 500
-        
-        traffic_data = response.json()['data']
+        # Get traffic data
+        traffic_data = window_readings()
         
         if not traffic_data:
             return jsonify({'message': 'No traffic data available for analysis'}), 200
         
-        # Group by location and calculate congestion scores
-        location_congestion = {}
-        
-        for data in traffic_data:
-            location_key = f"{data['location_lat']:.4f},{data['location_lng']:.4f}"
-            
-            if location_key not in location_congestion:
-                location_congestion[location_key] = {
-                    'location': {
-                        'lat': data['location_lat'],
-                        'lng': data['location_lng']
-                    },
-                    'sensor_id': data['sensor_id'],
-                    'congestion_scores': [],
-                    'vehicle_counts': [],
-                    'speeds': []
-                }
-            
-            # Calculate congestion score (higher vehicle count + lower speed = higher congestion)
-            congestion_score = data['vehicle_count'] / max(data['average_speed'], 1)
-            location_congestion[location_key]['congestion_scores'].append(congestion_score)
-            location_congestion[location_key]['vehicle_counts'].append(data['vehicle_count'])
-            location_congestion[location_key]['speeds'].append(data['average_speed'])
-        
-        # Calculate average congestion scores and identify hotspots
-        hotspots = []
-        for location_key, data in location_congestion.items():
-            avg_congestion_score = statistics.mean(data['congestion_scores'])
-            avg_vehicle_count = statistics.mean(data['vehicle_counts'])
-            avg_speed = statistics.mean(data['speeds'])
-            
-            hotspot_data = {
-                'location': data['location'],
-                'sensor_id': data['sensor_id'],
-                'avg_congestion_score': round(avg_congestion_score, 2),
-                'avg_vehicle_count': round(avg_vehicle_count, 2),
-                'avg_speed': round(avg_speed, 2),
-                'data_points': len(data['congestion_scores'])
-            }
-            
-            # Consider it a hotspot if congestion score is above threshold
-            if avg_congestion_score > 2.0:  # Threshold can be adjusted
-                hotspot_data['severity'] = 'HIGH' if avg_congestion_score > 4.0 else 'MEDIUM'
-                hotspots.append(hotspot_data)
-        
-        # Sort hotspots by congestion score (highest first)
-        hotspots.sort(key=lambda x: x['avg_congestion_score'], reverse=True)
+        # Group by location and accumulate congestion scores
+        location_congestion = aggregate_by(traffic_data, key=location_key)
         
+        # Hotspots are locations with a mean congestion score above 2.0, top 10
         return jsonify({
             'analysis_timestamp': datetime.utcnow().isoformat(),
-            'total_locations_analyzed': len(location_congestion),
-            'hotspots_identified': len(hotspots),
-            'hotspots': hotspots[:10]  # Return top 10 hotspots
+            **summarize_hotspots(location_congestion, threshold=2.0, limit=10)
         }), 200
         
-    except requests.RequestException as e:
-        return jsonify({'error': f'Failed to connect to data ingestion service: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -160,15 +113,13 @@ def identify_congestion_hotspots():
 def analyze_incident_impact():
     """Analyze the impact of incidents on traffic flow"""
     try:
-        # Get incidents data
-        incidents_response = requests.get(f"{DATA_INGESTION_URL}/incidents")
-        traffic_response = requests.get(f"{DATA_INGESTION_URL}/traffic-data?limit=100")
-        
-        if incidents_response.status_code != 200 or traffic_response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch data'}), 500
+        cached = window_not_modified()
+        if cached:
+            return cached
         
-        incidents = incidents_response.json()['incidents']
-        traffic_data = traffic_response.json()['data']
+        # Get incidents data
+        incidents = get_reading_window().incidents()
+        traffic_data = window_readings()
         
         if not incidents or not traffic_data:
             return jsonify({'message': 'Insufficient data for incident impact analysis'}), 200
@@ -189,23 +140,6 @@ def analyze_incident_impact():
                 avg_speed = statistics.mean([t['average_speed'] for t in nearby_traffic])
                 avg_vehicle_count = statistics.mean([t['vehicle_count'] for t in nearby_traffic])
                 
-                # Estimate impact based on severity and nearby traffic conditions
-                impact_score = 0
-                if incident['severity'] == 'CRITICAL':
-                    impact_score = 10
-                elif incident['severity'] == 'HIGH':
-                    impact_score = 7
-                elif incident['severity'] == 'MEDIUM':
-                    impact_score = 4
-                else:
-                    impact_score = 2
-                
-                # Adjust impact based on traffic conditions
-                if avg_speed < 30:
-                    impact_score += 2
-                if avg_vehicle_count > 50:
-                    impact_score += 2
-                
                 impact_analysis.append({
                     'incident_id': incident['id'],
                     'incident_type': incident['incident_type'],
@@ -214,7 +148,8 @@ def analyze_incident_impact():
                         'lat': incident['location_lat'],
                         'lng': incident['location_lng']
                     },
-                    'impact_score': min(impact_score, 10),  # Cap at 10
+                    # Estimate impact based on severity and nearby traffic conditions
+                    'impact_score': impact_score(incident['severity'], avg_speed, avg_vehicle_count),
                     'nearby_avg_speed': round(avg_speed, 2),
                     'nearby_avg_vehicle_count': round(avg_vehicle_count, 2),
                     'affected_sensors': len(nearby_traffic)
@@ -230,8 +165,261 @@ def analyze_incident_impact():
             'impact_analysis': impact_analysis
         }), 200
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Chart series: at most ?points= per sensor and measure
+SERIES_MEASURES = ('vehicle_count', 'average_speed')
+DEFAULT_SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+MAX_SERIES = 200
+# Both services hold every reading of the range in memory before downsampling
+# (data-ingestion's result rows, then the columnar frame here), about 300 bytes each
+MAX_SERIES_READINGS = 500000
+SERIES_FETCH_TIMEOUT = 60
+
+class SeriesTooLarge(Exception):
+    pass
+
+def parse_timestamp(value):
+    """ISO 8601 query parameter as naive UTC, like the stored timestamps; offsets such as 'Z' are converted"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def series_columns(sensor_ids, since, until, now):
+    """(source, sensor ids, epoch seconds, measure arrays) of readings in [since, until)"""
+    if since >= now - timedelta(seconds=get_reading_window().window_seconds):
+        readings = get_reading_window().readings(since_seconds=(now - since).total_seconds())
+        until_seconds = (until - datetime(1970, 1, 1)).total_seconds()
+        readings = [reading for reading in readings if reading_time(reading) < until_seconds
+                    and (not sensor_ids or reading['sensor_id'] in sensor_ids)]
+        return 'window', np.array([reading['sensor_id'] for reading in readings], dtype=str), \
+            np.array([reading_time(reading) for reading in readings], dtype=np.float64), \
+            {measure: np.array([reading[measure] for reading in readings], dtype=np.float64) for measure in SERIES_MEASURES}
+    
+    # Older ranges come from the stored data, as columns rather than JSON rows
+    params = {'since': since.isoformat(), 'until': until.isoformat(), 'limit': MAX_SERIES_READINGS + 1}
+    if sensor_ids:
+        params['sensor_id'] = ','.join(sensor_ids)
+    with metrics.upstream('data-ingestion'):
+        frame = columnar.fetch(requests, f"{DATA_INGESTION_URL}/traffic-data", params, timeout=SERIES_FETCH_TIMEOUT)
+    if len(frame) > MAX_SERIES_READINGS:
+        raise SeriesTooLarge(f'More than {MAX_SERIES_READINGS} readings in range; '
+                             'narrow since/until or select sensors with ?sensor_id=')
+    return 'data-ingestion', frame.strings('sensor_id'), frame['timestamp_us'] / 1e6, \
+        {measure: frame[measure].astype(np.float64) for measure in SERIES_MEASURES}
+
+@analysis_bp.route('/time-series', methods=['GET'])
+def get_time_series():
+    """Get downsampled vehicle count and speed series per sensor for charts"""
+    try:
+        sensor_ids = [sensor_id for sensor_id in request.args.get('sensor_id', '').split(',') if sensor_id]
+        now = datetime.utcnow()
+        until = request.args.get('until', type=parse_timestamp) or now
+        since = request.args.get('since', type=parse_timestamp) or until - timedelta(hours=1)
+        points = request.args.get('points', DEFAULT_SERIES_POINTS, type=int)
+        method = request.args.get('method', 'lttb')
+        measures = [measure for measure in request.args.get('measures', ','.join(SERIES_MEASURES)).split(',') if measure]
+        
+        if method not in METHODS:
+            return jsonify({'error': f"Unknown method '{method}', expected one of: {', '.join(METHODS)}"}), 400
+        if not 3 <= points <= MAX_SERIES_POINTS:
+            return jsonify({'error': f'points must be between 3 and {MAX_SERIES_POINTS}'}), 400
+        if any(measure not in SERIES_MEASURES for measure in measures):
+            return jsonify({'error': f"measures must be among: {', '.join(SERIES_MEASURES)}"}), 400
+        if since >= until:
+            return jsonify({'error': 'since must be before until'}), 400
+        if len(sensor_ids) > MAX_SERIES:
+            return jsonify({'error': f'At most {MAX_SERIES} sensors per request'}), 400
+        
+        source, sensors, timestamps, values = series_columns(sensor_ids, since, until, now)
+        
+        # Sort into one run per sensor, then downsample every sensor at once per measure
+        sensor_names, codes = np.unique(sensors, return_inverse=True)
+        if len(sensor_names) > MAX_SERIES:
+            return jsonify({'error': f'{len(sensor_names)} sensors in range, at most {MAX_SERIES} per request; '
+                                     'select some with ?sensor_id='}), 400
+        order, starts, lengths, series_codes = group_series(codes, timestamps)
+        timestamps = timestamps[order]
+        
+        series = [{'sensor_id': str(sensor_names[code]), 'readings': int(length)}
+                  for code, length in zip(series_codes, lengths)]
+        for measure in measures:
+            measure_values = values[measure][order]
+            kept = downsample(method, timestamps, measure_values, starts, lengths, points)
+            bounds = np.searchsorted(kept, np.r_[starts, len(timestamps)])
+            # Epoch milliseconds keep the payload small for charting libraries
+            kept_ms = np.rint(timestamps[kept] * 1000).astype(np.int64).tolist()
+            kept_values = measure_values[kept].tolist()
+            for entry, first, last in zip(series, bounds[:-1], bounds[1:]):
+                entry[measure] = {'timestamps': kept_ms[first:last], 'values': kept_values[first:last]}
+        
+        return jsonify({
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'method': method,
+            'points': points,
+            'source': source,
+            'total_readings': len(timestamps),
+            'series': series,
+            'count': len(series)
+        }), 200
+        
+    except SeriesTooLarge as e:
+        return jsonify({'error': str(e)}), 400
     except requests.RequestException as e:
-        return jsonify({'error': f'Failed to connect to data ingestion service: {str(e)}'}), 500
+        return jsonify({'error': f'Failed to fetch traffic data: {e}'}), 502
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Long-window analyses run as background jobs on a process pool; see
+# src/services/job_manager.py. Tests can set JOBS_DIR to a temp directory.
+DEFAULT_JOBS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'jobs')
+job_manager = None
+_job_manager_init_lock = threading.Lock()
+
+def get_job_manager():
+    global job_manager
+    if job_manager is None:
+        with _job_manager_init_lock:
+            if job_manager is None:
+                job_manager = JobManager(current_app.config.get('JOBS_DIR') or DEFAULT_JOBS_DIR, get_event_log())
+                metrics.register_stats('analysis_jobs', job_manager.stats)
+    return job_manager
+
+@analysis_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Submit a long-window analysis job: {"analysis": ..., "params": {"days"|"since"/"until", ...}}"""
+    try:
+        data = request.get_json() or {}
+        job = get_job_manager().submit(data.get('analysis'), data.get('params'))
+        return jsonify(job), 202
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analysis_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List analysis jobs newest first, optionally by ?status=, without results"""
+    try:
+        status = request.args.get('status')
+        if status and status not in STATUSES:
+            return jsonify({'error': f"Unknown status '{status}'"}), 400
+        manager = get_job_manager()
+        jobs = manager.list(status)
+        return jsonify({
+            'jobs': jobs,
+            'count': len(jobs),
+            'stats': manager.stats()
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analysis_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get an analysis job's status, progress and, once succeeded, its result"""
+    try:
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analysis_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running analysis job"""
+    try:
+        job = get_job_manager().cancel(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if job['status'] in FINISHED and job['status'] != 'cancelled':
+            return jsonify({'error': f"Job already {job['status']}"}), 409
+        return jsonify(job), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Encoded tile responses by (slice, z, x, y, format), valid for one tile version,
+# and the few most recently used historical pyramids
+tile_cache = ResponseCache()
+slice_cache = ResponseCache(max_entries=4)
+
+def get_tile_slice(job_id):
+    """Tiles of a finished tile_pyramid job, or an error response"""
+    tiles = slice_cache.get(job_id, 1)
+    if tiles is not None:
+        return tiles, None
+    job = get_job_manager().get(job_id)
+    if job is None or job['analysis'] != 'tile_pyramid':
+        return None, (jsonify({'error': 'Tile slice not found'}), 404)
+    if job['status'] != 'succeeded':
+        return None, (jsonify({'error': f"Tile slice is {job['status']}", 'progress': job['progress']}), 409)
+    tiles = TileSet.load(get_job_manager().artifact_path(job_id))
+    slice_cache.put(job_id, 1, tiles)
+    return tiles, None
+
+@analysis_bp.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    """Get a congestion heatmap tile of the reading window, or of a historical ?slice=<tile_pyramid job id>"""
+    try:
+        if not valid_tile(z, x, y):
+            return jsonify({'error': 'Tile out of range'}), 400
+        slice_id = request.args.get('slice')
+        if slice_id:
+            tiles, error = get_tile_slice(slice_id)
+            if error:
+                return error
+        else:
+            get_reading_window().watermark()
+            tiles = reading_tiles
+        
+        version = tiles.tile_version(z, x, y)
+        cached = http_cache.not_modified(slice_id or 'live', version)
+        if cached:
+            return cached
+        
+        wants_columnar = columnar.wants_columnar(request)
+        key = (slice_id, z, x, y, wants_columnar)
+        body = tile_cache.get(key, version)
+        if body is None:
+            cells = tiles.cells(z, x, y)
+            meta = {'z': z, 'x': x, 'y': y, 'cells_per_side': TILE_CELLS, 'slice': slice_id}
+            if wants_columnar:
+                body = columnar.encode(cells, meta=meta)
+            else:
+                body = jsonify(dict(meta, count=len(cells['index']),
+                                    cells={name: values.tolist() for name, values in cells.items()})).get_data()
+            tile_cache.put(key, version, body)
+        
+        if wants_columnar:
+            return Response(body, mimetype=columnar.MEDIA_TYPE, headers={'Vary': 'Accept'})
+        return Response(body, mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analysis_bp.route('/tiles/stats', methods=['GET'])
+def get_tile_stats():
+    """Get live tile counts and response cache hit rates"""
+    try:
+        get_reading_window().watermark()
+        return jsonify({
+            'live': reading_tiles.stats(),
+            'cache': tile_cache.stats(),
+            'slices': slice_cache.stats()
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analysis_bp.route('/reading-window/stats', methods=['GET'])
+def get_reading_window_stats():
+    """Get the in-memory reading window size and event log consumer lag"""
+    try:
+        return jsonify(get_reading_window().stats()), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,126 @@
+"""Vectorized downsampling of many time series at once for chart endpoints.
+
+Series are given as flat arrays sorted by series and then time, with
+``starts``/``lengths`` marking each series; the functions return the
+flat indices of the points to keep, in the same order.
+
+``lttb`` is Largest-Triangle-Three-Buckets: the first and last points
+are kept and every bucket in between contributes the point forming the
+largest triangle with the previously kept point and the mean of the next
+bucket. Each step depends on the previous one, so the loop runs over
+bucket positions, but each iteration handles that bucket of every series
+with NumPy: the Python loop is ``threshold`` long however many series or
+points there are. Next-bucket means come from prefix sums.
+
+``minmax`` splits each series' time span into ``threshold // 2`` equal
+buckets and keeps the minimum and maximum of each, which preserves
+spikes exactly and is fully vectorized.
+"""
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def group_series(keys, t):
+    """(order sorting by key then time, starts, lengths, distinct keys)"""
+    order = np.lexsort((t, keys))
+    sorted_keys = keys[order]
+    if len(sorted_keys) == 0:
+        return order, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), sorted_keys
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    lengths = np.diff(np.r_[starts, len(sorted_keys)])
+    return order, starts, lengths, sorted_keys[starts]
+
+
+def _ragged_arange(lo, counts):
+    """Concatenation of arange(lo[i], lo[i] + counts[i])"""
+    total = int(counts.sum())
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total) - offsets + np.repeat(lo, counts)
+
+
+def _first_per_segment(mask, segments):
+    """Index of the first True of ``mask`` within each run of equal ``segments``"""
+    hits = np.flatnonzero(mask)
+    hit_segments = segments[hits]
+    return hits[np.r_[True, hit_segments[1:] != hit_segments[:-1]]]
+
+
+def lttb(t, y, starts, lengths, threshold):
+    """Flat indices kept by LTTB, at most ``threshold`` (>= 3) per series"""
+    if threshold < 3:
+        raise ValueError('LTTB needs a threshold of at least 3 points')
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    short = lengths <= threshold
+    kept = [_ragged_arange(starts[short], lengths[short])]
+
+    long_starts = starts[~short]
+    n = lengths[~short]
+    if len(n):
+        # Relative times keep the prefix sums precise
+        t = np.asarray(t, dtype=np.float64)
+        t = t - t.min()
+        y = np.asarray(y, dtype=np.float64)
+        t_sums = np.r_[0.0, np.cumsum(t)]
+        y_sums = np.r_[0.0, np.cumsum(y)]
+        every = (n - 2) / (threshold - 2)
+
+        selected = np.empty((len(n), threshold), dtype=np.int64)
+        selected[:, 0] = long_starts
+        selected[:, -1] = long_starts + n - 1
+        previous = long_starts
+        for bucket in range(threshold - 2):
+            lo = long_starts + np.floor(bucket * every).astype(np.int64) + 1
+            hi = long_starts + np.floor((bucket + 1) * every).astype(np.int64) + 1
+            next_hi = long_starts + np.minimum(np.floor((bucket + 2) * every).astype(np.int64) + 1, n)
+            next_count = next_hi - hi
+            avg_t = (t_sums[next_hi] - t_sums[hi]) / next_count
+            avg_y = (y_sums[next_hi] - y_sums[hi]) / next_count
+
+            counts = hi - lo
+            candidates = _ragged_arange(lo, counts)
+            segments = np.repeat(np.arange(len(n)), counts)
+            a_t = t[previous][segments]
+            a_y = y[previous][segments]
+            area = np.abs((a_t - avg_t[segments]) * (y[candidates] - a_y)
+                          - (a_t - t[candidates]) * (avg_y[segments] - a_y))
+            best = np.maximum.reduceat(area, np.cumsum(counts) - counts)
+            previous = candidates[_first_per_segment(area == best[segments], segments)]
+            selected[:, bucket + 1] = previous
+        kept.append(selected.ravel())
+
+    return np.sort(np.concatenate(kept))
+
+
+def minmax(t, y, starts, lengths, threshold):
+    """Flat indices of the min and max point of ``threshold // 2`` equal time buckets per series"""
+    buckets = max(1, threshold // 2)
+    if not len(t):
+        return np.zeros(0, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    t = np.asarray(t, dtype=np.float64)
+    series = np.repeat(np.arange(len(starts)), lengths)
+    first = t[starts][series]
+    span = (t[starts + lengths - 1] - t[starts])[series]
+    bucket = np.where(span > 0, np.floor((t - first) / np.where(span > 0, span, 1) * buckets), 0)
+    keys = series * buckets + np.minimum(bucket.astype(np.int64), buckets - 1)
+
+    # Points are sorted by series and time, so each bucket is one contiguous run
+    y = np.asarray(y, dtype=np.float64)
+    boundaries = np.r_[False, keys[1:] != keys[:-1]]
+    group_starts = np.flatnonzero(boundaries | (np.arange(len(keys)) == 0))
+    groups = np.cumsum(boundaries)
+    lowest = np.minimum.reduceat(y, group_starts)
+    highest = np.maximum.reduceat(y, group_starts)
+    return np.unique(np.r_[_first_per_segment(y == lowest[groups], groups),
+                           _first_per_segment(y == highest[groups], groups)])
+
+
+def downsample(method, t, y, starts, lengths, threshold):
+    if method == 'lttb':
+        return lttb(t, y, starts, lengths, threshold)
+    if method == 'minmax':
+        return minmax(t, y, starts, lengths, threshold)
+    raise ValueError(f"Unknown method '{method}', expected one of: {', '.join(METHODS)}")
@@ -0,0 +1,316 @@
+"""Asynchronous analysis jobs over long windows of the ingestion event log.
+
+Jobs are submitted with an analysis name and parameters, queued, and run
+by a coordinator thread each: the job's offset range of the readings
+topic is split into shards (see long_window), the shards are mapped on a
+shared, bounded process pool and their partials reduced in shard order.
+At most ``max_running`` jobs run at once and each keeps at most
+``max_workers`` shards in flight, so concurrent jobs interleave on the
+pool instead of one job queueing all of its shards ahead of the other.
+
+Every job is persisted as ``<id>.json`` in ``directory`` on each status
+or progress change, so results survive restarts and can be polled from
+any worker. Jobs found queued or running on startup are marked failed.
+Only the newest ``retained`` finished jobs are kept. Analyses with
+``writes_artifact`` (the tile pyramid) write their bulk output to
+``<id>.npz`` next to the job file.
+
+Cancelling a queued job removes it from the queue. Cancelling a running
+job stops it from submitting further shards and drops the pending ones;
+shards already running in a worker finish and are discarded.
+
+With a MemoryEventLog (tests) there is no directory for workers to read,
+so shards run in the coordinator thread instead.
+
+Workers are never forked from the service, which runs event subscriber,
+flusher and request threads whose locks a fork could copy mid-update.
+They come from a fork server, a fresh single-threaded process with only
+long_window preloaded, or are spawned where there is no fork server.
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from common.event_log import FileEventLog
+from src.services.long_window import ANALYSES, load_incidents, prepare_params, scan_shard, shard_ranges, iso_time
+
+DEFAULT_MAX_RUNNING = 2
+DEFAULT_MAX_QUEUED = 20
+DEFAULT_RETAINED = 200
+# Readings are appended when ingested, a moment after their own timestamp
+APPEND_LAG_SECONDS = 60
+# The worker entry module, light to import (see long_window)
+WORKER_MODULE = 'src.services.long_window'
+STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+
+class JobQueueFull(Exception):
+    """Raised when ``max_queued`` jobs are already waiting"""
+
+
+def default_workers():
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+def pool_context():
+    # Like any spawned process, workers also import the service's main
+    # script, which skips its startup work outside the main process
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([WORKER_MODULE])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class JobManager:
+    """Queue, runner and store of analysis jobs reading ``log``"""
+
+    def __init__(self, directory, log, max_workers=None, max_running=DEFAULT_MAX_RUNNING,
+                 max_queued=DEFAULT_MAX_QUEUED, retained=DEFAULT_RETAINED):
+        self.directory = directory
+        self.log = log
+        self.max_workers = max_workers or default_workers()
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.retained = retained
+        self._jobs = {}
+        self._queue = deque()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        atexit.register(self.shutdown)
+
+    # Store
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job):
+        path = self._path(job['id'])
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(job, handle, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def artifact_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.npz")
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as handle:
+                    job = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            if job['status'] not in FINISHED:
+                job.update(status='failed', error='Service restarted before the job finished',
+                           finished_at=datetime.utcnow().isoformat())
+                self._save(job)
+            self._jobs[job['id']] = job
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job['status'] in FINISHED),
+                          key=lambda job: job['submitted_at'])
+        for job in finished[:max(0, len(finished) - self.retained)]:
+            del self._jobs[job['id']]
+            for path in (self._path(job['id']), self.artifact_path(job['id'])):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # API
+
+    def submit(self, analysis, params=None):
+        """Queue a job; returns its dict. Raises ValueError for bad parameters, JobQueueFull when full."""
+        prepared = prepare_params(analysis, params)
+        with self._lock:
+            if len(self._queue) >= self.max_queued:
+                raise JobQueueFull(f'{self.max_queued} analysis jobs are already queued')
+            job = {
+                'id': uuid.uuid4().hex,
+                'analysis': analysis,
+                'params': params or {},
+                'since': iso_time(prepared['since']),
+                'until': iso_time(prepared['until']),
+                'status': 'queued',
+                'submitted_at': datetime.utcnow().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'progress': {'shards_done': 0, 'shards_total': None, 'readings_scanned': 0},
+                'result': None,
+                'error': None
+            }
+            self._jobs[job['id']] = job
+            self._queue.append((job['id'], prepared))
+            self._save(job)
+            self._start_queued()
+            return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, status=None):
+        """Jobs newest first, without their results"""
+        with self._lock:
+            jobs = [dict(job, result=None) for job in self._jobs.values() if status is None or job['status'] == status]
+        jobs.sort(key=lambda job: job['submitted_at'], reverse=True)
+        return jobs
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns its dict, or None if unknown. Finished jobs are left alone."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'queued':
+                self._queue = deque(entry for entry in self._queue if entry[0] != job_id)
+                self._finish(job, 'cancelled')
+            elif job['status'] == 'running':
+                self._running[job_id].set()
+            return dict(job)
+
+    def stats(self):
+        with self._lock:
+            counts = {status: 0 for status in STATUSES}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+            return {
+                'jobs': counts,
+                'max_running': self.max_running,
+                'max_queued': self.max_queued,
+                'max_workers': self.max_workers,
+                'process_pool': isinstance(self.log, FileEventLog)
+            }
+
+    def shutdown(self):
+        with self._lock:
+            for cancelled in self._running.values():
+                cancelled.set()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # Running
+
+    def _start_queued(self):
+        """Start coordinators for queued jobs while below max_running; called with the lock held"""
+        while self._queue and len(self._running) < self.max_running:
+            job_id, prepared = self._queue.popleft()
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = datetime.utcnow().isoformat()
+            self._save(job)
+            self._running[job_id] = threading.Event()
+            threading.Thread(target=self._run, args=(job, prepared, self._running[job_id]),
+                             name=f"analysis-job-{job_id[:8]}", daemon=True).start()
+
+    def _finish(self, job, status, result=None, error=None):
+        """Record a final status; called with the lock held"""
+        job.update(status=status, result=result, error=error, finished_at=datetime.utcnow().isoformat())
+        self._save(job)
+        self._running.pop(job['id'], None)
+        self._prune()
+        self._start_queued()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=pool_context())
+            return self._pool
+
+    def _progress(self, job, shards_done, readings_scanned):
+        with self._lock:
+            job['progress'] = dict(job['progress'], shards_done=shards_done, readings_scanned=readings_scanned)
+            self._save(job)
+
+    def _run(self, job, params, cancelled):
+        analysis = ANALYSES[job['analysis']]
+        try:
+            if analysis.needs_incidents:
+                params['incidents'] = load_incidents(self.log, params['since'], params['until'])
+            if getattr(analysis, 'writes_artifact', False):
+                params['artifact_path'] = self.artifact_path(job['id'])
+            start = self.log.offset_for_time('readings', params['since'])
+            end = self.log.offset_for_time('readings', params['until'] + APPEND_LAG_SECONDS)
+            shards = shard_ranges(start, end)
+            with self._lock:
+                job['progress'] = dict(job['progress'], shards_total=len(shards))
+                self._save(job)
+
+            if isinstance(self.log, FileEventLog):
+                partials = self._map_pool(job, shards, params, cancelled)
+            else:
+                partials = self._map_inline(job, shards, params, cancelled)
+
+            if partials is None:
+                with self._lock:
+                    self._finish(job, 'cancelled')
+                return
+            total = {}
+            for partial in partials:
+                total = analysis.merge(total, partial)
+            result = analysis.finalize(total, params)
+            with self._lock:
+                self._finish(job, 'succeeded', result=result)
+        except Exception as e:
+            with self._lock:
+                self._finish(job, 'failed', error=str(e))
+
+    def _map_inline(self, job, shards, params, cancelled):
+        partials = []
+        scanned = 0
+        for start, end in shards:
+            if cancelled.is_set():
+                return None
+            partial, count = scan_shard(self.log, start, end, job['analysis'], params)
+            partials.append(partial)
+            scanned += count
+            self._progress(job, len(partials), scanned)
+        return partials
+
+    def _map_pool(self, job, shards, params, cancelled):
+        """Partials in shard order, or None when cancelled"""
+        pool = self._get_pool()
+        partials = [None] * len(shards)
+        pending = {}
+        remaining = iter(enumerate(shards))
+        done_count = 0
+        scanned = 0
+        while True:
+            while len(pending) < self.max_workers and not cancelled.is_set():
+                index, (start, end) = next(remaining, (None, (None, None)))
+                if index is None:
+                    break
+                future = pool.submit(scan_shard, self.log.directory, start, end, job['analysis'], params)
+                pending[future] = index
+            if cancelled.is_set():
+                for future in pending:
+                    future.cancel()
+                return None
+            if not pending:
+                return partials
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    partials[pending.pop(future)], count = future.result()
+                except Exception:
+                    for other in pending:
+                        other.cancel()
+                    raise
+                done_count += 1
+                scanned += count
+            if done:
+                self._progress(job, done_count, scanned)
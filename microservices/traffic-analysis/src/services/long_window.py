@@ -0,0 +1,360 @@
+"""Analyses over days of readings, computed shard by shard from the event log.
+
+A job's time range is mapped to an offset range of the ``readings`` topic
+and split into contiguous shards of SHARD_RECORDS records. Records are
+appended in time order, so each shard covers a slice of time.
+``scan_shard`` runs in a worker process: it reads one shard straight from
+the log directory, keeps readings whose own timestamp falls in the
+requested range and folds them into a partial aggregate. Partials hold
+one entry per location, sensor, incident or map tile, so only they cross
+process boundaries. The coordinator merges them in shard order and finalizes the
+result.
+
+This module is imported by the worker processes and keeps its imports
+light: nothing here touches Flask or the service's database.
+"""
+import math
+from datetime import datetime, timedelta
+
+from common.event_log import FileEventLog
+from common.reading_window import reading_time
+from common.running_stats import RunningStats, aggregate_by, merge_groups
+from src.services.tiles import TileSet
+
+SHARD_RECORDS = 100000
+READ_BATCH_RECORDS = 5000
+DEFAULT_DAYS = 7
+# Same neighbourhood as GET /incident-impact: ~0.01 degrees, roughly 1km
+INCIDENT_RADIUS_DEGREES = 0.01
+
+
+def epoch_seconds(moment):
+    """Epoch seconds of a naive UTC datetime or ISO string"""
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    return (moment - datetime(1970, 1, 1)).total_seconds()
+
+
+def iso_time(seconds):
+    return datetime.utcfromtimestamp(seconds).isoformat()
+
+
+def shard_ranges(start, end, shard_records=SHARD_RECORDS):
+    """Contiguous [start, end) offset ranges of at most ``shard_records``"""
+    return [(offset, min(offset + shard_records, end)) for offset in range(start, end, shard_records)]
+
+
+def impact_score(severity, avg_speed, avg_vehicle_count):
+    """Estimate incident impact (0-10) from severity and nearby traffic conditions"""
+    score = {'CRITICAL': 10, 'HIGH': 7, 'MEDIUM': 4}.get(severity, 2)
+    # Adjust impact based on traffic conditions
+    if avg_speed < 30:
+        score += 2
+    if avg_vehicle_count > 50:
+        score += 2
+    return min(score, 10)
+
+
+def location_key(reading):
+    return f"{reading['location_lat']:.4f},{reading['location_lng']:.4f}"
+
+
+def summarize_patterns(sensor_analysis):
+    """Per-sensor statistics, congestion summary and overall means of aggregate_by() groups"""
+    congestion_summary = {'LOW': 0, 'MEDIUM': 0, 'HIGH': 0}
+    overall_vehicle_count = RunningStats()
+    overall_speed = RunningStats()
+
+    analysis_results = {}
+    for sensor_id, stats in sensor_analysis.items():
+        analysis_results[sensor_id] = {
+            'location': stats.location,
+            'avg_vehicle_count': round(stats.vehicle_count.mean, 2),
+            'max_vehicle_count': stats.vehicle_count.max,
+            'min_vehicle_count': stats.vehicle_count.min,
+            'avg_speed': round(stats.speed.mean, 2),
+            'max_speed': stats.speed.max,
+            'min_speed': stats.speed.min,
+            'most_common_congestion': stats.most_common_congestion(),
+            'data_points': stats.vehicle_count.count
+        }
+
+        # Count congestion levels and fold sensors into the overall stats
+        for level, count in stats.congestion_levels.items():
+            congestion_summary[level] = congestion_summary.get(level, 0) + count
+        overall_vehicle_count.merge(stats.vehicle_count)
+        overall_speed.merge(stats.speed)
+
+    return {
+        'total_data_points': overall_vehicle_count.count,
+        'congestion_summary': congestion_summary,
+        'sensor_analysis': analysis_results,
+        'overall_stats': {
+            'avg_vehicle_count': round(overall_vehicle_count.mean, 2) if overall_vehicle_count.count else None,
+            'avg_speed': round(overall_speed.mean, 2) if overall_speed.count else None
+        }
+    }
+
+
+def summarize_hotspots(location_congestion, threshold=2.0, limit=10):
+    """Locations of aggregate_by() groups whose mean congestion score is above ``threshold``"""
+    hotspots = []
+    for stats in location_congestion.values():
+        avg_congestion_score = stats.congestion_score.mean
+
+        hotspot_data = {
+            'location': stats.location,
+            'sensor_id': stats.sensor_id,
+            'avg_congestion_score': round(avg_congestion_score, 2),
+            'avg_vehicle_count': round(stats.vehicle_count.mean, 2),
+            'avg_speed': round(stats.speed.mean, 2),
+            'data_points': stats.congestion_score.count
+        }
+
+        if avg_congestion_score > threshold:
+            hotspot_data['severity'] = 'HIGH' if avg_congestion_score > 4.0 else 'MEDIUM'
+            hotspots.append(hotspot_data)
+
+    # Sort hotspots by congestion score (highest first)
+    hotspots.sort(key=lambda x: x['avg_congestion_score'], reverse=True)
+
+    return {
+        'total_locations_analyzed': len(location_congestion),
+        'hotspots_identified': len(hotspots),
+        'hotspots': hotspots[:limit]
+    }
+
+
+class TrafficPatterns:
+    """GET /traffic-patterns over the job's time range"""
+
+    needs_incidents = False
+
+    def params(self, raw):
+        return {}
+
+    def scan(self, readings, params):
+        return aggregate_by(readings, key=lambda data: data['sensor_id'])
+
+    def merge(self, total, partial):
+        return merge_groups(total, partial)
+
+    def finalize(self, total, params):
+        return summarize_patterns(total)
+
+
+class HotspotHistory:
+    """GET /congestion-hotspots over the job's time range"""
+
+    needs_incidents = False
+
+    def params(self, raw):
+        threshold = float(raw.get('threshold', 2.0))
+        limit = int(raw.get('limit', 20))
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+        return {'threshold': threshold, 'limit': limit}
+
+    def scan(self, readings, params):
+        return aggregate_by(readings, key=location_key)
+
+    def merge(self, total, partial):
+        return merge_groups(total, partial)
+
+    def finalize(self, total, params):
+        return summarize_hotspots(total, params['threshold'], params['limit'])
+
+
+class IncidentImpact:
+    """Traffic near each incident while it was active, for incidents in the job's time range.
+
+    Readings are matched against a grid of INCIDENT_RADIUS_DEGREES cells,
+    so each reading is only compared with incidents in its own and the
+    eight neighbouring cells.
+    """
+
+    needs_incidents = True
+
+    def params(self, raw):
+        return {}
+
+    @staticmethod
+    def _cell(lat, lng):
+        return math.floor(lat / INCIDENT_RADIUS_DEGREES), math.floor(lng / INCIDENT_RADIUS_DEGREES)
+
+    def scan(self, readings, params):
+        grid = {}
+        for incident in params['incidents']:
+            grid.setdefault(self._cell(incident['location_lat'], incident['location_lng']), []).append(incident)
+
+        partial = {}
+        for reading in readings:
+            lat, lng = reading['location_lat'], reading['location_lng']
+            ts = reading_time(reading)
+            row, col = self._cell(lat, lng)
+            for cell in ((row + i, col + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+                for incident in grid.get(cell, ()):
+                    if (incident['active_from'] <= ts <= incident['active_until']
+                            and abs(lat - incident['location_lat']) <= INCIDENT_RADIUS_DEGREES
+                            and abs(lng - incident['location_lng']) <= INCIDENT_RADIUS_DEGREES):
+                        stats = partial.get(incident['id'])
+                        if stats is None:
+                            stats = partial[incident['id']] = (RunningStats(), RunningStats(), set())
+                        stats[0].add(reading['average_speed'])
+                        stats[1].add(reading['vehicle_count'])
+                        stats[2].add(reading['sensor_id'])
+        return partial
+
+    def merge(self, total, partial):
+        for incident_id, (speed, vehicle_count, sensors) in partial.items():
+            if incident_id in total:
+                total[incident_id][0].merge(speed)
+                total[incident_id][1].merge(vehicle_count)
+                total[incident_id][2].update(sensors)
+            else:
+                total[incident_id] = (speed, vehicle_count, sensors)
+        return total
+
+    def finalize(self, total, params):
+        impact_analysis = []
+        for incident in params['incidents']:
+            if incident['id'] not in total:
+                continue
+            speed, vehicle_count, sensors = total[incident['id']]
+            impact_analysis.append({
+                'incident_id': incident['id'],
+                'incident_type': incident['incident_type'],
+                'severity': incident['severity'],
+                'status': incident.get('status'),
+                'reported_at': incident['reported_at'],
+                'resolved_at': incident.get('resolved_at'),
+                'location': {
+                    'lat': incident['location_lat'],
+                    'lng': incident['location_lng']
+                },
+                'impact_score': impact_score(incident['severity'], speed.mean, vehicle_count.mean),
+                'nearby_avg_speed': round(speed.mean, 2),
+                'nearby_avg_vehicle_count': round(vehicle_count.mean, 2),
+                'affected_sensors': len(sensors),
+                'data_points': speed.count
+            })
+
+        # Sort by impact score
+        impact_analysis.sort(key=lambda x: x['impact_score'], reverse=True)
+
+        return {
+            'total_incidents_analyzed': len(params['incidents']),
+            'incidents_with_traffic_impact': len(impact_analysis),
+            'impact_analysis': impact_analysis
+        }
+
+
+class TilePyramid:
+    """Heatmap tiles of every zoom level for the job's time range.
+
+    The pyramid is too large for the job's JSON; it is written to
+    ``params['artifact_path']`` and served by GET /tiles/<z>/<x>/<y>?slice=<job id>.
+    """
+
+    needs_incidents = False
+    writes_artifact = True
+
+    def params(self, raw):
+        return {}
+
+    def scan(self, readings, params):
+        tiles = TileSet()
+        batch = []
+        for reading in readings:
+            batch.append(reading)
+            if len(batch) >= READ_BATCH_RECORDS:
+                tiles.add(batch)
+                batch = []
+        tiles.add(batch)
+        return tiles
+
+    def merge(self, total, partial):
+        return total.merge(partial) if total else partial
+
+    def finalize(self, total, params):
+        tiles = total or TileSet()
+        tiles.save(params['artifact_path'])
+        return tiles.stats()
+
+
+ANALYSES = {
+    'traffic_patterns': TrafficPatterns(),
+    'hotspot_history': HotspotHistory(),
+    'incident_impact': IncidentImpact(),
+    'tile_pyramid': TilePyramid()
+}
+
+
+def prepare_params(analysis, raw):
+    """Validated job parameters: ``since``/``until`` (ISO, naive UTC) or ``days`` back from now.
+
+    Raises ValueError for an unknown analysis or bad parameters.
+    """
+    if analysis not in ANALYSES:
+        raise ValueError(f"Unknown analysis '{analysis}', expected one of: {', '.join(sorted(ANALYSES))}")
+    raw = raw or {}
+    until = datetime.fromisoformat(raw['until']) if raw.get('until') else datetime.utcnow()
+    if raw.get('since'):
+        since = datetime.fromisoformat(raw['since'])
+    else:
+        since = until - timedelta(days=float(raw.get('days', DEFAULT_DAYS)))
+    if since >= until:
+        raise ValueError('since must be before until')
+    params = ANALYSES[analysis].params(raw)
+    params['since'] = epoch_seconds(since)
+    params['until'] = epoch_seconds(until)
+    return params
+
+
+def load_incidents(log, since, until):
+    """Latest version of every retained incident active at some point in [since, until)"""
+    incidents = {}
+    reader = log.reader('incidents', log.start_offset('incidents'))
+    while True:
+        records = reader.read(READ_BATCH_RECORDS)
+        if not records:
+            break
+        for _, incident in records:
+            incidents[incident['id']] = incident
+
+    active = []
+    for incident in incidents.values():
+        active_from = epoch_seconds(incident['reported_at'])
+        active_until = epoch_seconds(incident['resolved_at']) if incident.get('resolved_at') else until
+        if active_from < until and active_until >= since:
+            active.append(dict(incident, active_from=active_from, active_until=min(active_until, until)))
+    active.sort(key=lambda incident: incident['id'])
+    return active
+
+
+def read_shard(log, start, end, since, until, counts):
+    """Readings at offsets [start, end) of ``log`` timestamped in [since, until)"""
+    reader = log.reader('readings', start)
+    while reader.offset < end:
+        records = reader.read(min(READ_BATCH_RECORDS, end - reader.offset))
+        if not records:
+            break
+        for offset, reading in records:
+            if offset >= end:
+                break
+            counts['scanned'] += 1
+            if since <= reading_time(reading) < until:
+                yield reading
+
+
+def scan_shard(log, start, end, analysis, params):
+    """(partial aggregate, readings scanned) for one shard.
+
+    ``log`` is a FileEventLog directory when called in a worker process,
+    or the log itself when run in-process.
+    """
+    if isinstance(log, str):
+        log = FileEventLog(log)
+    counts = {'scanned': 0}
+    partial = ANALYSES[analysis].scan(read_shard(log, start, end, params['since'], params['until'], counts), params)
+    return partial, counts['scanned']
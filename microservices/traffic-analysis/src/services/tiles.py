@@ -0,0 +1,219 @@
+"""Congestion heatmap tiles on the web map z/x/y grid.
+
+Tiles follow the usual Web Mercator scheme (zoom z has 2^z x 2^z tiles,
+y growing southwards). Each tile is split into TILE_CELLS x TILE_CELLS
+cells and stored as one packed float64 array of shape (3, cells): reading
+count, congestion score sum and vehicle count sum per cell. Readings are
+added to every zoom level from MIN_ZOOM to MAX_ZOOM at once, so serving a
+tile never aggregates raw readings.
+
+The live TileSet observes the reading window: readings are added as they
+arrive and subtracted again when the window evicts them, so tiles always
+cover the same readings as the other analysis endpoints. Historical
+slices are built by the ``tile_pyramid`` analysis job and saved with
+``save``/``load``.
+
+Every change bumps ``version``; each tile remembers the version that last
+touched it, which keys the response cache and the ETag.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+TILE_CELLS = 32
+CELLS = TILE_CELLS * TILE_CELLS
+MIN_ZOOM = 0
+MAX_ZOOM = 14
+DEFAULT_CACHE_ENTRIES = 2048
+# Cells whose count drops below this after evictions are reset to zero,
+# so float sums do not drift around an empty cell
+EMPTY_COUNT = 0.5
+
+
+def world_cells(lat, lng):
+    """Integer cell coordinates at MAX_ZOOM of latitude/longitude arrays"""
+    size = (1 << MAX_ZOOM) * TILE_CELLS
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    lng = np.asarray(lng, dtype=np.float64)
+    x = (lng + 180.0) / 360.0 * size
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * size
+    return (np.clip(x.astype(np.int64), 0, size - 1),
+            np.clip(y.astype(np.int64), 0, size - 1))
+
+
+def reading_columns(readings):
+    """(lat, lng, congestion score, vehicle count) arrays of reading dicts"""
+    lat = np.fromiter((reading['location_lat'] for reading in readings), np.float64, len(readings))
+    lng = np.fromiter((reading['location_lng'] for reading in readings), np.float64, len(readings))
+    vehicles = np.fromiter((reading['vehicle_count'] for reading in readings), np.float64, len(readings))
+    speed = np.fromiter((reading['average_speed'] for reading in readings), np.float64, len(readings))
+    # Same score as SensorStats: higher vehicle count + lower speed = higher congestion
+    return lat, lng, vehicles / np.maximum(speed, 1), vehicles
+
+
+def valid_tile(z, x, y):
+    return MIN_ZOOM <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+class TileSet:
+    """Aggregated tiles of every zoom level, keyed by (z, x, y)"""
+
+    def __init__(self):
+        self.tiles = {}
+        self.tile_versions = {}
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Partials built in worker processes are pickled without the lock
+        return {'tiles': self.tiles, 'tile_versions': self.tile_versions, 'version': self.version}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, readings, sign=1):
+        """Add (sign=1) or subtract (sign=-1) a batch of reading dicts"""
+        if not readings:
+            return
+        lat, lng, score, vehicles = reading_columns(readings)
+        cell_x, cell_y = world_cells(lat, lng)
+        with self._lock:
+            self.version += 1
+            for z in range(MIN_ZOOM, MAX_ZOOM + 1):
+                shift = MAX_ZOOM - z
+                self._add_level(z, cell_x >> shift, cell_y >> shift, score, vehicles, sign)
+
+    def _add_level(self, z, cell_x, cell_y, score, vehicles, sign):
+        tile_x = cell_x // TILE_CELLS
+        tile_y = cell_y // TILE_CELLS
+        cells = (cell_y % TILE_CELLS) * TILE_CELLS + cell_x % TILE_CELLS
+        # Group the batch by tile, then one bincount per tile and measure
+        tile_ids = (tile_x << z) | tile_y
+        order = np.argsort(tile_ids, kind='stable')
+        tile_ids = tile_ids[order]
+        bounds = np.flatnonzero(np.diff(tile_ids)) + 1
+        for group in np.split(order, bounds):
+            key = (z, int(tile_x[group[0]]), int(tile_y[group[0]]))
+            tile = self.tiles.get(key)
+            if tile is None:
+                if sign < 0:
+                    continue
+                tile = self.tiles[key] = np.zeros((3, CELLS))
+            group_cells = cells[group]
+            tile[0] += sign * np.bincount(group_cells, minlength=CELLS)
+            tile[1] += sign * np.bincount(group_cells, weights=score[group], minlength=CELLS)
+            tile[2] += sign * np.bincount(group_cells, weights=vehicles[group], minlength=CELLS)
+            if sign < 0:
+                tile[:, tile[0] < EMPTY_COUNT] = 0
+                if not tile[0].any():
+                    del self.tiles[key]
+                    self.tile_versions[key] = self.version
+                    continue
+            self.tile_versions[key] = self.version
+
+    def merge(self, other):
+        """Add another TileSet's tiles, e.g. a partial built from another shard"""
+        with self._lock:
+            self.version += 1
+            for key, tile in other.tiles.items():
+                if key in self.tiles:
+                    self.tiles[key] += tile
+                else:
+                    self.tiles[key] = tile.copy()
+                self.tile_versions[key] = self.version
+        return self
+
+    def tile_version(self, z, x, y):
+        with self._lock:
+            return self.tile_versions.get((z, x, y), 0)
+
+    def cells(self, z, x, y):
+        """Non-empty cells of a tile as columns: index (row * TILE_CELLS + col), count, mean score, mean vehicle count"""
+        with self._lock:
+            tile = self.tiles.get((z, x, y))
+            tile = tile.copy() if tile is not None else np.zeros((3, CELLS))
+        index = np.flatnonzero(tile[0] >= EMPTY_COUNT)
+        count = tile[0, index]
+        return {
+            'index': index.astype(np.uint16),
+            'count': np.rint(count).astype(np.uint32),
+            'congestion_score': (tile[1, index] / count).astype(np.float32),
+            'volume': (tile[2, index] / count).astype(np.float32)
+        }
+
+    def stats(self):
+        with self._lock:
+            per_zoom = {}
+            for z, _, _ in self.tiles:
+                per_zoom[z] = per_zoom.get(z, 0) + 1
+            return {
+                'tiles': len(self.tiles),
+                'tiles_per_zoom': per_zoom,
+                'bytes': sum(tile.nbytes for tile in self.tiles.values()),
+                'version': self.version
+            }
+
+    # Persistence
+
+    def save(self, path):
+        """Write all tiles to a compressed .npz file"""
+        with self._lock:
+            keys = np.array(sorted(self.tiles), dtype=np.int64).reshape(-1, 3)
+            data = np.stack([self.tiles[tuple(key)] for key in keys.tolist()]) if len(keys) else np.zeros((0, 3, CELLS))
+        with open(path, 'wb') as handle:
+            np.savez_compressed(handle, keys=keys, data=data)
+
+    @classmethod
+    def load(cls, path):
+        tile_set = cls()
+        with np.load(path) as archive:
+            for key, tile in zip(archive['keys'].tolist(), archive['data']):
+                tile_set.tiles[tuple(key)] = tile
+                tile_set.tile_versions[tuple(key)] = 1
+        tile_set.version = 1
+        return tile_set
+
+
+class ReadingTiles(TileSet):
+    """Live tiles of a ReadingWindow, registered as one of its observers"""
+
+    def readings_added(self, readings):
+        self.add(readings)
+
+    def readings_evicted(self, readings):
+        self.add(readings, sign=-1)
+
+
+class ResponseCache:
+    """LRU cache of encoded tile responses, valid while the tile's version is unchanged"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
@@ -2,16 +2,28 @@ import os
 import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Modules shared between the services, e.g. the ingestion event log
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from werkzeug.serving import is_running_from_reloader
+from common import metrics, profiling
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.control import control_bp
+from src.routes.control import (
+    control_bp, start_control_scheduler, build_zones, get_light_states, get_signal_expiry, get_reading_window,
+    action_log, live_feed
+)
+from src.services.control_scheduler import parse_interval, parse_zone_grid
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 CORS(app)
+# Prometheus metrics of every request, SQL statement and registered buffer, at /metrics
+metrics.init_app(app)
+# Slow-request stack samples and on-demand cProfile captures, at /admin/profiles
+profiling.init_app(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(control_bp, url_prefix='/api')
@@ -22,6 +34,33 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    get_signal_expiry()
+    # Replay recent readings from the ingestion event log and keep following it
+    get_reading_window()
+
+metrics.register_stats('light_states', lambda: get_light_states().stats())
+metrics.register_stats('signal_expiry', lambda: get_signal_expiry().stats())
+metrics.register_stats('action_log', action_log.stats)
+metrics.register_stats('live_feed', live_feed.stats)
+metrics.register_stats('reading_window', lambda: get_reading_window().stats())
+metrics.register_stats('request_profiler', profiling.profiler.stats)
+
+# Run adaptive control in-process when a cadence is configured, e.g.
+# ADAPTIVE_CONTROL_INTERVAL_SECONDS=30 ADAPTIVE_CONTROL_ZONE_GRID=2x2
+def start_adaptive_control():
+    """Start the control scheduler from the environment; exits on invalid settings"""
+    interval = os.environ.get('ADAPTIVE_CONTROL_INTERVAL_SECONDS')
+    if not interval:
+        return
+    zone_grid = os.environ.get('ADAPTIVE_CONTROL_ZONE_GRID')
+    try:
+        interval_seconds = parse_interval(interval)
+        zone_grid = parse_zone_grid(zone_grid) if zone_grid else None
+    except ValueError as e:
+        raise SystemExit(f"Invalid ADAPTIVE_CONTROL_INTERVAL_SECONDS/ADAPTIVE_CONTROL_ZONE_GRID: {e}")
+    with app.app_context():
+        zones = build_zones(zone_grid=zone_grid)
+    start_control_scheduler(app, interval_seconds, zones)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -40,5 +79,18 @@ def serve(path):
             return "index.html not found", 404
 
 
+def main():
+    debug = True
+    # The debug reloader runs this module in a watcher process and in the
+    # server it restarts; only the server takes the light state lease and
+    # runs control cycles
+    if not debug or is_running_from_reloader():
+        with app.app_context():
+            # Recover light state into memory and start its write-behind flusher
+            get_light_states()
+        start_adaptive_control()
+    app.run(host='0.0.0.0', port=5003, debug=debug)
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5003, debug=True)
\ No newline at end of file
+    main()
\ No newline at end of file
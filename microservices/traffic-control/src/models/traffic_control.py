@@ -31,6 +31,10 @@ class TrafficLight(db.Model):
 
 class TrafficSignal(db.Model):
     __tablename__ = 'traffic_signals'
+    __table_args__ = (
+        # Lets /signals range-scan live rows instead of every active one
+        db.Index('ix_traffic_signals_active_expires', 'is_active', 'expires_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     signal_id = db.Column(db.String(50), unique=True, nullable=False)
@@ -79,4 +83,12 @@ class ControlAction(db.Model):
             'created_at': self.created_at.isoformat(),
             'executed_at': self.executed_at.isoformat() if self.executed_at else None,
             'created_by': self.created_by
-        }
\ No newline at end of file
+        }
+
+# Time-limited claim on a job that must run in only one process at a time
+class ControlLease(db.Model):
+    __tablename__ = 'control_leases'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
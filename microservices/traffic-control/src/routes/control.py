@@ -1,25 +1,130 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from src.models.traffic_control import db, TrafficLight, TrafficSignal, ControlAction
-import requests
+from src.services.adaptive_control import window_cell_conditions, run_control_cycle, run_zone_cycle
+from src.services.control_scheduler import (
+    ControlScheduler, CycleLock, Zone, grid_zones, control_cycle_lock, parse_interval, parse_zone_grid
+)
+from src.services.signal_state import SignalStateTable, STATES, LIGHT_FIELDS, parse_utc
+from src.services.action_log import ActionLog, MAX_QUERY_LIMIT
+from src.services.signal_expiry import SignalExpiry
+from src.services.provisioning import (
+    upsert_traffic_lights, upsert_traffic_signals, summarize, invalid_keys, MAX_BULK_ITEMS
+)
+from src.services.emergency_corridor import (
+    CorridorIndex, GreenWave, lights_along_route, plan_green_wave,
+    DEFAULT_CORRIDOR_M, DEFAULT_SPEED_KMH, DEFAULT_LEAD_SECONDS, MAX_CORRIDOR_M
+)
+from common.event_log import FileEventLog
+from common.reading_window import ReadingWindow
+from common.live_feed import LiveFeed, init_blueprint as init_live_feed
+from common import json_rows, http_cache
+import numpy as np
 import json
+import os
+import threading
 from datetime import datetime, timedelta
 
 control_bp = Blueprint('control', __name__)
+# ETags for list endpoints and gzip/brotli for large JSON bodies
+control_bp.after_request(http_cache.finalize_response)
 
 # Configuration for other services
-DATA_INGESTION_URL = "http://localhost:5000/api"
 TRAFFIC_ANALYSIS_URL = "http://localhost:5001/api"
 TRAFFIC_PREDICTION_URL = "http://localhost:5002/api"
 
+# Background adaptive control, see start_control_scheduler()
+control_scheduler = None
+
+# Control actions are appended to a segmented log outside the service database;
+# override the location with the ACTION_LOG_DIR app config key
+ACTION_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'action_log')
+action_log = ActionLog()
+
+# Light state changes and control actions pushed to dashboard clients, see /stream
+live_feed = LiveFeed(('lights', 'actions'))
+
+# Authoritative light state; loaded from the database on first use. The
+# lease keeps a second traffic-control process from serving its own copy.
+LIGHT_STATE_LEASE_SECONDS = 30
+light_states = SignalStateTable(action_log=action_log, feed=live_feed,
+                                lease=CycleLock('light_state', lease_seconds=LIGHT_STATE_LEASE_SECONDS))
+_light_states_init_lock = threading.Lock()
+corridor_index = CorridorIndex(light_states)
+
+# Recent readings for adaptive control, kept warm from the ingestion event
+# log. Tests can set the EVENT_LOG app config key to a MemoryEventLog.
+READING_WINDOW_SECONDS = 3600
+reading_window = ReadingWindow(READING_WINDOW_SECONDS)
+_reading_window_init_lock = threading.Lock()
+
+# Deactivates signals at their expires_at
+signal_expiry = SignalExpiry()
+_signal_expiry_init_lock = threading.Lock()
+
+# Core columns behind TrafficSignal.to_dict(), for GET /signals
+SIGNAL_FIELDS, SIGNAL_COLUMNS = json_rows.table_fields(TrafficSignal.__table__)
+
+# Bumped after every signal write in this service; part of the /signals ETag
+signals_version = 0
+
+def signals_changed():
+    global signals_version
+    signals_version += 1
+
+def get_light_states():
+    """The signal state table, recovered and flushing in the background"""
+    if not light_states.loaded:
+        with _light_states_init_lock:
+            if not light_states.loaded:
+                open_action_log()
+                light_states.load()
+                light_states.start(current_app._get_current_object())
+    return light_states
+
+def get_reading_window():
+    """The reading window, replayed from the event log and following it"""
+    if reading_window.subscriber is None:
+        with _reading_window_init_lock:
+            if reading_window.subscriber is None:
+                log = current_app.config.get('EVENT_LOG') or FileEventLog(current_app.config.get('EVENT_LOG_DIR'))
+                reading_window.follow(log, 'traffic-control')
+    return reading_window
+
+def get_signal_expiry():
+    """The signal expiry scheduler, loaded and running in the background"""
+    if not signal_expiry.loaded:
+        with _signal_expiry_init_lock:
+            if not signal_expiry.loaded:
+                signal_expiry.load()
+                signal_expiry.start(current_app._get_current_object())
+    return signal_expiry
+
+def open_action_log():
+    """Open the action log, carrying over actions from the control_actions table once"""
+    if not action_log.is_open:
+        action_log.open(current_app.config.get('ACTION_LOG_DIR', ACTION_LOG_DIR))
+    
+    if action_log.next_id == 1:
+        table = ControlAction.__table__
+        batch = []
+        for row in db.session.execute(table.select().order_by(table.c.id)).mappings():
+            batch.append(dict(row))
+            if len(batch) >= 10000:
+                action_log.append(batch)
+                batch = []
+        action_log.append(batch)
+    return action_log
+
 @control_bp.route('/traffic-lights', methods=['GET'])
 def get_traffic_lights():
     """Get all traffic lights"""
     try:
-        lights = TrafficLight.query.filter_by(is_active=True).all()
-        return jsonify({
-            'traffic_lights': [light.to_dict() for light in lights],
-            'count': len(lights)
-        }), 200
+        states = get_light_states()
+        cached = http_cache.not_modified(states.version)
+        if cached:
+            return cached
+        lights = states.active_rows()
+        return json_rows.list_response('traffic_lights', lights, LIGHT_FIELDS, count=len(lights))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -49,6 +154,7 @@ def create_traffic_light():
         
         db.session.add(traffic_light)
         db.session.commit()
+        get_light_states().register_model(traffic_light)
         
         return jsonify({
             'message': 'Traffic light created successfully',
@@ -59,8 +165,32 @@ def create_traffic_light():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@control_bp.route('/traffic-lights/bulk', methods=['POST'])
+def bulk_upsert_traffic_lights():
+    """Create or update many traffic lights by light_id in one transaction"""
+    try:
+        data = request.get_json()
+        items = data.get('traffic_lights') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of traffic lights'}), 400
+        if len(items) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} items per request'}), 413
+        error = invalid_keys(items, 'light_id')
+        if error:
+            return jsonify({'error': error}), 400
+        
+        states = get_light_states()
+        update_existing = data.get('update_existing', True) if isinstance(data, dict) else True
+        results, rows, updated = upsert_traffic_lights(items, update_existing, states)
+        states.register_rows(rows, dirty=bool(updated))
+        
+        return jsonify(dict(summarize(results), results=results)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @control_bp.route('/traffic-lights/<light_id>/state', methods=['PUT'])
-def update_traffic_light_state():
+def update_traffic_light_state(light_id):
     """Update traffic light state"""
     try:
         data = request.get_json()
@@ -71,106 +201,52 @@ def update_traffic_light_state():
         if data['state'] not in ['RED', 'YELLOW', 'GREEN']:
             return jsonify({'error': 'Invalid state. Must be RED, YELLOW, or GREEN'}), 400
         
-        traffic_light = TrafficLight.query.filter_by(light_id=light_id).first()
-        if not traffic_light:
+        states = get_light_states()
+        slot = states.slot_of(light_id)
+        if slot is None:
             return jsonify({'error': 'Traffic light not found'}), 404
         
-        old_state = traffic_light.current_state
-        traffic_light.current_state = data['state']
-        traffic_light.last_updated = datetime.utcnow()
+        now = datetime.utcnow()
+        old_state = states.set_state(slot, data['state'], now)
         
-        # Log the control action
-        action = ControlAction(
-            action_type='LIGHT_CHANGE',
-            target_id=light_id,
-            action_data=json.dumps({
+        # Log the control action; both are persisted by the write-behind flusher
+        states.log_actions([{
+            'action_type': 'LIGHT_CHANGE',
+            'target_id': light_id,
+            'action_data': json.dumps({
                 'old_state': old_state,
                 'new_state': data['state'],
                 'reason': data.get('reason', 'Manual update')
             }),
-            status='EXECUTED',
-            executed_at=datetime.utcnow(),
-            created_by=data.get('operator', 'SYSTEM')
-        )
-        
-        db.session.add(action)
-        db.session.commit()
+            'status': 'EXECUTED',
+            'created_at': now,
+            'executed_at': now,
+            'created_by': data.get('operator', 'SYSTEM')
+        }])
         
         return jsonify({
             'message': 'Traffic light state updated successfully',
-            'traffic_light': traffic_light.to_dict()
+            'traffic_light': states.to_dict(slot)
         }), 200
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @control_bp.route('/adaptive-control', methods=['POST'])
 def adaptive_traffic_control():
     """Implement adaptive traffic control based on current conditions"""
     try:
-        # Get current traffic data
-        traffic_response = requests.get(f"{DATA_INGESTION_URL}/traffic-data?limit=50")
-        if traffic_response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch traffic data'}), 500
-        
-        traffic_data = traffic_response.json()['data']
-        
-        # Get traffic lights
-        traffic_lights = TrafficLight.query.filter_by(is_active=True).all()
-        
-        control_actions = []
-        
-        for light in traffic_lights:
-            # Find nearby traffic data
-            nearby_traffic = []
-            for traffic in traffic_data:
-                lat_diff = abs(traffic['location_lat'] - light.location_lat)
-                lng_diff = abs(traffic['location_lng'] - light.location_lng)
-                
-                if lat_diff <= 0.005 and lng_diff <= 0.005:  # Very close to intersection
-                    nearby_traffic.append(traffic)
-            
-            if nearby_traffic:
-                # Calculate average congestion
-                avg_vehicle_count = sum(t['vehicle_count'] for t in nearby_traffic) / len(nearby_traffic)
-                high_congestion_count = sum(1 for t in nearby_traffic if t['congestion_level'] == 'HIGH')
-                
-                # Determine optimal light timing
-                new_cycle_duration = light.cycle_duration
-                recommended_state = light.current_state
-                
-                if high_congestion_count > len(nearby_traffic) * 0.5:
-                    # High congestion - extend green time
-                    new_cycle_duration = min(180, light.cycle_duration + 30)
-                    if light.current_state == 'RED':
-                        recommended_state = 'GREEN'
-                elif avg_vehicle_count < 20:
-                    # Low traffic - reduce cycle time
-                    new_cycle_duration = max(60, light.cycle_duration - 20)
-                
-                # Update if changes are needed
-                if new_cycle_duration != light.cycle_duration:
-                    light.cycle_duration = new_cycle_duration
-                    
-                    action = ControlAction(
-                        action_type='LIGHT_TIMING_UPDATE',
-                        target_id=light.light_id,
-                        action_data=json.dumps({
-                            'old_cycle_duration': light.cycle_duration,
-                            'new_cycle_duration': new_cycle_duration,
-                            'avg_vehicle_count': round(avg_vehicle_count, 1),
-                            'high_congestion_areas': high_congestion_count
-                        }),
-                        status='EXECUTED',
-                        executed_at=datetime.utcnow(),
-                        created_by='ADAPTIVE_SYSTEM'
-                    )
-                    
-                    db.session.add(action)
-                    control_actions.append(action.to_dict())
-        
-        db.session.commit()
+        # Never overlap with a scheduled or concurrent cycle on the same lights
+        if not control_cycle_lock.acquire():
+            return jsonify({'error': 'An adaptive control cycle is already running'}), 409
+        
+        try:
+            # Get current traffic conditions per grid cell, then decide and
+            # persist timings for every active light in one vectorized pass
+            conditions = window_cell_conditions(get_reading_window())
+            control_actions = run_control_cycle(get_light_states(), conditions)
+        finally:
+            control_cycle_lock.release()
         
         return jsonify({
             'message': 'Adaptive traffic control executed',
@@ -179,12 +255,86 @@ def adaptive_traffic_control():
             'control_actions': control_actions
         }), 200
         
-    except requests.RequestException as e:
-        return jsonify({'error': f'Failed to connect to traffic data service: {str(e)}'}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def start_control_scheduler(app, interval_seconds, zones):
+    """Start (or restart) the in-process adaptive control scheduler"""
+    global control_scheduler
+    
+    if control_scheduler is not None:
+        control_scheduler.stop()
+    
+    with app.app_context():
+        states = get_light_states()
+        window = get_reading_window()
+    
+    control_scheduler = ControlScheduler(
+        app,
+        lambda zone: len(run_zone_cycle(lambda bounds: window_cell_conditions(window, bounds=bounds), states, zone)),
+        zones,
+        interval_seconds=interval_seconds
+    )
+    control_scheduler.start()
+    return control_scheduler
+
+def build_zones(zone_grid=None, zones=None):
+    """Zones from explicit bounds, a rows x cols split of the active lights, or one city zone"""
+    if zones:
+        return [Zone(z['name'], z.get('min_lat'), z.get('min_lng'), z.get('max_lat'), z.get('max_lng')) for z in zones]
+    
+    if zone_grid:
+        rows, cols = zone_grid
+        bounds = db.session.query(
+            db.func.min(TrafficLight.location_lat), db.func.min(TrafficLight.location_lng),
+            db.func.max(TrafficLight.location_lat), db.func.max(TrafficLight.location_lng)
+        ).filter(TrafficLight.is_active == True).one()
+        if bounds[0] is not None:
+            return grid_zones(*bounds, rows, cols)
+    
+    return [Zone('city')]
+
+@control_bp.route('/adaptive-control/scheduler', methods=['GET'])
+def get_control_scheduler():
+    """Get scheduler state and per-zone cycle metrics"""
+    if control_scheduler is None:
+        return jsonify({'running': False, 'zones': []}), 200
+    return jsonify(control_scheduler.to_dict()), 200
+
+@control_bp.route('/adaptive-control/scheduler/start', methods=['POST'])
+def start_scheduler():
+    """Start running adaptive control continuously"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        interval_seconds = parse_interval(data.get('interval_seconds', 30))
+        zone_grid = parse_zone_grid(data['zone_grid']) if data.get('zone_grid') else None
+        zones = build_zones(zone_grid, data.get('zones'))
+        scheduler = start_control_scheduler(current_app._get_current_object(), interval_seconds, zones)
+        
+        return jsonify({
+            'message': 'Adaptive control scheduler started',
+            'scheduler': scheduler.to_dict()
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@control_bp.route('/adaptive-control/scheduler/stop', methods=['POST'])
+def stop_scheduler():
+    """Stop the adaptive control scheduler after its current cycle"""
+    if control_scheduler is None:
+        return jsonify({'message': 'Adaptive control scheduler is not running'}), 200
+    
+    control_scheduler.stop(timeout=60)
+    return jsonify({
+        'message': 'Adaptive control scheduler stopped',
+        'scheduler': control_scheduler.to_dict()
+    }), 200
+
 @control_bp.route('/emergency-response', methods=['POST'])
 def emergency_response():
     """Handle emergency response traffic control"""
@@ -196,24 +346,20 @@ def emergency_response():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
+        if data.get('mode') == 'corridor':
+            return emergency_corridor(data)
+        
         emergency_lat = data['location_lat']
         emergency_lng = data['location_lng']
         emergency_type = data['emergency_type']
         
         # Find nearby traffic lights (within 0.01 degrees, roughly 1km)
-        nearby_lights = TrafficLight.query.filter(
-            TrafficLight.is_active == True
-        ).all()
+        states = get_light_states()
+        active = states.active_slots()
+        near = (np.abs(states.lat[active] - emergency_lat) <= 0.01) & (np.abs(states.lng[active] - emergency_lng) <= 0.01)
+        affected_slots = active[near]
         
-        affected_lights = []
-        for light in nearby_lights:
-            lat_diff = abs(light.location_lat - emergency_lat)
-            lng_diff = abs(light.location_lng - emergency_lng)
-            
-            if lat_diff <= 0.01 and lng_diff <= 0.01:
-                affected_lights.append(light)
-        
-        control_actions = []
+        now = datetime.utcnow()
         
         # Create emergency signals
         emergency_signal = TrafficSignal(
@@ -227,37 +373,35 @@ def emergency_response():
         )
         
         db.session.add(emergency_signal)
-        
-        # Update traffic lights for emergency corridor
-        for light in affected_lights:
-            # Set lights to facilitate emergency vehicle passage
-            old_state = light.current_state
-            light.current_state = 'GREEN'  # Assume green for emergency route
-            light.last_updated = datetime.utcnow()
-            
-            action = ControlAction(
-                action_type='EMERGENCY_OVERRIDE',
-                target_id=light.light_id,
-                action_data=json.dumps({
-                    'emergency_type': emergency_type,
-                    'old_state': old_state,
-                    'new_state': 'GREEN',
-                    'emergency_location': {'lat': emergency_lat, 'lng': emergency_lng}
-                }),
-                status='EXECUTED',
-                executed_at=datetime.utcnow(),
-                created_by='EMERGENCY_SYSTEM'
-            )
-            
-            db.session.add(action)
-            control_actions.append(action.to_dict())
-        
         db.session.commit()
+        get_signal_expiry().schedule(emergency_signal.id, emergency_signal.expires_at)
+        signals_changed()
+        
+        # Set lights to facilitate emergency vehicle passage (assume green for
+        # the emergency route); the flusher persists states and actions
+        old_states = states.set_states(affected_slots, 'GREEN', now)
+        action_rows = [{
+            'action_type': 'EMERGENCY_OVERRIDE',
+            'target_id': states.light_ids[slot],
+            'action_data': json.dumps({
+                'emergency_type': emergency_type,
+                'old_state': old_state,
+                'new_state': 'GREEN',
+                'emergency_location': {'lat': emergency_lat, 'lng': emergency_lng}
+            }),
+            'status': 'EXECUTED',
+            'created_at': now,
+            'executed_at': now,
+            'created_by': 'EMERGENCY_SYSTEM'
+        } for slot, old_state in zip(affected_slots.tolist(), old_states)]
+        states.log_actions(action_rows)
+        
+        control_actions = [dict(row, created_at=now.isoformat(), executed_at=now.isoformat()) for row in action_rows]
         
         return jsonify({
             'message': 'Emergency response activated',
             'emergency_signal': emergency_signal.to_dict(),
-            'affected_lights': len(affected_lights),
+            'affected_lights': len(affected_slots),
             'control_actions': control_actions
         }), 200
         
@@ -265,15 +409,146 @@ def emergency_response():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def emergency_corridor(data):
+    """Green-wave the lights along an emergency vehicle's route.
+    
+    The route is ``route`` ([[lat, lng], ...]) or a straight line from
+    location_lat/lng to destination_lat/lng. Lights within ``corridor_m`` of
+    it turn green ``lead_seconds`` before the vehicle's estimated arrival.
+    """
+    if data.get('route'):
+        route = np.asarray(data['route'], dtype=np.float64)
+        if route.ndim != 2 or route.shape[1] != 2 or len(route) < 2:
+            return jsonify({'error': 'route must be a list of at least two [lat, lng] points'}), 400
+    elif 'destination_lat' in data and 'destination_lng' in data:
+        route = np.array([[data['location_lat'], data['location_lng']],
+                          [data['destination_lat'], data['destination_lng']]], dtype=np.float64)
+    else:
+        return jsonify({'error': 'Corridor mode needs a route or destination_lat/destination_lng'}), 400
+    
+    corridor_m = float(data.get('corridor_m', DEFAULT_CORRIDOR_M))
+    speed_kmh = float(data.get('speed_kmh', DEFAULT_SPEED_KMH))
+    lead_seconds = float(data.get('lead_seconds', DEFAULT_LEAD_SECONDS))
+    if not 0 < corridor_m <= MAX_CORRIDOR_M:
+        return jsonify({'error': f'corridor_m must be between 0 and {MAX_CORRIDOR_M}'}), 400
+    if speed_kmh <= 0:
+        return jsonify({'error': 'speed_kmh must be positive'}), 400
+    
+    emergency_type = data['emergency_type']
+    states = get_light_states()
+    slots, along_m, offset_m = lights_along_route(corridor_index.grid(), route[:, 0], route[:, 1], corridor_m)
+    eta_seconds, green_in_seconds = plan_green_wave(along_m, speed_kmh, lead_seconds)
+    
+    now = datetime.utcnow()
+    emergency_signal = TrafficSignal(
+        signal_id=f"EMERGENCY_{now.strftime('%Y%m%d_%H%M%S_%f')}",
+        signal_type='EMERGENCY_RESPONSE',
+        location_lat=data['location_lat'],
+        location_lng=data['location_lng'],
+        message=f"Emergency Response: {emergency_type}. Clear the route.",
+        priority='CRITICAL',
+        expires_at=now + timedelta(hours=2)
+    )
+    
+    due_now = green_in_seconds <= 0
+    old_states = [STATES[code] for code in states.state[slots]]
+    states.set_states(slots[due_now], 'GREEN', now)
+    
+    action_rows = []
+    for sequence, slot in enumerate(slots.tolist()):
+        green_at = now + timedelta(seconds=float(green_in_seconds[sequence]))
+        action_rows.append({
+            'action_type': 'EMERGENCY_OVERRIDE',
+            'target_id': states.light_ids[slot],
+            'action_data': {
+                'emergency_type': emergency_type,
+                'new_state': 'GREEN',
+                'sequence': sequence,
+                'distance_along_route_m': round(float(along_m[sequence]), 1),
+                'distance_from_route_m': round(float(offset_m[sequence]), 1),
+                'eta_seconds': round(float(eta_seconds[sequence]), 1),
+                'green_at': green_at.isoformat(),
+                'emergency_location': {'lat': data['location_lat'], 'lng': data['location_lng']}
+            },
+            'status': 'EXECUTED' if due_now[sequence] else 'SCHEDULED',
+            'created_at': now,
+            'executed_at': now if due_now[sequence] else green_at,
+            'created_by': 'EMERGENCY_SYSTEM'
+        })
+    
+    # Lights switched now are logged now; the green wave logs the rest as it switches them
+    states.log_actions([
+        dict(row, action_data=json.dumps(dict(row['action_data'], old_state=old_states[sequence])))
+        for sequence, row in enumerate(action_rows) if due_now[sequence]
+    ])
+    
+    # Signal, corridor light states and action log commit in one transaction
+    db.session.add(emergency_signal)
+    states.flush()
+    # flush() has nothing to commit when the route crosses no lights
+    db.session.commit()
+    get_signal_expiry().schedule(emergency_signal.id, emergency_signal.expires_at)
+    signals_changed()
+    
+    if not due_now.all():
+        scheduled = [row for sequence, row in enumerate(action_rows) if not due_now[sequence]]
+        GreenWave(states, slots[~due_now], green_in_seconds[~due_now], scheduled, emergency_signal.signal_id).start()
+    
+    control_actions = [dict(row, action_data=json.dumps(dict(row['action_data'], old_state=old_states[sequence])),
+                            created_at=now.isoformat(), executed_at=row['executed_at'].isoformat())
+                       for sequence, row in enumerate(action_rows)]
+    
+    return jsonify({
+        'message': 'Emergency corridor activated',
+        'mode': 'corridor',
+        'emergency_signal': emergency_signal.to_dict(),
+        'affected_lights': len(slots),
+        'control_actions': control_actions
+    }), 200
+
 @control_bp.route('/signals', methods=['GET'])
 def get_traffic_signals():
-    """Get active traffic signals"""
+    """Get live traffic signals (active and not yet expired)"""
     try:
-        signals = TrafficSignal.query.filter_by(is_active=True).all()
-        return jsonify({
-            'signals': [signal.to_dict() for signal in signals],
-            'count': len(signals)
-        }), 200
+        get_signal_expiry()
+        live = db.and_(
+            TrafficSignal.is_active == True,
+            db.or_(TrafficSignal.expires_at.is_(None), TrafficSignal.expires_at > datetime.utcnow())
+        )
+        # Writes bump signals_version; expiry only shrinks the live count
+        cached = http_cache.not_modified(
+            signals_version, db.session.query(db.func.count(TrafficSignal.id)).filter(live).scalar()
+        )
+        if cached:
+            return cached
+        rows = db.session.execute(db.select(*SIGNAL_COLUMNS).where(live)).all()
+        return json_rows.list_response('signals', rows, SIGNAL_FIELDS, count=len(rows))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@control_bp.route('/signals/bulk', methods=['POST'])
+def bulk_upsert_traffic_signals():
+    """Create or update many traffic signals by signal_id in one transaction"""
+    try:
+        data = request.get_json()
+        items = data.get('signals') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of signals'}), 400
+        if len(items) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} items per request'}), 413
+        error = invalid_keys(items, 'signal_id')
+        if error:
+            return jsonify({'error': error}), 400
+        
+        expiry = get_signal_expiry()
+        update_existing = data.get('update_existing', True) if isinstance(data, dict) else True
+        results, scheduled = upsert_traffic_signals(items, update_existing)
+        for signal_id, expires_at in scheduled:
+            expiry.schedule(signal_id, expires_at)
+        signals_changed()
+        
+        return jsonify(dict(summarize(results), results=results)), 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -288,6 +563,12 @@ def create_traffic_signal():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
+        # Parsed before anything is written, as the naive UTC the expiry scheduler compares
+        try:
+            expires_at = parse_utc(data['expires_at']) if data.get('expires_at') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'expires_at must be an ISO 8601 timestamp'}), 400
+        
         signal = TrafficSignal(
             signal_id=data['signal_id'],
             signal_type=data['signal_type'],
@@ -295,11 +576,13 @@ def create_traffic_signal():
             location_lng=data['location_lng'],
             message=data['message'],
             priority=data.get('priority', 'MEDIUM'),
-            expires_at=datetime.fromisoformat(data['expires_at']) if data.get('expires_at') else None
+            expires_at=expires_at
         )
         
         db.session.add(signal)
         db.session.commit()
+        get_signal_expiry().schedule(signal.id, signal.expires_at)
+        signals_changed()
         
         return jsonify({
             'message': 'Traffic signal created successfully',
@@ -310,17 +593,83 @@ def create_traffic_signal():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@control_bp.route('/signals/expiry/stats', methods=['GET'])
+def get_signal_expiry_stats():
+    """Get signal expiry scheduler stats"""
+    try:
+        return jsonify(get_signal_expiry().stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @control_bp.route('/actions', methods=['GET'])
 def get_control_actions():
-    """Get recent control actions"""
+    """Get control actions, newest first, optionally by target and time range"""
+    return query_control_actions(request.args.get('target_id'))
+
+@control_bp.route('/actions/targets/<target_id>', methods=['GET'])
+def get_target_control_actions(target_id):
+    """Get control actions for one light or signal, newest first"""
+    return query_control_actions(target_id)
+
+def query_control_actions(target_id):
+    """Page the action log with ?since=&until=&limit=&cursor="""
     try:
+        since = request.args.get('since')
+        until = request.args.get('until')
         limit = request.args.get('limit', 50, type=int)
-        actions = ControlAction.query.order_by(ControlAction.created_at.desc()).limit(limit).all()
+        if not 1 <= limit <= MAX_QUERY_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {MAX_QUERY_LIMIT}; page with next_cursor for more'}), 400
+        get_light_states()
+        cached = http_cache.not_modified(*action_log.watermark())
+        if cached:
+            return cached
+        
+        actions, next_cursor = action_log.query(
+            target_id=target_id,
+            since=datetime.fromisoformat(since) if since else None,
+            until=datetime.fromisoformat(until) if until else None,
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
         
-        return jsonify({
-            'actions': [action.to_dict() for action in actions],
-            'count': len(actions)
-        }), 200
+        return json_rows.list_response('actions', actions, count=len(actions), next_cursor=next_cursor)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@control_bp.route('/action-log/stats', methods=['GET'])
+def get_action_log_stats():
+    """Get action log segment layout and counters"""
+    try:
+        get_light_states()
+        return jsonify(action_log.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@control_bp.route('/action-log/compact', methods=['POST'])
+def compact_action_log():
+    """Merge small sealed action log segments"""
+    try:
+        data = request.get_json(silent=True) or {}
+        get_light_states()
+        removed = action_log.compact(data.get('target_rows'))
+        return jsonify({'message': 'Action log compacted', 'segments_removed': removed}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@control_bp.route('/action-log/archive', methods=['POST'])
+def archive_action_log():
+    """Move sealed segments older than older_than_days (default 90) to the archive"""
+    try:
+        data = request.get_json(silent=True) or {}
+        older_than_days = data.get('older_than_days', 90)
+        if older_than_days < 0:
+            return jsonify({'error': 'older_than_days must not be negative'}), 400
+        
+        get_light_states()
+        archived = action_log.archive_older_than_days(older_than_days)
+        return jsonify({'message': 'Action log archived', 'segments_archived': archived}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -337,22 +686,20 @@ def initialize_demo_data():
             {'light_id': 'TL_005', 'lat': 40.6892, 'lng': -74.0445, 'name': 'Brooklyn Bridge'},
         ]
         
-        created_lights = []
-        for light_data in demo_lights:
-            existing = TrafficLight.query.filter_by(light_id=light_data['light_id']).first()
-            if not existing:
-                light = TrafficLight(
-                    light_id=light_data['light_id'],
-                    location_lat=light_data['lat'],
-                    location_lng=light_data['lng'],
-                    intersection_name=light_data['name'],
-                    current_state='GREEN',
-                    cycle_duration=120
-                )
-                db.session.add(light)
-                created_lights.append(light.to_dict())
-        
-        db.session.commit()
+        # One lookup and one bulk insert; existing lights are left as they are
+        states = get_light_states()
+        results, rows, _ = upsert_traffic_lights([{
+            'light_id': light_data['light_id'],
+            'location_lat': light_data['lat'],
+            'location_lng': light_data['lng'],
+            'intersection_name': light_data['name'],
+            'current_state': 'GREEN',
+            'cycle_duration': 120
+        } for light_data in demo_lights], update_existing=False)
+        states.register_rows(rows)
+        
+        created_lights = [states.to_dict(states.slot_of(result['light_id']))
+                          for result in results if result['status'] == 'created']
         
         return jsonify({
             'message': 'Demo data initialized successfully',
@@ -364,6 +711,34 @@ def initialize_demo_data():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@control_bp.route('/signal-state/stats', methods=['GET'])
+def get_signal_state_stats():
+    """Get in-memory signal state table size and write-behind queue stats"""
+    try:
+        return jsonify(get_light_states().stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@control_bp.route('/signal-state/flush', methods=['POST'])
+def flush_signal_state():
+    """Persist pending signal state changes immediately"""
+    try:
+        flushed = get_light_states().flush()
+        return jsonify({'message': 'Signal state flushed', 'rows_flushed': flushed}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# GET /stream and /stream/stats; lights only publish once the state table is loaded
+init_live_feed(control_bp, live_feed, before_subscribe=get_light_states)
+
+@control_bp.route('/reading-window/stats', methods=['GET'])
+def get_reading_window_stats():
+    """Get the in-memory reading window size and event log consumer lag"""
+    try:
+        return jsonify(get_reading_window().stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @control_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
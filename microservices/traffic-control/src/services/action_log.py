@@ -0,0 +1,390 @@
+"""Append-only, segmented control action log.
+
+Actions are kept out of the live service database in a directory of
+SQLite segment files (``actions_<first id>.db``). Each segment stores rows
+under a global, monotonically increasing id and has its own indexes on
+(target_id, created_at) and created_at, so paging by target and time range
+is an index range scan over only the segments whose time span overlaps the
+query. Appends go to the newest segment in one executemany transaction per
+batch; it is sealed and a new one started once it reaches
+``segment_max_rows`` or ``segment_max_seconds``.
+
+Sealed segments never change again except through ``compact`` (merge small
+neighbouring segments into one) and ``archive`` (gzip segments older than a
+cutoff into ``archive/`` and drop them from queries).
+"""
+import gzip
+import heapq
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from src.services.signal_state import to_micros, from_micros
+
+DEFAULT_SEGMENT_MAX_ROWS = 250_000
+DEFAULT_SEGMENT_MAX_SECONDS = 24 * 3600
+DEFAULT_QUERY_LIMIT = 50
+MAX_QUERY_LIMIT = 1000
+SEGMENT_PATTERN = re.compile(r'^actions_(\d{12})\.db$')
+COLUMNS = ('id', 'created_micros', 'executed_micros', 'target_id', 'action_type', 'status', 'created_by', 'action_data')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    created_micros INTEGER NOT NULL,
+    executed_micros INTEGER,
+    target_id TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    status TEXT,
+    created_by TEXT,
+    action_data TEXT
+)
+"""
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_actions_target_time ON actions (target_id, created_micros)",
+    "CREATE INDEX IF NOT EXISTS ix_actions_time ON actions (created_micros)",
+)
+
+
+def encode_cursor(created_micros, action_id):
+    return f"{created_micros}:{action_id}"
+
+
+def decode_cursor(cursor):
+    created_micros, action_id = cursor.split(':')
+    return int(created_micros), int(action_id)
+
+
+class Segment:
+    """One segment file and its id/time span"""
+
+    def __init__(self, path, first_id):
+        self.path = path
+        self.first_id = first_id
+        self.last_id = first_id - 1
+        self.rows = 0
+        self.min_micros = None
+        self.max_micros = None
+        self.sealed = False
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(SCHEMA)
+            for statement in INDEXES:
+                self._conn.execute(statement)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def refresh(self):
+        rows, last_id, min_micros, max_micros = self.conn.execute(
+            'SELECT COUNT(*), MAX(id), MIN(created_micros), MAX(created_micros) FROM actions').fetchone()
+        self.rows = rows
+        self.last_id = last_id if last_id is not None else self.first_id - 1
+        self.min_micros, self.max_micros = min_micros, max_micros
+
+    def overlaps(self, since_micros, until_micros):
+        if self.rows == 0:
+            return False
+        if since_micros is not None and self.max_micros < since_micros:
+            return False
+        if until_micros is not None and self.min_micros > until_micros:
+            return False
+        return True
+
+    def to_dict(self):
+        return {
+            'file': os.path.basename(self.path),
+            'first_id': self.first_id,
+            'last_id': self.last_id,
+            'rows': self.rows,
+            'sealed': self.sealed,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'oldest': from_micros(self.min_micros).isoformat() if self.min_micros is not None else None,
+            'newest': from_micros(self.max_micros).isoformat() if self.max_micros is not None else None
+        }
+
+
+class ActionLog:
+    """Segmented action log with batched appends and keyset-paged queries"""
+
+    def __init__(self, segment_max_rows=DEFAULT_SEGMENT_MAX_ROWS, segment_max_seconds=DEFAULT_SEGMENT_MAX_SECONDS):
+        self.segment_max_rows = segment_max_rows
+        self.segment_max_seconds = segment_max_seconds
+        self.directory = None
+        self.segments = []
+        self.next_id = 1
+        self.appended = 0
+        self.archived_segments = 0
+        self._lock = threading.RLock()
+
+    @property
+    def is_open(self):
+        return self.directory is not None
+
+    def open(self, directory):
+        """Open (or create) the log in a directory and recover its segments"""
+        with self._lock:
+            self.close()
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+            names = sorted(name for name in os.listdir(directory) if SEGMENT_PATTERN.match(name))
+            for name in names:
+                segment = Segment(os.path.join(directory, name), int(SEGMENT_PATTERN.match(name).group(1)))
+                segment.refresh()
+                segment.sealed = True
+                self.segments.append(segment)
+            if self.segments:
+                self.segments[-1].sealed = False
+                self.next_id = max(segment.last_id for segment in self.segments) + 1
+            return self
+
+    def close(self):
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+            self.directory = None
+
+    def _segment_path(self, first_id, directory=None):
+        return os.path.join(directory or self.directory, f"actions_{first_id:012d}.db")
+
+    def _active_segment(self, newest_micros):
+        """The segment to append to, rotating when it is full or spans too long"""
+        active = self.segments[-1] if self.segments else None
+        if active is not None and not active.sealed:
+            span_seconds = (newest_micros - active.min_micros) / 1e6 if active.rows else 0
+            if active.rows < self.segment_max_rows and span_seconds < self.segment_max_seconds:
+                return active
+            active.sealed = True
+            active.close()
+        segment = Segment(self._segment_path(self.next_id), self.next_id)
+        segment.refresh()
+        self.segments.append(segment)
+        return segment
+
+    # Writes
+
+    def append(self, actions, written=None):
+        """Append ControlAction column dicts; returns their ids.
+
+        Each segment's batch is its own transaction, so when a later batch
+        fails the earlier ones are already durable. Pass a list as ``written``
+        to have the ids of committed actions added to it as each batch lands;
+        the caller can then retry only ``actions[len(written):]``.
+        """
+        if not actions:
+            return []
+        with self._lock:
+            ids = [] if written is None else written
+            start = len(ids)
+            now = datetime.utcnow()
+            pending = list(actions)
+            while pending:
+                segment = self._active_segment(to_micros(pending[0].get('created_at') or now))
+                batch = pending[:max(self.segment_max_rows - segment.rows, 1)]
+                pending = pending[len(batch):]
+                first_id = self.next_id
+                rows = [(
+                    first_id + offset,
+                    to_micros(action.get('created_at') or now),
+                    to_micros(action['executed_at']) if action.get('executed_at') else None,
+                    action['target_id'],
+                    action['action_type'],
+                    action.get('status', 'PENDING'),
+                    action.get('created_by', 'SYSTEM'),
+                    action.get('action_data')
+                ) for offset, action in enumerate(batch)]
+                with segment.conn:
+                    segment.conn.executemany(f"INSERT INTO actions ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+                created = [row[1] for row in rows]
+                segment.min_micros = min(created + ([segment.min_micros] if segment.min_micros is not None else []))
+                segment.max_micros = max(created + ([segment.max_micros] if segment.max_micros is not None else []))
+                segment.rows += len(rows)
+                segment.last_id = first_id + len(rows) - 1
+                self.next_id = segment.last_id + 1
+                self.appended += len(rows)
+                ids.extend(range(first_id, self.next_id))
+            return ids[start:]
+
+    # Reads
+
+    def query(self, target_id=None, since=None, until=None, cursor=None, limit=DEFAULT_QUERY_LIMIT):
+        """Newest-first page of actions, optionally for one target and time range.
+
+        Returns (actions, next cursor or None). Segments are visited newest
+        first and the walk stops once no older segment can beat the page.
+        Raises ValueError unless 1 <= limit <= MAX_QUERY_LIMIT.
+        """
+        limit = int(limit)
+        if not 1 <= limit <= MAX_QUERY_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_QUERY_LIMIT}; page with next_cursor for more")
+        since_micros = to_micros(since) if since else None
+        until_micros = to_micros(until) if until else None
+        before = decode_cursor(cursor) if cursor else None
+
+        where, params = [], []
+        if target_id is not None:
+            where.append('target_id = ?')
+            params.append(target_id)
+        if since_micros is not None:
+            where.append('created_micros >= ?')
+            params.append(since_micros)
+        if until_micros is not None:
+            where.append('created_micros <= ?')
+            params.append(until_micros)
+        if before is not None:
+            where.append('(created_micros < ? OR (created_micros = ? AND id < ?))')
+            params.extend((before[0], before[0], before[1]))
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM actions"
+               f"{' WHERE ' + ' AND '.join(where) if where else ''}"
+               f" ORDER BY created_micros DESC, id DESC LIMIT ?")
+        upper_micros = min(v for v in (until_micros, before[0] if before else None) if v is not None) \
+            if until_micros is not None or before is not None else None
+
+        with self._lock:
+            candidates = sorted(
+                (segment for segment in self.segments if segment.overlaps(since_micros, upper_micros)),
+                key=lambda segment: segment.max_micros, reverse=True
+            )
+            page = []
+            for segment in candidates:
+                # Remaining segments are all older than the page's oldest row
+                if len(page) >= limit and segment.max_micros < page[0][0][0]:
+                    break
+                for row in segment.conn.execute(sql, params + [limit]):
+                    key = (row[1], row[0])
+                    if len(page) < limit:
+                        heapq.heappush(page, (key, row))
+                    elif key > page[0][0]:
+                        heapq.heapreplace(page, (key, row))
+                    else:
+                        break
+
+        rows = [row for _, row in sorted(page, reverse=True)]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return [self._row_to_dict(row) for row in rows], next_cursor
+
+    @staticmethod
+    def _row_to_dict(row):
+        action_id, created_micros, executed_micros, target_id, action_type, status, created_by, action_data = row
+        return {
+            'id': action_id,
+            'action_type': action_type,
+            'target_id': target_id,
+            'action_data': action_data,
+            'status': status,
+            'created_at': from_micros(created_micros).isoformat(),
+            'executed_at': from_micros(executed_micros).isoformat() if executed_micros is not None else None,
+            'created_by': created_by
+        }
+
+    # Maintenance
+
+    def compact(self, target_rows=None):
+        """Merge runs of neighbouring sealed segments up to target_rows each.
+
+        Returns the number of segment files removed.
+        """
+        target_rows = target_rows or self.segment_max_rows
+        with self._lock:
+            sealed = [segment for segment in self.segments if segment.sealed]
+            runs, run = [], []
+            for segment in sealed:
+                if run and sum(s.rows for s in run) + segment.rows > target_rows:
+                    runs.append(run)
+                    run = []
+                run.append(segment)
+            runs.append(run)
+
+            removed = 0
+            for run in runs:
+                if len(run) < 2:
+                    continue
+                merged_path = run[0].path + '.compact'
+                if os.path.exists(merged_path):
+                    os.remove(merged_path)
+                merged = sqlite3.connect(merged_path)
+                try:
+                    merged.execute(SCHEMA)
+                    for index, segment in enumerate(run):
+                        segment.close()
+                        merged.execute(f"ATTACH DATABASE ? AS source{index}", (segment.path,))
+                        merged.execute(f"INSERT INTO actions SELECT {', '.join(COLUMNS)} FROM source{index}.actions ORDER BY id")
+                        merged.commit()
+                        merged.execute(f"DETACH DATABASE source{index}")
+                    # Build indexes once after the bulk copy
+                    for statement in INDEXES:
+                        merged.execute(statement)
+                    merged.commit()
+                finally:
+                    merged.close()
+
+                for segment in run:
+                    for suffix in ('', '-wal', '-shm'):
+                        if os.path.exists(segment.path + suffix):
+                            os.remove(segment.path + suffix)
+                os.replace(merged_path, run[0].path)
+
+                first = run[0]
+                first.refresh()
+                first.close()
+                position = self.segments.index(first)
+                self.segments[position + 1:position + len(run)] = []
+                removed += len(run) - 1
+            return removed
+
+    def archive(self, older_than):
+        """Gzip sealed segments whose newest action is before older_than into archive/"""
+        cutoff = to_micros(older_than)
+        archive_dir = os.path.join(self.directory, 'archive')
+        with self._lock:
+            expired = [segment for segment in self.segments
+                       if segment.sealed and segment.max_micros is not None and segment.max_micros < cutoff]
+            if expired:
+                os.makedirs(archive_dir, exist_ok=True)
+            for segment in expired:
+                segment.close()
+                with open(segment.path, 'rb') as source, \
+                        gzip.open(os.path.join(archive_dir, os.path.basename(segment.path) + '.gz'), 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(segment.path + suffix):
+                        os.remove(segment.path + suffix)
+                self.segments.remove(segment)
+            self.archived_segments += len(expired)
+            return len(expired)
+
+    def archive_older_than_days(self, days):
+        return self.archive(datetime.utcnow() - timedelta(days=days))
+
+    def watermark(self):
+        """(next id, rows held); changes on every append and archive"""
+        with self._lock:
+            return self.next_id, sum(segment.rows for segment in self.segments)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'segments': len(self.segments),
+                'rows': sum(segment.rows for segment in self.segments),
+                'next_id': self.next_id,
+                'appended': self.appended,
+                'archived_segments': self.archived_segments,
+                'segment_max_rows': self.segment_max_rows,
+                'segment_max_seconds': self.segment_max_seconds,
+                'segment_files': [segment.to_dict() for segment in self.segments]
+            }
@@ -0,0 +1,316 @@
+"""In-process scheduler that runs adaptive control continuously per zone.
+
+Each zone is ticked every ``interval_seconds``, with zones staggered evenly
+across the interval so their database writes do not all land at once. A
+process-wide lock gives single-flight semantics: a cycle never starts while
+another one (scheduled or triggered over HTTP) is still running. When a
+zone falls behind it skips the missed ticks instead of running them back to
+back.
+
+Light state is served from one process's in-memory table (see
+signal_state), so traffic-control runs as a single serving process and the
+table's ``light_state`` lease makes a second one fail to load instead of
+serving stale lights. Cycles also take the ``adaptive_control`` lease row in
+the service database, claimed with a conditional UPDATE and released when the
+cycle ends, so a process that outlives its successor (e.g. across a debug
+reloader restart) cannot run one concurrently. A process that dies mid-cycle
+leaves the lease to expire after ``LEASE_SECONDS``.
+"""
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from src.models.traffic_control import db, ControlLease
+
+DEFAULT_INTERVAL_SECONDS = 30
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Longer than any control cycle, so only a dead holder's lease expires
+LEASE_SECONDS = 300
+
+
+class CycleLock:
+    """Non-blocking lock held by one thread of one process at a time.
+
+    ``acquire()`` and ``release()`` need an app context; the lease is
+    written on its own connection so it never commits the caller's session.
+    """
+
+    def __init__(self, name, lease_seconds=LEASE_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            claimed = self._claim()
+        except Exception:
+            self._lock.release()
+            raise
+        if not claimed:
+            self._lock.release()
+        return claimed
+
+    def renew(self):
+        """Extend a held lease; False if another process has taken it over"""
+        return self._claim()
+
+    def _claim(self):
+        table = ControlLease.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        with db.engine.begin() as connection:
+            claimed = connection.execute(
+                table.update()
+                .where(table.c.name == self.name)
+                .where(db.or_(table.c.expires_at <= now, table.c.holder == self.holder))
+                .values(holder=self.holder, expires_at=expires_at)
+            ).rowcount
+        if claimed:
+            return True
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.insert().values(name=self.name, holder=self.holder, expires_at=expires_at))
+        except IntegrityError:
+            # Another process holds an unexpired lease
+            return False
+        return True
+
+    def release(self):
+        table = ControlLease.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    table.update()
+                    .where(table.c.name == self.name)
+                    .where(table.c.holder == self.holder)
+                    .values(expires_at=datetime.utcnow())
+                )
+        finally:
+            self._lock.release()
+
+
+# Held for the duration of any adaptive control cycle
+control_cycle_lock = CycleLock('adaptive_control')
+
+
+class Zone:
+    """Rectangular control zone; None bounds are open-ended.
+
+    Bounds are half-open ([min, max)) so a light on a shared edge belongs
+    to exactly one zone.
+    """
+
+    def __init__(self, name, min_lat=None, min_lng=None, max_lat=None, max_lng=None):
+        self.name = name
+        self.min_lat = min_lat
+        self.min_lng = min_lng
+        self.max_lat = max_lat
+        self.max_lng = max_lng
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'min_lat': self.min_lat,
+            'min_lng': self.min_lng,
+            'max_lat': self.max_lat,
+            'max_lng': self.max_lng
+        }
+
+
+def grid_zones(min_lat, min_lng, max_lat, max_lng, rows, cols):
+    """Split a bounding box into rows x cols zones; outer edges are left open"""
+    lat_step = (max_lat - min_lat) / rows
+    lng_step = (max_lng - min_lng) / cols
+    zones = []
+    for row in range(rows):
+        for col in range(cols):
+            zones.append(Zone(
+                f"zone_{row}_{col}",
+                min_lat=min_lat + row * lat_step if row > 0 else None,
+                min_lng=min_lng + col * lng_step if col > 0 else None,
+                max_lat=min_lat + (row + 1) * lat_step if row < rows - 1 else None,
+                max_lng=min_lng + (col + 1) * lng_step if col < cols - 1 else None
+            ))
+    return zones
+
+
+def parse_interval(value):
+    """Positive, finite seconds from a number or numeric string; ValueError otherwise"""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"interval must be a number of seconds, got {value!r}")
+    if not 0 < seconds < math.inf:
+        raise ValueError(f"interval must be a positive number of seconds, got {value!r}")
+    return seconds
+
+
+def parse_zone_grid(value):
+    """(rows, cols) from 'ROWSxCOLS' or [rows, cols]; ValueError otherwise"""
+    parts = value.split('x') if isinstance(value, str) else value
+    try:
+        rows, cols = (int(part) for part in parts)
+        if any(isinstance(part, (bool, float)) for part in parts) or rows < 1 or cols < 1:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"zone grid must be ROWSxCOLS or [rows, cols] of positive integers, got {value!r}")
+    return rows, cols
+
+
+class ZoneMetrics:
+    """Per-zone tick counters, duration histogram and lag"""
+
+    def __init__(self):
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self.overlaps_prevented = 0
+        self.errors = 0
+        self.last_error = None
+        self.actions_total = 0
+        self.last_actions = 0
+        self.last_duration_seconds = None
+        self.last_lag_seconds = None
+        self.max_lag_seconds = 0.0
+        self.duration_sum = 0.0
+        self.duration_buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.last_run_at = None
+
+    def observe(self, duration, lag, actions):
+        self.ticks += 1
+        self.last_duration_seconds = duration
+        self.last_lag_seconds = lag
+        self.max_lag_seconds = max(self.max_lag_seconds, lag)
+        self.last_actions = actions
+        self.actions_total += actions
+        self.duration_sum += duration
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.duration_buckets[index] += 1
+                break
+        else:
+            self.duration_buckets[-1] += 1
+        self.last_run_at = datetime.utcnow()
+
+    def to_dict(self):
+        return {
+            'ticks': self.ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'overlaps_prevented': self.overlaps_prevented,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'actions_total': self.actions_total,
+            'last_actions': self.last_actions,
+            'avg_actions_per_tick': round(self.actions_total / self.ticks, 2) if self.ticks else 0,
+            'last_duration_seconds': self.last_duration_seconds,
+            'avg_duration_seconds': round(self.duration_sum / self.ticks, 4) if self.ticks else None,
+            'duration_histogram': {
+                'buckets': [str(bound) for bound in DURATION_BUCKETS] + ['+Inf'],
+                'counts': self.duration_buckets
+            },
+            'last_lag_seconds': self.last_lag_seconds,
+            'max_lag_seconds': self.max_lag_seconds,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None
+        }
+
+
+class ControlScheduler:
+    """Runs ``run_zone(zone)`` for every zone at a fixed, staggered cadence.
+
+    ``run_zone`` is called inside an app context and returns the number of
+    actions it took.
+    """
+
+    def __init__(self, app, run_zone, zones, interval_seconds=DEFAULT_INTERVAL_SECONDS, clock=time.monotonic):
+        self.app = app
+        self.run_zone = run_zone
+        self.zones = list(zones)
+        self.interval_seconds = interval_seconds
+        self.clock = clock
+        self.metrics = {zone.name: ZoneMetrics() for zone in self.zones}
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return False
+        self._stop.clear()
+        self.started_at = datetime.utcnow()
+        self._thread = threading.Thread(target=self._loop, name='adaptive-control-scheduler', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    def _loop(self):
+        start = self.clock()
+        stagger = self.interval_seconds / max(len(self.zones), 1)
+        due = {zone.name: start + index * stagger for index, zone in enumerate(self.zones)}
+
+        while not self._stop.is_set() and self.zones:
+            zone = min(self.zones, key=lambda z: due[z.name])
+            wait = due[zone.name] - self.clock()
+            if wait > 0 and self._stop.wait(wait):
+                break
+
+            self.tick(zone, due[zone.name])
+
+            # Skip-if-behind: jump to the next slot still in the future
+            next_due = due[zone.name] + self.interval_seconds
+            now = self.clock()
+            if now > next_due:
+                missed = math.floor((now - next_due) / self.interval_seconds) + 1
+                self.metrics[zone.name].skipped_ticks += missed
+                next_due += missed * self.interval_seconds
+            due[zone.name] = next_due
+
+    def tick(self, zone, due):
+        """Run one zone cycle unless another control cycle is in flight"""
+        metrics = self.metrics[zone.name]
+        with self.app.app_context():
+            try:
+                if not control_cycle_lock.acquire():
+                    metrics.overlaps_prevented += 1
+                    return False
+            except Exception as e:
+                metrics.errors += 1
+                metrics.last_error = str(e)
+                return False
+
+            try:
+                started = self.clock()
+                actions = self.run_zone(zone)
+                metrics.observe(self.clock() - started, max(0.0, started - due), actions)
+                return True
+            except Exception as e:
+                metrics.errors += 1
+                metrics.last_error = str(e)
+                return False
+            finally:
+                control_cycle_lock.release()
+
+    def to_dict(self):
+        return {
+            'running': self.running,
+            'interval_seconds': self.interval_seconds,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'zones': [dict(zone.to_dict(), metrics=self.metrics[zone.name].to_dict()) for zone in self.zones]
+        }
@@ -0,0 +1,157 @@
+"""Emergency corridor planning along a vehicle route.
+
+Active lights are indexed in a uniform grid over projected coordinates
+(CSR layout, rebuilt only when the signal state table gains or moves
+lights). A corridor query splits the route into short pieces, gathers the
+lights in the cells around each piece, keeps those within ``corridor_m`` of
+the route and orders them by distance along it. Each light is then given a
+green time from the vehicle's estimated arrival, green-wave style, so cross
+streets away from the route keep their normal timing. The grid itself is
+common.point_grid, shared with traffic-prediction's route estimator.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from common.point_grid import PointGrid, expand_ranges, project
+
+DEFAULT_CELL_M = 100.0
+DEFAULT_CORRIDOR_M = 30.0
+DEFAULT_SPEED_KMH = 50.0
+# Turn a light green this long before the vehicle is expected there
+DEFAULT_LEAD_SECONDS = 10.0
+MAX_CORRIDOR_M = 200.0
+
+
+class LightGrid(PointGrid):
+    """Grid index over the active lights of a SignalStateTable"""
+
+    def __init__(self, slots, lats, lngs, cell_m=DEFAULT_CELL_M):
+        self.slots = np.asarray(slots, dtype=np.int64)
+        self.ref_lat = float(np.mean(lats)) if len(lats) else 0.0
+        super().__init__(*self.project(lats, lngs), cell_m)
+
+    @classmethod
+    def from_state_table(cls, light_states, cell_m=DEFAULT_CELL_M):
+        slots = light_states.active_slots()
+        return cls(slots, light_states.lat[slots], light_states.lng[slots], cell_m)
+
+    def project(self, lats, lngs):
+        return project(lats, lngs, self.ref_lat)
+
+
+class CorridorIndex:
+    """Keeps a LightGrid in step with a SignalStateTable's light positions"""
+
+    def __init__(self, light_states, cell_m=DEFAULT_CELL_M):
+        self.light_states = light_states
+        self.cell_m = cell_m
+        self._grid = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def grid(self):
+        generation = self.light_states.generation
+        if self._grid is None or self._generation != generation:
+            with self._lock:
+                if self._grid is None or self._generation != generation:
+                    self._grid = LightGrid.from_state_table(self.light_states, self.cell_m)
+                    self._generation = generation
+        return self._grid
+
+
+def lights_along_route(grid, route_lats, route_lngs, corridor_m=DEFAULT_CORRIDOR_M):
+    """Lights within corridor_m of a polyline, ordered by distance along it.
+
+    Returns (state table slots, metres along the route, metres off the route).
+    """
+    rx, ry = grid.project(route_lats, route_lngs)
+    ax, ay, bx, by = rx[:-1], ry[:-1], rx[1:], ry[1:]
+    dx, dy = bx - ax, by - ay
+    length = np.hypot(dx, dy)
+    route_offset = np.concatenate(([0.0], np.cumsum(length)[:-1]))
+
+    # Short pieces keep every query box to a few cells, even on long
+    # straight origin-to-destination segments
+    pieces = np.maximum(np.ceil(length / grid.cell_m), 1).astype(np.int64)
+    segment, step = expand_ranges(np.zeros(len(pieces), dtype=np.int64), pieces)
+    t0, t1 = step / pieces[segment], (step + 1) / pieces[segment]
+    px0, py0 = ax[segment] + dx[segment] * t0, ay[segment] + dy[segment] * t0
+    px1, py1 = ax[segment] + dx[segment] * t1, ay[segment] + dy[segment] * t1
+
+    piece, point = grid.candidates(
+        np.minimum(px0, px1) - corridor_m, np.minimum(py0, py1) - corridor_m,
+        np.maximum(px0, px1) + corridor_m, np.maximum(py0, py1) + corridor_m
+    )
+    segment = segment[piece]
+
+    len2 = length[segment] ** 2
+    qx, qy = grid.x[point] - ax[segment], grid.y[point] - ay[segment]
+    t = np.clip((qx * dx[segment] + qy * dy[segment]) / np.where(len2 > 0, len2, 1.0), 0.0, 1.0)
+    offset = np.hypot(qx - t * dx[segment], qy - t * dy[segment])
+    along = route_offset[segment] + t * length[segment]
+
+    within = offset <= corridor_m
+    point, offset, along = point[within], offset[within], along[within]
+
+    # A light near a bend matches several segments: keep its nearest one
+    order = np.lexsort((offset, point))
+    point, offset, along = point[order], offset[order], along[order]
+    first = np.ones(len(point), dtype=bool)
+    first[1:] = point[1:] != point[:-1]
+    point, offset, along = point[first], offset[first], along[first]
+
+    order = np.argsort(along, kind='stable')
+    return grid.slots[point[order]], along[order], offset[order]
+
+
+def plan_green_wave(along_m, speed_kmh=DEFAULT_SPEED_KMH, lead_seconds=DEFAULT_LEAD_SECONDS):
+    """Seconds from now until the vehicle reaches, and each light turns green"""
+    eta_seconds = np.asarray(along_m, dtype=np.float64) / (speed_kmh / 3.6)
+    return eta_seconds, np.maximum(eta_seconds - lead_seconds, 0.0)
+
+
+class GreenWave:
+    """Turns a route's lights green in sequence as the vehicle approaches.
+
+    Lights due now are switched by the caller; this thread switches the
+    rest at their scheduled offsets. ``actions`` holds one ControlAction
+    column dict per light, with ``action_data`` still a dict; each is logged
+    as EXECUTED, with the light's state before the switch, when the light
+    turns green.
+    """
+
+    def __init__(self, light_states, slots, green_in_seconds, actions, name=None):
+        order = np.argsort(green_in_seconds, kind='stable')
+        self.light_states = light_states
+        self.slots = np.asarray(slots, dtype=np.int64)[order]
+        self.green_in_seconds = np.asarray(green_in_seconds, dtype=np.float64)[order]
+        self.actions = [actions[index] for index in order.tolist()]
+        self.name = name
+        self.started = None
+        self.switched = 0
+        self._thread = None
+
+    def start(self):
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"green-wave-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self.switched < len(self.slots):
+            wait = self.started + self.green_in_seconds[self.switched] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            elapsed = time.monotonic() - self.started
+            due = int(np.searchsorted(self.green_in_seconds, elapsed, side='right'))
+            moment = datetime.utcnow()
+            old_states = self.light_states.set_states(self.slots[self.switched:due], 'GREEN', moment)
+            self.light_states.log_actions([
+                dict(action, action_data=json.dumps(dict(action['action_data'], old_state=old_state)),
+                     status='EXECUTED', executed_at=moment)
+                for action, old_state in zip(self.actions[self.switched:due], old_states)
+            ])
+            self.switched = due
@@ -0,0 +1,333 @@
+"""Offline, time-stepped traffic microsimulation on a grid of intersections.
+
+Every intersection has four approach links (from the N, E, S and W). A link
+is a store-and-forward queue: vehicles entering it travel for a fixed
+free-flow time through a ring buffer, then join the queue at the stop line.
+A two-phase signal (N/S green, then E/W green, each followed by a short
+clearance interval) discharges queues at the saturation flow, split into
+straight/left/right movements and held back when the receiving link is
+full (spillback). Vehicles leaving the grid count as throughput and
+boundary approaches are fed with Poisson demand.
+
+Every per-step operation is a NumPy expression over all links at once, so a
+2,000-intersection network runs an hour in seconds on one core.
+
+Signal timing comes from a pluggable ``SignalPolicy``: every
+``interval_seconds`` the simulator hands the policy the latest sensor
+readings (one per intersection, shaped like data-ingestion's
+``/traffic-data`` payload) and applies the cycle durations it returns.
+"""
+import numpy as np
+
+from src.services.adaptive_control import (
+    CONDITIONS_CELL_DEGREES, cell_index, decide_cycle_durations, join_lights_to_cells
+)
+
+NORTH, EAST, SOUTH, WEST = range(4)
+# Row/column step from an intersection to its neighbour on each side
+SIDE_STEP = {NORTH: (1, 0), EAST: (0, 1), SOUTH: (-1, 0), WEST: (0, -1)}
+TURN_RATIOS = (0.8, 0.1, 0.1)  # straight, left, right
+
+DEFAULT_ORIGIN = (40.70, -74.02)
+DEFAULT_SPACING_DEGREES = 0.002
+DEFAULT_LINK_LENGTH_M = 200.0
+DEFAULT_FREE_SPEED_KMH = 50.0
+DEFAULT_SATURATION_FLOW = 0.5  # vehicles per second of green per approach
+DEFAULT_JAM_SPACING_M = 7.5
+DEFAULT_CLEARANCE_SECONDS = 4
+DEFAULT_CYCLE_SECONDS = 120
+DEFAULT_READING_INTERVAL = 300
+
+
+def classify_congestion(vehicle_count, average_speed):
+    """data-ingestion's congestion rule, element-wise"""
+    high = (vehicle_count > 50) & (average_speed < 30)
+    medium = ~high & ((vehicle_count > 30) | (average_speed < 50))
+    return np.where(high, 'HIGH', np.where(medium, 'MEDIUM', 'LOW'))
+
+
+class GridNetwork:
+    """Static layout: intersections, approach links and movement targets"""
+
+    def __init__(self, rows, cols, origin=DEFAULT_ORIGIN, spacing_degrees=DEFAULT_SPACING_DEGREES,
+                 link_length_m=DEFAULT_LINK_LENGTH_M):
+        self.rows, self.cols = rows, cols
+        self.n_nodes = rows * cols
+        self.n_links = 4 * self.n_nodes
+        self.link_length_m = link_length_m
+
+        node = np.arange(self.n_nodes)
+        self.node_row, self.node_col = node // cols, node % cols
+        self.lat = origin[0] + self.node_row * spacing_degrees
+        self.lng = origin[1] + self.node_col * spacing_degrees
+        self.sensor_ids = [f"SIM_{r:03d}_{c:03d}" for r, c in zip(self.node_row.tolist(), self.node_col.tolist())]
+
+        # Link l = 4 * node + side: the approach into ``node`` from ``side``
+        link = np.arange(self.n_links)
+        self.link_node = link // 4
+        self.link_side = link % 4
+        self.link_phase = np.isin(self.link_side, (EAST, WEST)).astype(np.int8)
+
+        upstream_row = self.node_row[self.link_node] + np.array([SIDE_STEP[s][0] for s in range(4)])[self.link_side]
+        upstream_col = self.node_col[self.link_node] + np.array([SIDE_STEP[s][1] for s in range(4)])[self.link_side]
+        self.is_entry = (upstream_row < 0) | (upstream_row >= rows) | (upstream_col < 0) | (upstream_col >= cols)
+
+        # A vehicle arriving from ``side`` heading straight leaves through the
+        # opposite side and enters the next node from ``side`` again; left
+        # and right turns rotate the exit side.
+        exit_side = np.stack(((self.link_side + 2) % 4, (self.link_side + 1) % 4, (self.link_side + 3) % 4), axis=1)
+        step_row = np.array([SIDE_STEP[s][0] for s in range(4)])[exit_side]
+        step_col = np.array([SIDE_STEP[s][1] for s in range(4)])[exit_side]
+        next_row = self.node_row[self.link_node][:, None] + step_row
+        next_col = self.node_col[self.link_node][:, None] + step_col
+        inside = (next_row >= 0) & (next_row < rows) & (next_col >= 0) & (next_col < cols)
+        entry_side = (exit_side + 2) % 4
+        self.movement_target = np.where(inside, 4 * (next_row * cols + next_col) + entry_side, -1)
+
+
+class SignalPolicy:
+    """Decides cycle durations for every intersection.
+
+    ``decide`` receives the simulation time in seconds, the network, the
+    current cycle durations and the readings from the latest reading
+    intervals (a list of column dicts, newest last). It returns the new
+    cycle durations, or None to keep them.
+    """
+
+    interval_seconds = 300
+
+    def reset(self, network):
+        pass
+
+    def decide(self, sim_seconds, network, cycle_durations, readings):
+        raise NotImplementedError
+
+
+class FixedTimePolicy(SignalPolicy):
+    """Baseline: a constant cycle everywhere"""
+
+    def __init__(self, cycle_seconds=DEFAULT_CYCLE_SECONDS):
+        self.cycle_seconds = cycle_seconds
+
+    def decide(self, sim_seconds, network, cycle_durations, readings):
+        return np.full(network.n_nodes, self.cycle_seconds, dtype=np.int64)
+
+
+class AdaptivePolicy(SignalPolicy):
+    """The production rule from adaptive_control, fed with simulated readings.
+
+    Readings from the last ``window_seconds`` are aggregated per grid cell
+    the way data-ingestion's /traffic-conditions does, then joined to the
+    intersections and passed to decide_cycle_durations().
+    """
+
+    def __init__(self, interval_seconds=300, window_seconds=900, cell_degrees=CONDITIONS_CELL_DEGREES):
+        self.interval_seconds = interval_seconds
+        self.window_seconds = window_seconds
+        self.cell_degrees = cell_degrees
+
+    def decide(self, sim_seconds, network, cycle_durations, readings):
+        recent = [batch for batch in readings if batch['sim_seconds'] > sim_seconds - self.window_seconds]
+        if not recent:
+            return None
+        lat = np.concatenate([batch['location_lat'] for batch in recent])
+        lng = np.concatenate([batch['location_lng'] for batch in recent])
+        vehicles = np.concatenate([batch['vehicle_count'] for batch in recent]).astype(np.float64)
+        high = np.concatenate([batch['congestion_level'] for batch in recent]) == 'HIGH'
+
+        cell_keys = np.stack((cell_index(lat, self.cell_degrees), cell_index(lng, self.cell_degrees)), axis=1)
+        cells, cell_of = np.unique(cell_keys, axis=0, return_inverse=True)
+        cell_of = cell_of.ravel()
+        conditions = {
+            'row': cells[:, 0],
+            'col': cells[:, 1],
+            'reading_count': np.bincount(cell_of).astype(np.float64),
+            'vehicle_sum': np.bincount(cell_of, weights=vehicles),
+            'high_count': np.bincount(cell_of, weights=high)
+        }
+        reading_count, vehicle_sum, high_count = join_lights_to_cells(
+            network.lat, network.lng, conditions, self.cell_degrees)
+        new_durations, _ = decide_cycle_durations(cycle_durations, reading_count, vehicle_sum, high_count)
+        return new_durations
+
+
+class Simulation:
+    """Queue-model state and the per-second update loop"""
+
+    def __init__(self, network, policy, demand_vph=300.0, seed=0, free_speed_kmh=DEFAULT_FREE_SPEED_KMH,
+                 saturation_flow=DEFAULT_SATURATION_FLOW, jam_spacing_m=DEFAULT_JAM_SPACING_M,
+                 clearance_seconds=DEFAULT_CLEARANCE_SECONDS, reading_interval=DEFAULT_READING_INTERVAL,
+                 reading_sink=None, keep_readings=6):
+        self.network = network
+        self.policy = policy
+        self.rng = np.random.default_rng(seed)
+        self.demand_per_second = demand_vph / 3600.0
+        self.saturation_flow = saturation_flow
+        self.clearance_seconds = clearance_seconds
+        self.reading_interval = reading_interval
+        self.reading_sink = reading_sink
+        self.keep_readings = keep_readings
+
+        self.free_speed_ms = free_speed_kmh / 3.6
+        self.travel_steps = max(int(round(network.link_length_m / self.free_speed_ms)), 1)
+        self.storage = network.link_length_m / jam_spacing_m
+        n_links = network.n_links
+
+        self.pipeline = np.zeros((self.travel_steps, n_links))
+        self.queue = np.zeros(n_links)
+        self.occupancy = np.zeros(n_links)
+        self.source_backlog = np.zeros(n_links)
+        self.cycle = np.full(network.n_nodes, DEFAULT_CYCLE_SECONDS, dtype=np.int64)
+        self.cycle_start = np.zeros(network.n_nodes, dtype=np.int64)
+        self.entry_links = np.nonzero(network.is_entry)[0]
+
+        self.t = 0
+        self.readings = []
+        self.reading_count = 0
+        self.metrics = {
+            'entered': 0.0,
+            'exited': 0.0,
+            'queue_vehicle_seconds': 0.0,
+            'backlog_vehicle_seconds': 0.0,
+            'spillback_link_seconds': 0,
+            'discharged': 0.0,
+            'policy_decisions': 0,
+            'cycle_changes': 0
+        }
+        self._interval_arrivals = np.zeros(n_links)
+        self._interval_queue_sum = np.zeros(n_links)
+        self.policy.reset(network)
+        self.apply_policy()
+
+    def green_links(self):
+        """Boolean mask of approaches that may discharge this second"""
+        net = self.network
+        cycle = self.cycle[net.link_node]
+        phase_time = (self.t - self.cycle_start[net.link_node]) % cycle
+        half = cycle // 2
+        ns_green = phase_time < half - self.clearance_seconds
+        ew_green = (phase_time >= half) & (phase_time < cycle - self.clearance_seconds)
+        return np.where(net.link_phase == 0, ns_green, ew_green)
+
+    def step(self):
+        net = self.network
+        slot = self.t % self.travel_steps
+
+        # Vehicles finishing free-flow travel join the stop-line queue
+        arrived = self.pipeline[slot]
+        self.queue += arrived
+        self._interval_arrivals += arrived
+        self.pipeline[slot] = 0.0
+
+        # Boundary demand, held at the source while the entry link is full
+        self.source_backlog[self.entry_links] += self.rng.poisson(self.demand_per_second, len(self.entry_links))
+        admitted = np.minimum(self.source_backlog, np.maximum(self.storage - self.occupancy, 0.0))
+        self.source_backlog -= admitted
+        self.metrics['entered'] += admitted.sum()
+
+        # Signal discharge split into movements, limited by receiving space
+        potential = np.minimum(self.queue, self.saturation_flow) * self.green_links()
+        movement = potential[:, None] * np.asarray(TURN_RATIOS)[None, :]
+        target = net.movement_target
+        internal = target >= 0
+        demand = np.bincount(target[internal], weights=movement[internal], minlength=net.n_links)
+        space = np.maximum(self.storage - self.occupancy - admitted, 0.0)
+        blocked = demand > space
+        factor = np.divide(space, demand, out=np.ones(net.n_links), where=blocked)
+        self.metrics['spillback_link_seconds'] += int(np.count_nonzero(blocked))
+        movement[internal] *= factor[target[internal]]
+
+        outflow = movement.sum(axis=1)
+        inflow = np.bincount(target[internal], weights=movement[internal], minlength=net.n_links) + admitted
+        self.queue -= outflow
+        self.pipeline[slot] += inflow
+        self.occupancy += inflow - outflow
+
+        self.metrics['exited'] += movement[~internal].sum()
+        self.metrics['discharged'] += outflow.sum()
+        self.metrics['queue_vehicle_seconds'] += self.queue.sum()
+        self.metrics['backlog_vehicle_seconds'] += self.source_backlog.sum()
+        self._interval_queue_sum += self.queue
+
+        self.t += 1
+        if self.t % self.reading_interval == 0:
+            self.emit_readings()
+        if self.t % self.policy.interval_seconds == 0:
+            self.apply_policy()
+
+    def emit_readings(self):
+        """One reading per intersection for the interval that just ended"""
+        net = self.network
+        occupancy = self.occupancy.reshape(-1, 4)
+        vehicle_count = np.rint(occupancy.sum(axis=1)).astype(np.int64)
+
+        # Travel time over an approach: free flow plus the mean wait implied
+        # by the interval's average queue and the approach's discharge rate
+        cycle = self.cycle[net.link_node]
+        green_share = (cycle // 2 - self.clearance_seconds) / cycle
+        mean_queue = self._interval_queue_sum / self.reading_interval
+        wait = mean_queue / (self.saturation_flow * green_share)
+        weights = self._interval_arrivals.reshape(-1, 4) + 1e-9
+        mean_wait = (wait.reshape(-1, 4) * weights).sum(axis=1) / weights.sum(axis=1)
+        travel_time = net.link_length_m / self.free_speed_ms + mean_wait
+        average_speed = net.link_length_m / travel_time * 3.6
+
+        batch = {
+            'sim_seconds': self.t,
+            'sensor_id': net.sensor_ids,
+            'location_lat': net.lat,
+            'location_lng': net.lng,
+            'vehicle_count': vehicle_count,
+            'average_speed': np.round(average_speed, 1),
+            'congestion_level': classify_congestion(vehicle_count, average_speed)
+        }
+        self.readings.append(batch)
+        del self.readings[:-self.keep_readings]
+        self.reading_count += net.n_nodes
+        self._interval_arrivals[:] = 0.0
+        self._interval_queue_sum[:] = 0.0
+        if self.reading_sink is not None:
+            self.reading_sink(batch)
+
+    def apply_policy(self):
+        new_cycle = self.policy.decide(self.t, self.network, self.cycle.copy(), self.readings)
+        self.metrics['policy_decisions'] += 1
+        if new_cycle is None:
+            return
+        new_cycle = np.asarray(new_cycle, dtype=np.int64)
+        changed = new_cycle != self.cycle
+        # A changed plan starts a fresh cycle (N/S green first)
+        self.cycle_start[changed] = self.t
+        self.cycle[changed] = new_cycle[changed]
+        self.metrics['cycle_changes'] += int(changed.sum())
+
+    def run(self, seconds):
+        for _ in range(int(seconds)):
+            self.step()
+        return self.report()
+
+    def report(self):
+        metrics = self.metrics
+        hours = self.t / 3600.0 if self.t else 1.0
+        in_network = float(self.occupancy.sum())
+        served = metrics['exited'] + in_network
+        delay = metrics['queue_vehicle_seconds'] + metrics['backlog_vehicle_seconds']
+        return {
+            'simulated_seconds': self.t,
+            'intersections': self.network.n_nodes,
+            'links': self.network.n_links,
+            'vehicles_entered': round(metrics['entered']),
+            'vehicles_exited': round(metrics['exited']),
+            'vehicles_in_network': round(in_network),
+            'vehicles_waiting_at_boundary': round(float(self.source_backlog.sum())),
+            'throughput_vph': round(metrics['exited'] / hours),
+            'discharges_per_hour': round(metrics['discharged'] / hours),
+            'total_delay_vehicle_hours': round(delay / 3600.0, 1),
+            'average_delay_seconds_per_vehicle': round(delay / served, 1) if served else 0.0,
+            'average_queue_per_link': round(metrics['queue_vehicle_seconds'] / max(self.t, 1) / self.network.n_links, 2),
+            'spillback_link_seconds': metrics['spillback_link_seconds'],
+            'policy_decisions': metrics['policy_decisions'],
+            'cycle_changes': metrics['cycle_changes'],
+            'mean_cycle_seconds': round(float(self.cycle.mean()), 1),
+            'readings_emitted': self.reading_count
+        }
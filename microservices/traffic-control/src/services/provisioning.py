@@ -0,0 +1,231 @@
+"""Bulk provisioning of traffic lights and signals with upsert semantics.
+
+A batch is validated item by item, existing rows are looked up with a few
+chunked ``IN`` queries on the unique id, and new and changed rows are
+written with one executemany INSERT and one executemany UPDATE in a single
+transaction. Each item gets a result (created, updated, unchanged or
+error) in request order.
+"""
+from datetime import datetime
+
+from src.models.traffic_control import db, TrafficLight, TrafficSignal
+from src.services.signal_state import STATES, SignalStateTable, parse_utc
+
+# Ids per IN (...) lookup, below SQLite's bound parameter limit
+LOOKUP_CHUNK = 900
+MAX_BULK_ITEMS = 200000
+
+LIGHT_FIELDS = ('location_lat', 'location_lng', 'intersection_name', 'current_state', 'cycle_duration', 'is_active')
+SIGNAL_FIELDS = ('signal_type', 'location_lat', 'location_lng', 'message', 'priority', 'expires_at', 'is_active')
+SIGNAL_PRIORITIES = ('LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+
+
+def fetch_existing(column, keys, *columns):
+    """Rows for the given unique keys, as a dict keyed by that column"""
+    existing = {}
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        for row in db.session.query(column, *columns).filter(column.in_(chunk)):
+            existing[row[0]] = row
+    return existing
+
+
+def invalid_keys(items, key):
+    """Error message for the first item whose ``key`` is not a string or number, else None"""
+    for index, item in enumerate(items):
+        value = item.get(key) if isinstance(item, dict) else None
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+            return f'{key} of item {index} must be a string or number'
+    return None
+
+
+def item_key(item, key):
+    """An item's unique id as the string the database stores, or None when missing.
+
+    Numeric ids are accepted (see invalid_keys) and matched as strings, so
+    light_id 5 and '5' are the same light.
+    """
+    value = item.get(key) if isinstance(item, dict) else None
+    if value is None or value == '':
+        return None
+    return str(value)
+
+
+def _clean_light(item, creating):
+    """Validated column values from a request item, or raise ValueError"""
+    values = {}
+    if creating:
+        for field in ('location_lat', 'location_lng'):
+            if field not in item:
+                raise ValueError(f'Missing required field: {field}')
+    for field in ('location_lat', 'location_lng'):
+        if field in item:
+            values[field] = float(item[field])
+    if 'intersection_name' in item:
+        values['intersection_name'] = str(item['intersection_name'] or '')
+    if 'current_state' in item:
+        if item['current_state'] not in STATES:
+            raise ValueError('Invalid state. Must be RED, YELLOW, or GREEN')
+        values['current_state'] = item['current_state']
+    if 'cycle_duration' in item:
+        values['cycle_duration'] = int(item['cycle_duration'])
+        if values['cycle_duration'] <= 0:
+            raise ValueError('cycle_duration must be positive')
+    if 'is_active' in item:
+        values['is_active'] = bool(item['is_active'])
+    return values
+
+
+def _clean_signal(item, creating):
+    values = {}
+    if creating:
+        for field in ('signal_type', 'location_lat', 'location_lng', 'message'):
+            if field not in item:
+                raise ValueError(f'Missing required field: {field}')
+    for field in ('location_lat', 'location_lng'):
+        if field in item:
+            values[field] = float(item[field])
+    for field in ('signal_type', 'message'):
+        if field in item:
+            values[field] = str(item[field])
+    if 'priority' in item:
+        if item['priority'] not in SIGNAL_PRIORITIES:
+            raise ValueError(f"Invalid priority. Must be one of {', '.join(SIGNAL_PRIORITIES)}")
+        values['priority'] = item['priority']
+    if 'expires_at' in item:
+        values['expires_at'] = parse_utc(item['expires_at']) if item['expires_at'] else None
+    if 'is_active' in item:
+        values['is_active'] = bool(item['is_active'])
+    return values
+
+
+def _plan(items, key, fields, existing, clean, defaults, update_existing):
+    """Split items into insert rows, update rows and per-item results"""
+    results = [None] * len(items)
+    inserts, updates, seen = {}, {}, set()
+    for index, item in enumerate(items):
+        item_id = item_key(item, key)
+        result = {'index': index, key: item_id}
+        results[index] = result
+        if item_id is None:
+            result.update(status='error', error=f'Missing required field: {key}')
+            continue
+        if item_id in seen:
+            result.update(status='error', error=f'Duplicate {key} in request')
+            continue
+        seen.add(item_id)
+
+        current = existing.get(item_id)
+        if current is not None and not update_existing:
+            result['status'] = 'unchanged'
+            continue
+        try:
+            values = clean(item, current is None)
+        except (TypeError, ValueError) as e:
+            result.update(status='error', error=str(e))
+            continue
+
+        if current is None:
+            inserts[item_id] = dict(defaults, **values, **{key: item_id})
+            result['status'] = 'created'
+        else:
+            # Items may set any subset of fields; keep the rest as stored
+            stored = dict(zip(fields, current[2:]))
+            merged = dict(stored, **values)
+            if merged != stored:
+                updates[item_id] = dict({'b_id': current[1]}, **{f'b_{field}': merged[field] for field in fields})
+                result['status'] = 'updated'
+            else:
+                result['status'] = 'unchanged'
+    return results, inserts, updates
+
+
+def _write(table, inserts, updates, fields, extra_update=None):
+    if inserts:
+        db.session.execute(table.insert(), list(inserts.values()))
+    if updates:
+        values = {field: db.bindparam(f'b_{field}') for field in fields}
+        values.update(extra_update or {})
+        db.session.execute(table.update().where(table.c.id == db.bindparam('b_id')).values(**values),
+                           list(updates.values()))
+
+
+def upsert_traffic_lights(items, update_existing=True, light_states=None):
+    """Create or update lights by light_id in one transaction.
+
+    State and cycle duration of existing lights are taken from
+    ``light_states`` when given, since the database may lag behind it.
+    Returns (per-item results, row_columns() tuples of the written lights,
+    light_ids of updated lights).
+    """
+    keys = [item_key(item, 'light_id') for item in items]
+    existing = fetch_existing(TrafficLight.light_id, set(keys) - {None}, TrafficLight.id,
+                              *(getattr(TrafficLight, field) for field in LIGHT_FIELDS))
+    if light_states is not None:
+        state_column = 2 + LIGHT_FIELDS.index('current_state')
+        cycle_column = 2 + LIGHT_FIELDS.index('cycle_duration')
+        for light_id, row in existing.items():
+            slot = light_states.slot_of(light_id)
+            if slot is not None:
+                row = list(row)
+                row[state_column] = STATES[light_states.state[slot]]
+                row[cycle_column] = int(light_states.cycle_duration[slot])
+                existing[light_id] = row
+
+    now = datetime.utcnow()
+    defaults = {'intersection_name': '', 'current_state': 'GREEN', 'cycle_duration': 120,
+                'is_active': True, 'last_updated': now}
+    results, inserts, updates = _plan(items, 'light_id', LIGHT_FIELDS, existing, _clean_light,
+                                      defaults, update_existing)
+    for row in updates.values():
+        row['b_last_updated'] = now
+
+    try:
+        _write(TrafficLight.__table__, inserts, updates, LIGHT_FIELDS, {'last_updated': db.bindparam('b_last_updated')})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    written = fetch_existing(TrafficLight.light_id, list(inserts) + list(updates), *SignalStateTable.row_columns())
+    ids = {light_id: row[1] for light_id, row in written.items()}
+    for result in results:
+        if result['status'] in ('created', 'updated'):
+            result['id'] = ids[result['light_id']]
+    return results, [tuple(row[1:]) for row in written.values()], list(updates)
+
+
+def upsert_traffic_signals(items, update_existing=True):
+    """Create or update signals by signal_id in one transaction.
+
+    Returns (per-item results, (id, expires_at) of written signals).
+    """
+    keys = [item_key(item, 'signal_id') for item in items]
+    existing = fetch_existing(TrafficSignal.signal_id, set(keys) - {None}, TrafficSignal.id,
+                              *(getattr(TrafficSignal, field) for field in SIGNAL_FIELDS))
+
+    defaults = {'priority': 'MEDIUM', 'expires_at': None, 'is_active': True, 'created_at': datetime.utcnow()}
+    results, inserts, updates = _plan(items, 'signal_id', SIGNAL_FIELDS, existing, _clean_signal,
+                                      defaults, update_existing)
+
+    try:
+        _write(TrafficSignal.__table__, inserts, updates, SIGNAL_FIELDS)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    written = fetch_existing(TrafficSignal.signal_id, list(inserts) + list(updates),
+                             TrafficSignal.id, TrafficSignal.expires_at, TrafficSignal.is_active)
+    for result in results:
+        if result['status'] in ('created', 'updated'):
+            result['id'] = written[result['signal_id']][1]
+    return results, [(row[1], row[2]) for row in written.values() if row[3]]
+
+
+def summarize(results):
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'error': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return counts
@@ -0,0 +1,159 @@
+"""Deadline-driven expiry of traffic signals.
+
+Active signals with an ``expires_at`` are kept in a min-heap of
+(deadline, id); scheduling and popping are O(log n). A background thread
+sleeps until the earliest deadline, pops every signal that is due and
+deactivates them together with bulk UPDATEs. A
+periodic sweep also deactivates any expired rows the heap never saw (for
+example rows written by another process).
+"""
+import heapq
+import threading
+from datetime import datetime
+
+from src.models.traffic_control import db, TrafficSignal
+from src.services.signal_state import to_micros, from_micros
+
+DEFAULT_SWEEP_SECONDS = 60.0
+RETRY_SECONDS = 1.0
+# Ids per UPDATE ... WHERE id IN (...), below SQLite's bound parameter limit
+DEACTIVATE_CHUNK = 900
+
+
+class SignalExpiry:
+    """Min-heap of signal deadlines with bulk deactivation"""
+
+    def __init__(self, sweep_seconds=DEFAULT_SWEEP_SECONDS):
+        self.sweep_seconds = sweep_seconds
+        self._heap = []
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.app = None
+        self.loaded = False
+        self.expired = 0
+        self.swept = 0
+        self.bulk_updates = 0
+        self.errors = 0
+        self.last_error = None
+
+    def load(self):
+        """Deactivate already expired signals and schedule the rest (inside an app context)"""
+        # create_all() only indexes new tables; add the live-signal index to existing ones
+        for index in TrafficSignal.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        self.sweep()
+        rows = db.session.query(TrafficSignal.id, TrafficSignal.expires_at).filter(
+            TrafficSignal.is_active == True, TrafficSignal.expires_at.isnot(None)
+        ).all()
+        with self._condition:
+            self._heap = [(to_micros(expires_at), signal_id) for signal_id, expires_at in rows]
+            heapq.heapify(self._heap)
+            self.loaded = True
+            self._condition.notify()
+        return len(rows)
+
+    def schedule(self, signal_id, expires_at):
+        """Track a committed signal's deadline; no-op for signals that never expire"""
+        if expires_at is None:
+            return
+        with self._condition:
+            deadline = to_micros(expires_at)
+            earliest = self._heap[0][0] if self._heap else None
+            heapq.heappush(self._heap, (deadline, signal_id))
+            if earliest is None or deadline < earliest:
+                self._condition.notify()
+
+    def pop_due(self, now_micros):
+        """Pop every signal whose deadline has passed"""
+        due = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now_micros:
+                due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def deactivate(self, signal_ids):
+        """Bulk-deactivate signals by id in one transaction"""
+        if not signal_ids:
+            return 0
+        table = TrafficSignal.__table__
+        now = datetime.utcnow()
+        deactivated = 0
+        for start in range(0, len(signal_ids), DEACTIVATE_CHUNK):
+            chunk = signal_ids[start:start + DEACTIVATE_CHUNK]
+            # A signal whose expiry was pushed back keeps a stale heap entry;
+            # the deadline check makes that entry a no-op
+            result = db.session.execute(
+                table.update()
+                .where(table.c.id.in_(chunk), table.c.is_active == True, table.c.expires_at <= now)
+                .values(is_active=False)
+            )
+            deactivated += result.rowcount
+        db.session.commit()
+        self.bulk_updates += 1
+        self.expired += deactivated
+        return deactivated
+
+    def sweep(self, now=None):
+        """Deactivate every active row whose deadline has passed"""
+        table = TrafficSignal.__table__
+        result = db.session.execute(
+            table.update()
+            .where(table.c.is_active == True, table.c.expires_at <= (now or datetime.utcnow()))
+            .values(is_active=False)
+        )
+        db.session.commit()
+        self.swept += result.rowcount
+        return result.rowcount
+
+    def start(self, app):
+        self.app = app
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='signal-expiry', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        next_sweep = to_micros(datetime.utcnow()) + int(self.sweep_seconds * 1_000_000)
+        while not self._stop.is_set():
+            with self._condition:
+                now = to_micros(datetime.utcnow())
+                wake_at = min(self._heap[0][0], next_sweep) if self._heap else next_sweep
+                if wake_at > now:
+                    self._condition.wait((wake_at - now) / 1_000_000)
+            if self._stop.is_set():
+                return
+
+            now = to_micros(datetime.utcnow())
+            try:
+                with self.app.app_context():
+                    self.deactivate(self.pop_due(now))
+                    if now >= next_sweep:
+                        self.sweep()
+                        next_sweep = now + int(self.sweep_seconds * 1_000_000)
+            except Exception as e:
+                # Popped signals are picked up again by the next sweep
+                self.errors += 1
+                self.last_error = str(e)
+                self._stop.wait(RETRY_SECONDS)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'scheduled': len(self._heap),
+                'next_expiry': from_micros(self._heap[0][0]).isoformat() if self._heap else None,
+                'expired': self.expired,
+                'swept': self.swept,
+                'bulk_updates': self.bulk_updates,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'running': self._thread is not None and self._thread.is_alive()
+            }
@@ -0,0 +1,517 @@
+"""Authoritative in-memory state table for traffic lights.
+
+Light state, cycle duration and last update time live in compact NumPy
+arrays indexed by a slot per light, with a dict from light_id to slot, so
+reads and state changes are O(1) and never touch the database. Changes are
+persisted write-behind: dirty slots and queued ControlAction rows are
+flushed in batches with executemany statements by a background thread.
+Actions go to the segmented action log when one is attached, otherwise to
+the control_actions table. With a live feed attached, persisted light
+changes and actions are also published to streaming clients.
+On startup the table is recovered from the traffic_lights table.
+
+The table is only authoritative in one process: another process would serve
+its own stale copy and flush it over this one's rows. With a lease attached,
+load() claims it (or refuses to start), the flusher renews it and stops
+persisting if it is lost, and stop() releases it.
+
+Durability trade-off: changes made within the last flush interval are lost
+if the process dies before they are flushed.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from src.models.traffic_control import db, TrafficLight, ControlAction
+
+STATES = ('RED', 'YELLOW', 'GREEN')
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+DEFAULT_FLUSH_INTERVAL_SECONDS = 0.5
+DEFAULT_FLUSH_BATCH = 5000
+DEFAULT_CYCLE_DURATION = 120
+STATE_ARRAYS = ('db_id', 'lat', 'lng', 'state', 'cycle_duration', 'updated_micros', 'is_active')
+EPOCH = datetime(1970, 1, 1)
+# TrafficLight.to_dict() keys in the sorted order jsonify writes them
+LIGHT_FIELDS = ('current_state', 'cycle_duration', 'id', 'intersection_name', 'is_active', 'last_updated',
+                'light_id', 'location_lat', 'location_lng')
+
+
+def to_micros(moment):
+    """Naive UTC datetime to integer microseconds since the epoch (exact)"""
+    if moment is None:
+        return 0
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def parse_utc(value):
+    """ISO 8601 string to a naive UTC datetime, the way timestamps are stored; offsets are converted"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def isoformat_micros(micros):
+    """from_micros(m).isoformat() for an array of microseconds, without per-element datetimes"""
+    moments = np.asarray(micros, dtype=np.int64).astype('datetime64[us]')
+    text = np.datetime_as_string(moments, unit='us').astype(object)
+    # isoformat() leaves out a zero microsecond part
+    whole = np.asarray(micros, dtype=np.int64) % 1_000_000 == 0
+    text[whole] = np.datetime_as_string(moments[whole], unit='s')
+    return text.tolist()
+
+
+class SignalStateTable:
+    """Light state arrays with O(1) access by light_id and batched persistence"""
+
+    def __init__(self, capacity=1024, flush_interval=DEFAULT_FLUSH_INTERVAL_SECONDS, flush_batch=DEFAULT_FLUSH_BATCH,
+                 action_log=None, feed=None, lease=None):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.action_log = action_log
+        self.feed = feed
+        # CycleLock held while this process serves the table
+        self.lease = lease
+        self._lease_held = False
+        self._lease_renewed = 0.0
+        self._lock = threading.RLock()
+        # One flush at a time: a second flush could otherwise commit an older
+        # snapshot of a light after a newer one, or publish out of order
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.app = None
+        self.loaded = False
+        # Bumped whenever lights are added or moved, so spatial indexes
+        # built over the arrays know to rebuild
+        self.generation = 0
+        # Bumped on every change visible in to_dict(), for HTTP ETags
+        self.version = 0
+
+        self.slots = {}
+        self.light_ids = []
+        self.intersection_names = []
+        self.size = 0
+        self._allocate(capacity)
+
+        self._dirty = set()
+        self._pending_actions = []
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.actions_flushed = 0
+        self.flush_errors = 0
+        self.last_flush_error = None
+
+    def _allocate(self, capacity):
+        self.db_id = np.zeros(capacity, dtype=np.int64)
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lng = np.zeros(capacity, dtype=np.float64)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.cycle_duration = np.zeros(capacity, dtype=np.int32)
+        self.updated_micros = np.zeros(capacity, dtype=np.int64)
+        self.is_active = np.zeros(capacity, dtype=bool)
+
+    def _ensure_capacity(self, needed):
+        capacity = len(self.db_id)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in STATE_ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    # Loading and registration
+
+    @staticmethod
+    def row_columns():
+        """TrafficLight columns in the order register_rows() expects"""
+        return (
+            TrafficLight.id, TrafficLight.light_id, TrafficLight.location_lat, TrafficLight.location_lng,
+            TrafficLight.intersection_name, TrafficLight.current_state, TrafficLight.cycle_duration,
+            TrafficLight.last_updated, TrafficLight.is_active
+        )
+
+    def load(self):
+        """Recover the table from the database (call inside an app context)"""
+        if self.lease is not None and not self._lease_held:
+            if not self.lease.acquire():
+                raise RuntimeError(f"Light state is served by another process (lease '{self.lease.name}'); "
+                                   f"run traffic-control as a single process")
+            self._lease_held = True
+            self._lease_renewed = time.monotonic()
+        try:
+            rows = db.session.query(*self.row_columns()).order_by(TrafficLight.id).all()
+        except Exception:
+            self._release_lease()
+            raise
+        with self._lock:
+            self.slots = {}
+            self.light_ids = []
+            self.intersection_names = []
+            self.size = 0
+            self._allocate(max(1024, len(rows) * 2))
+            for row in rows:
+                self._register(*row)
+            self._dirty.clear()
+            self.generation += 1
+            self.version += 1
+            self.loaded = True
+        return len(rows)
+
+    def _register(self, db_id, light_id, lat, lng, intersection_name, state, cycle_duration, last_updated, is_active):
+        slot = self.slots.get(light_id)
+        if slot is None:
+            self._ensure_capacity(self.size + 1)
+            slot = self.size
+            self.size += 1
+            self.slots[light_id] = slot
+            self.light_ids.append(light_id)
+            self.intersection_names.append(intersection_name)
+        else:
+            self.intersection_names[slot] = intersection_name
+        self.db_id[slot] = db_id
+        self.lat[slot] = lat
+        self.lng[slot] = lng
+        self.state[slot] = STATE_CODES.get(state or 'GREEN', STATE_CODES['GREEN'])
+        self.cycle_duration[slot] = cycle_duration if cycle_duration is not None else DEFAULT_CYCLE_DURATION
+        self.updated_micros[slot] = to_micros(last_updated)
+        self.is_active[slot] = bool(is_active) if is_active is not None else True
+        self.generation += 1
+        self.version += 1
+        return slot
+
+    def register_model(self, light):
+        """Add or refresh a light that was just committed through the ORM"""
+        with self._lock:
+            slot = self._register(
+                light.id, light.light_id, light.location_lat, light.location_lng, light.intersection_name,
+                light.current_state, light.cycle_duration, light.last_updated, light.is_active
+            )
+        self.publish_lights([slot])
+        return slot
+
+    def register_rows(self, rows, dirty=False):
+        """Add or refresh lights from row_columns() tuples after a bulk commit.
+
+        With ``dirty`` the rows are also re-flushed, so a flush that read the
+        previous values concurrently cannot leave them behind in the database,
+        and that flush publishes them once they are persisted.
+        """
+        with self._lock:
+            slots = [self._register(*row) for row in rows]
+            if dirty:
+                self._dirty.update(slots)
+                self._wake.set()
+        if not dirty:
+            self.publish_lights(slots)
+        return slots
+
+    # O(1) reads
+
+    def slot_of(self, light_id):
+        return self.slots.get(light_id)
+
+    def to_dict(self, slot):
+        """Same shape as TrafficLight.to_dict()"""
+        with self._lock:
+            return {
+                'id': int(self.db_id[slot]),
+                'light_id': self.light_ids[slot],
+                'location_lat': float(self.lat[slot]),
+                'location_lng': float(self.lng[slot]),
+                'intersection_name': self.intersection_names[slot],
+                'current_state': STATES[self.state[slot]],
+                'cycle_duration': int(self.cycle_duration[slot]),
+                'last_updated': from_micros(int(self.updated_micros[slot])).isoformat(),
+                'is_active': bool(self.is_active[slot])
+            }
+
+    def active_dicts(self):
+        """TrafficLight.to_dict() for every active light, built column-wise"""
+        with self._lock:
+            slots = np.nonzero(self.is_active[:self.size])[0]
+            columns = zip(
+                self.db_id[slots].tolist(), slots.tolist(), self.lat[slots].tolist(), self.lng[slots].tolist(),
+                self.state[slots].tolist(), self.cycle_duration[slots].tolist(), self.updated_micros[slots].tolist()
+            )
+            return [{
+                'id': db_id,
+                'light_id': self.light_ids[slot],
+                'location_lat': lat,
+                'location_lng': lng,
+                'intersection_name': self.intersection_names[slot],
+                'current_state': STATES[state],
+                'cycle_duration': cycle_duration,
+                'last_updated': from_micros(updated).isoformat(),
+                'is_active': True
+            } for db_id, slot, lat, lng, state, cycle_duration, updated in columns]
+
+    def active_rows(self):
+        """active_dicts() as tuples ordered like LIGHT_FIELDS"""
+        with self._lock:
+            slots = np.nonzero(self.is_active[:self.size])[0]
+            slot_list = slots.tolist()
+            return list(zip(
+                [STATES[state] for state in self.state[slots].tolist()],
+                self.cycle_duration[slots].tolist(),
+                self.db_id[slots].tolist(),
+                [self.intersection_names[slot] for slot in slot_list],
+                [True] * len(slot_list),
+                isoformat_micros(self.updated_micros[slots]),
+                [self.light_ids[slot] for slot in slot_list],
+                self.lat[slots].tolist(),
+                self.lng[slots].tolist()
+            ))
+
+    def light_events(self, slots):
+        """(light_id, lat, lng, to_dict()) feed events for the given slots"""
+        slots = np.asarray(slots, dtype=np.int64)
+        with self._lock:
+            columns = zip(
+                self.db_id[slots].tolist(), slots.tolist(), self.lat[slots].tolist(), self.lng[slots].tolist(),
+                self.state[slots].tolist(), self.cycle_duration[slots].tolist(),
+                self.updated_micros[slots].tolist(), self.is_active[slots].tolist()
+            )
+            return [(self.light_ids[slot], lat, lng, {
+                'id': db_id,
+                'light_id': self.light_ids[slot],
+                'location_lat': lat,
+                'location_lng': lng,
+                'intersection_name': self.intersection_names[slot],
+                'current_state': STATES[state],
+                'cycle_duration': cycle_duration,
+                'last_updated': from_micros(updated).isoformat(),
+                'is_active': is_active
+            }) for db_id, slot, lat, lng, state, cycle_duration, updated, is_active in columns]
+
+    def publish_lights(self, slots):
+        if self.feed is not None and self.feed.subscriber_count and len(slots):
+            self.feed.publish('lights', self.light_events(slots))
+
+    def publish_actions(self, actions, ids=None):
+        """Publish persisted ControlAction column dicts, placed at their target light"""
+        if self.feed is None or not self.feed.subscriber_count or not actions:
+            return
+        events = []
+        with self._lock:
+            for index, action in enumerate(actions):
+                slot = self.slots.get(action.get('target_id'))
+                lat = float(self.lat[slot]) if slot is not None else None
+                lng = float(self.lng[slot]) if slot is not None else None
+                payload = {column: value.isoformat() if isinstance(value, datetime) else value
+                           for column, value in action.items()}
+                if ids is not None:
+                    payload['id'] = ids[index]
+                # Actions are never coalesced: each gets its own key
+                key = payload.get('id') or (action.get('target_id'), payload.get('created_at'), index)
+                events.append((key, lat, lng, payload))
+        self.feed.publish('actions', events)
+
+    def active_slots(self, min_lat=None, min_lng=None, max_lat=None, max_lng=None):
+        """Slots of active lights, optionally inside half-open bounds"""
+        with self._lock:
+            mask = self.is_active[:self.size].copy()
+            if min_lat is not None:
+                mask &= self.lat[:self.size] >= min_lat
+            if max_lat is not None:
+                mask &= self.lat[:self.size] < max_lat
+            if min_lng is not None:
+                mask &= self.lng[:self.size] >= min_lng
+            if max_lng is not None:
+                mask &= self.lng[:self.size] < max_lng
+            return np.nonzero(mask)[0]
+
+    # O(1) writes
+
+    def set_state(self, slot, state, moment=None):
+        """Change a light's state; returns the previous state name"""
+        with self._lock:
+            old_state = STATES[self.state[slot]]
+            self.state[slot] = STATE_CODES[state]
+            self.updated_micros[slot] = to_micros(moment or datetime.utcnow())
+            self.version += 1
+            self._dirty.add(slot)
+            self._maybe_wake()
+            return old_state
+
+    def set_states(self, slots, state, moment=None):
+        """Set many lights to one state; returns their previous state names"""
+        slots = np.asarray(slots, dtype=np.int64)
+        with self._lock:
+            old_states = [STATES[code] for code in self.state[slots]]
+            self.state[slots] = STATE_CODES[state]
+            self.updated_micros[slots] = to_micros(moment or datetime.utcnow())
+            self.version += 1
+            self._dirty.update(slots.tolist())
+            self._maybe_wake()
+            return old_states
+
+    def set_cycle_durations(self, slots, durations):
+        slots = np.asarray(slots, dtype=np.int64)
+        with self._lock:
+            self.cycle_duration[slots] = durations
+            self.version += 1
+            self._dirty.update(slots.tolist())
+            self._maybe_wake()
+
+    def log_actions(self, action_rows):
+        """Queue ControlAction rows (column dicts) for the next flush"""
+        with self._lock:
+            self._pending_actions.extend(action_rows)
+            self._maybe_wake()
+
+    def _maybe_wake(self):
+        if len(self._dirty) + len(self._pending_actions) >= self.flush_batch:
+            self._wake.set()
+
+    # Write-behind persistence
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._dirty) + len(self._pending_actions)
+
+    def flush(self):
+        """Persist dirty lights and queued actions.
+
+        Lights, and actions when no action log is attached, are committed in
+        one transaction. With an action log the actions are appended after
+        that commit; any the log did not write stay queued for the next
+        flush, so a failed append is retried without duplicating actions.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            slots = sorted(self._dirty)
+            self._dirty.clear()
+            actions = self._pending_actions
+            self._pending_actions = []
+            light_rows = [{
+                'b_id': int(self.db_id[slot]),
+                'b_current_state': STATES[self.state[slot]],
+                'b_cycle_duration': int(self.cycle_duration[slot]),
+                'b_last_updated': from_micros(int(self.updated_micros[slot]))
+            } for slot in slots]
+
+        if not light_rows and not actions:
+            return 0
+
+        table = TrafficLight.__table__
+        try:
+            if light_rows:
+                db.session.execute(
+                    table.update()
+                    .where(table.c.id == db.bindparam('b_id'))
+                    .values(current_state=db.bindparam('b_current_state'),
+                            cycle_duration=db.bindparam('b_cycle_duration'),
+                            last_updated=db.bindparam('b_last_updated')),
+                    light_rows
+                )
+            if actions and self.action_log is None:
+                db.session.execute(ControlAction.__table__.insert(), actions)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Keep the changes queued so the next flush retries them
+            with self._lock:
+                self._dirty.update(slots)
+                self._pending_actions[:0] = actions
+            raise
+        self.publish_lights(slots)
+        self.rows_flushed += len(light_rows)
+
+        action_ids = None
+        if actions and self.action_log is not None:
+            action_ids = []
+            try:
+                self.action_log.append(actions, action_ids)
+            except Exception:
+                # Requeue from the first action the log did not commit
+                appended = len(action_ids)
+                with self._lock:
+                    self._pending_actions[:0] = actions[appended:]
+                self.publish_actions(actions[:appended], action_ids)
+                self.actions_flushed += appended
+                raise
+
+        self.publish_actions(actions, action_ids)
+        self.flushes += 1
+        self.actions_flushed += len(actions)
+        return len(light_rows) + len(actions)
+
+    def start(self, app):
+        """Start the background flusher for an app"""
+        self.app = app
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='signal-state-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop, 5)
+
+    def stop(self, timeout=None):
+        """Stop the flusher after a final flush, then release the lease"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.app is not None:
+            with self.app.app_context():
+                self._release_lease()
+
+    def _renew_lease(self):
+        """Renew the lease a third of the way through its term; raises once it is lost"""
+        if self.lease is None or time.monotonic() - self._lease_renewed < self.lease.lease_seconds / 3:
+            return
+        if not self.lease.renew():
+            raise RuntimeError(f"Lost lease '{self.lease.name}' to another process; not flushing stale light state")
+        self._lease_renewed = time.monotonic()
+
+    def _release_lease(self):
+        if self._lease_held:
+            self._lease_held = False
+            self.lease.release()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                with self.app.app_context():
+                    self._renew_lease()
+                    self.flush()
+            except Exception as e:
+                self.flush_errors += 1
+                self.last_flush_error = str(e)
+            if stopping:
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lights': self.size,
+                'active_lights': int(self.is_active[:self.size].sum()),
+                'pending_light_updates': len(self._dirty),
+                'pending_actions': len(self._pending_actions),
+                'flushes': self.flushes,
+                'rows_flushed': self.rows_flushed,
+                'actions_flushed': self.actions_flushed,
+                'flush_errors': self.flush_errors,
+                'last_flush_error': self.last_flush_error,
+                'array_bytes': sum(getattr(self, name).nbytes for name in STATE_ARRAYS)
+            }
@@ -0,0 +1,99 @@
+"""Benchmark the segmented action log at audit volumes.
+
+Appends N actions spread over a simulated month for a few thousand
+targets in flush-sized batches, then times newest-first pages, per-target
+time range pages and compaction.
+
+Usage (from the traffic-control directory):
+
+    python -m src.tools.bench_action_log --actions 2000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.services.action_log import ActionLog
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(float(np.median(samples)), 3), 'max_ms': round(float(np.max(samples)), 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--actions', type=int, default=2000000)
+    parser.add_argument('--targets', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=5000)
+    parser.add_argument('--segment-rows', type=int, default=250000)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    start = datetime(2024, 1, 1)
+    step = timedelta(days=30) / args.actions
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = ActionLog(segment_max_rows=args.segment_rows).open(tmp)
+
+        started = time.perf_counter()
+        for first in range(0, args.actions, args.batch):
+            count = min(args.batch, args.actions - first)
+            targets = rng.integers(0, args.targets, count)
+            log.append([{
+                'action_type': 'LIGHT_TIMING_UPDATE',
+                'target_id': f"TL_{target:05d}",
+                'action_data': '{"old_cycle_duration": 120, "new_cycle_duration": 150}',
+                'status': 'EXECUTED',
+                'created_at': start + step * (first + offset),
+                'executed_at': start + step * (first + offset),
+                'created_by': 'ADAPTIVE_SYSTEM'
+            } for offset, target in enumerate(targets.tolist())])
+        append_seconds = time.perf_counter() - started
+
+        week = (start + timedelta(days=10), start + timedelta(days=17))
+        results = {
+            'actions': args.actions,
+            'segments': len(log.segments),
+            'append_rows_per_second': round(args.actions / append_seconds),
+            'latest_page': timed(lambda: log.query(limit=50), 20),
+            'target_latest_page': timed(lambda: log.query(target_id=f"TL_{rng.integers(args.targets):05d}"), 50),
+            'target_week_page': timed(lambda: log.query(target_id=f"TL_{rng.integers(args.targets):05d}",
+                                                        since=week[0], until=week[1]), 50),
+        }
+
+        # Walk one target's whole history through cursors
+        def walk():
+            cursor, rows = None, 0
+            while True:
+                page, cursor = log.query(target_id='TL_00042', cursor=cursor, limit=100)
+                rows += len(page)
+                if cursor is None:
+                    return rows
+        results['target_full_history'] = timed(walk, 3)
+
+        started = time.perf_counter()
+        removed = log.compact(target_rows=args.segment_rows * 4)
+        results['compaction'] = {'segments_removed': removed, 'seconds': round(time.perf_counter() - started, 2),
+                                 'segments_after': len(log.segments)}
+        results['target_week_page_after_compaction'] = timed(
+            lambda: log.query(target_id=f"TL_{rng.integers(args.targets):05d}", since=week[0], until=week[1]), 50)
+        log.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
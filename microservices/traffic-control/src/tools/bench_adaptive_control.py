@@ -0,0 +1,137 @@
+"""Benchmark a full adaptive control cycle at city scale.
+
+Creates a throwaway SQLite database with N active lights laid out on a
+grid, synthesizes per-cell conditions around them and times complete
+control cycles against the in-memory signal state table (spatial join,
+vectorized decision, apply) plus the write-behind flush that persists them.
+
+Usage (from the traffic-control directory):
+
+    python -m src.tools.bench_adaptive_control --lights 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from flask import Flask
+
+from src.models.traffic_control import db, TrafficLight, ControlAction
+from src.services.adaptive_control import (
+    CONDITIONS_CELL_DEGREES, cell_index, decide_cycle_durations, join_lights_to_cells, run_control_cycle
+)
+from src.services.signal_state import SignalStateTable
+
+ORIGIN = (40.60, -74.10)
+SPACING_DEGREES = 0.002
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed_lights(count):
+    side = int(np.ceil(np.sqrt(count)))
+    index = np.arange(count)
+    lats = ORIGIN[0] + (index // side) * SPACING_DEGREES
+    lngs = ORIGIN[1] + (index % side) * SPACING_DEGREES
+    db.session.execute(TrafficLight.__table__.insert(), [{
+        'light_id': f"TL_{i:06d}",
+        'location_lat': float(lats[i]),
+        'location_lng': float(lngs[i]),
+        'intersection_name': f"Intersection {i}",
+        'current_state': 'GREEN',
+        'cycle_duration': 120,
+        'is_active': True
+    } for i in range(count)])
+    db.session.commit()
+    return lats, lngs
+
+
+def synthetic_conditions(lats, lngs, rng):
+    """One aggregate per occupied cell, with congested and quiet districts"""
+    keys = np.unique(np.stack((cell_index(lats), cell_index(lngs)), axis=1), axis=0)
+    counts = rng.integers(1, 20, len(keys)).astype(np.float64)
+    phase = rng.uniform(0, 2 * np.pi, 2)
+    field = np.sin(keys[:, 0] / 7 + phase[0]) * np.cos(keys[:, 1] / 9 + phase[1])
+    avg_vehicles = np.clip(45 + 40 * field + rng.normal(0, 5, len(keys)), 0, None)
+    congested_share = np.clip((avg_vehicles - 40) / 40, 0, 1)
+    return {
+        'row': keys[:, 0],
+        'col': keys[:, 1],
+        'reading_count': counts,
+        'vehicle_sum': avg_vehicles * counts,
+        'high_count': np.round(counts * congested_share)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lights', type=int, default=10000)
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            lats, lngs = seed_lights(args.lights)
+
+            states = SignalStateTable()
+            started = time.perf_counter()
+            states.load()
+            load_ms = round((time.perf_counter() - started) * 1000, 2)
+
+            timings = {'join': [], 'decide': [], 'full_cycle': [], 'flush': []}
+            actions = []
+            for _ in range(args.cycles):
+                conditions = synthetic_conditions(lats, lngs, rng)
+                slots = states.active_slots()
+
+                started = time.perf_counter()
+                reading_count, vehicle_sum, high_count = join_lights_to_cells(
+                    states.lat[slots], states.lng[slots], conditions)
+                timings['join'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                decide_cycle_durations(states.cycle_duration[slots], reading_count, vehicle_sum, high_count)
+                timings['decide'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                actions.append(len(run_control_cycle(states, conditions)))
+                timings['full_cycle'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                states.flush()
+                timings['flush'].append(time.perf_counter() - started)
+
+            logged = db.session.query(db.func.count(ControlAction.id)).scalar()
+
+    print(json.dumps({
+        'lights': args.lights,
+        'cells_per_cycle': int(len(conditions['row'])),
+        'cycles': args.cycles,
+        'state_load_ms': load_ms,
+        'actions_per_cycle': actions,
+        'actions_logged': logged,
+        'cell_degrees': CONDITIONS_CELL_DEGREES,
+        'median_ms': {name: round(float(np.median(values)) * 1000, 2) for name, values in timings.items()},
+        'max_ms': {name: round(float(np.max(values)) * 1000, 2) for name, values in timings.items()}
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark bulk provisioning of traffic lights and signals.
+
+For each batch size, times POST /api/traffic-lights/bulk and
+/api/signals/bulk on an empty throwaway database (all creates), then
+again with every item changed (all updates). The per-item endpoints are
+timed on a small sample for comparison.
+
+Usage (from the traffic-control directory):
+
+    python -m src.tools.bench_bulk_provisioning --sizes 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from src.models.traffic_control import db
+from src.routes.control import control_bp, get_light_states, get_signal_expiry
+from src.tools.bench_adaptive_control import ORIGIN, SPACING_DEGREES, make_app
+
+
+def light_items(count, cycle_duration):
+    side = max(int(count ** 0.5), 1)
+    return [{
+        'light_id': f"TL_{i:06d}",
+        'location_lat': ORIGIN[0] + (i // side) * SPACING_DEGREES,
+        'location_lng': ORIGIN[1] + (i % side) * SPACING_DEGREES,
+        'intersection_name': f"Intersection {i}",
+        'cycle_duration': cycle_duration
+    } for i in range(count)]
+
+
+def signal_items(count, priority):
+    expires_at = (datetime.utcnow() + timedelta(hours=2)).isoformat()
+    return [{
+        'signal_id': f"SIG_{i:06d}",
+        'signal_type': 'LANE_CLOSURE',
+        'location_lat': ORIGIN[0],
+        'location_lng': ORIGIN[1],
+        'message': f"Lane closure {i}",
+        'priority': priority,
+        'expires_at': expires_at
+    } for i in range(count)]
+
+
+def timed_post(client, path, payload):
+    started = time.perf_counter()
+    response = client.post(path, json=payload)
+    elapsed = time.perf_counter() - started
+    body = response.get_json()
+    if response.status_code != 200 or body.get('error', 0):
+        raise SystemExit(body)
+    return elapsed
+
+
+def run_size(size, per_item_sample):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        app.config['ACTION_LOG_DIR'] = os.path.join(tmp, 'action_log')
+        app.register_blueprint(control_bp, url_prefix='/api')
+        with app.app_context():
+            db.create_all()
+            states = get_light_states()
+            expiry = get_signal_expiry()
+        client = app.test_client()
+
+        lights_create = timed_post(client, '/api/traffic-lights/bulk', {'traffic_lights': light_items(size, 120)})
+        lights_update = timed_post(client, '/api/traffic-lights/bulk', {'traffic_lights': light_items(size, 90)})
+        signals_create = timed_post(client, '/api/signals/bulk', {'signals': signal_items(size, 'MEDIUM')})
+        signals_update = timed_post(client, '/api/signals/bulk', {'signals': signal_items(size, 'HIGH')})
+
+        started = time.perf_counter()
+        for i in range(per_item_sample):
+            client.post('/api/traffic-lights', json={'light_id': f"ONE_{i}", 'location_lat': ORIGIN[0],
+                                                      'location_lng': ORIGIN[1]})
+        per_item = (time.perf_counter() - started) / per_item_sample
+
+        states.stop(5)
+        expiry.stop(5)
+
+    def rate(seconds):
+        return {'seconds': round(seconds, 3), 'rows_per_second': round(size / seconds)}
+
+    return {
+        'rows': size,
+        'lights_create': rate(lights_create),
+        'lights_update': rate(lights_update),
+        'signals_create': rate(signals_create),
+        'signals_update': rate(signals_update),
+        'per_item_post_ms': round(per_item * 1000, 3),
+        'per_item_estimate_seconds': round(per_item * size, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--per-item-sample', type=int, default=200)
+    args = parser.parse_args(argv)
+    print(json.dumps([run_size(size, args.per_item_sample) for size in args.sizes], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark emergency corridor activation at city scale.
+
+Seeds a throwaway SQLite database with N lights on a street grid, then
+times corridor-mode POST /api/emergency-response requests for random
+routes that follow the grid (end to end, including the single commit),
+and the corridor lookup on its own.
+
+Usage (from the traffic-control directory):
+
+    python -m src.tools.bench_emergency_corridor --lights 20000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from src.models.traffic_control import db
+from src.routes.control import control_bp, corridor_index, get_light_states
+from src.services.emergency_corridor import lights_along_route
+from src.tools.bench_adaptive_control import ORIGIN, SPACING_DEGREES, make_app, seed_lights
+
+
+def grid_route(side, rng, blocks):
+    """An L-shaped route along the street grid, one vertex per intersection"""
+    row, col = rng.integers(0, side - blocks, 2)
+    east, north = rng.integers(1, blocks, 2)
+    points = [(row, col + step) for step in range(east + 1)]
+    points += [(row + step, col + east) for step in range(1, north + 1)]
+    return [[ORIGIN[0] + r * SPACING_DEGREES, ORIGIN[1] + c * SPACING_DEGREES] for r, c in points]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lights', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--blocks', type=int, default=30, help='maximum blocks per route leg')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    side = int(np.ceil(np.sqrt(args.lights)))
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        app.config['ACTION_LOG_DIR'] = os.path.join(tmp, 'action_log')
+        app.register_blueprint(control_bp, url_prefix='/api')
+        with app.app_context():
+            db.create_all()
+            seed_lights(args.lights)
+
+            started = time.perf_counter()
+            states = get_light_states()
+            load_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            corridor_index.grid()
+            index_ms = (time.perf_counter() - started) * 1000
+
+        client = app.test_client()
+        lookup, request_ms, affected = [], [], []
+        for _ in range(args.requests):
+            route = grid_route(side, rng, args.blocks)
+            points = np.asarray(route)
+
+            started = time.perf_counter()
+            lights_along_route(corridor_index.grid(), points[:, 0], points[:, 1])
+            lookup.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            response = client.post('/api/emergency-response', json={
+                'mode': 'corridor',
+                'emergency_type': 'FIRE',
+                'location_lat': route[0][0],
+                'location_lng': route[0][1],
+                'route': route
+            })
+            request_ms.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise SystemExit(response.get_json())
+            affected.append(response.get_json()['affected_lights'])
+        states.stop(5)
+
+    print(json.dumps({
+        'lights': args.lights,
+        'requests': args.requests,
+        'state_load_ms': round(load_ms, 2),
+        'index_build_ms': round(index_ms, 2),
+        'median_affected_lights': float(np.median(affected)),
+        'lookup_ms': {'median': round(float(np.median(lookup)), 3), 'p95': round(float(np.percentile(lookup, 95)), 3)},
+        'request_ms': {'median': round(float(np.median(request_ms)), 2),
+                       'p95': round(float(np.percentile(request_ms, 95)), 2),
+                       'max': round(float(np.max(request_ms)), 2)}
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
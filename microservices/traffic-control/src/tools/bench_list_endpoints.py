@@ -0,0 +1,133 @@
+"""Benchmark the chunked JSON list endpoints against the jsonify path.
+
+Provisions lights and signals in a throwaway database and appends
+actions to a throwaway action log, then times GET /api/traffic-lights,
+/api/signals and /api/actions next to the previous implementation,
+served from a baseline blueprint: ORM instances and to_dict() for
+signals, jsonify over the same dicts for lights and actions. Response
+bodies must be identical. /actions pages are capped at the action log's
+MAX_QUERY_LIMIT.
+
+Usage (from the traffic-control directory):
+
+    python -m src.tools.bench_list_endpoints --limit 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from flask import Blueprint, jsonify, request
+from src.models.traffic_control import db, TrafficSignal
+from src.routes.control import control_bp, action_log, get_light_states, get_signal_expiry
+from src.services.action_log import MAX_QUERY_LIMIT
+from src.tools.bench_adaptive_control import make_app
+from src.tools.bench_bulk_provisioning import light_items, signal_items
+
+baseline_bp = Blueprint('baseline', __name__)
+
+
+@baseline_bp.route('/traffic-lights', methods=['GET'])
+def baseline_traffic_lights():
+    lights = get_light_states().active_dicts()
+    return jsonify({
+        'traffic_lights': lights,
+        'count': len(lights)
+    }), 200
+
+
+@baseline_bp.route('/signals', methods=['GET'])
+def baseline_signals():
+    signals = TrafficSignal.query.filter(
+        TrafficSignal.is_active == True,
+        db.or_(TrafficSignal.expires_at.is_(None), TrafficSignal.expires_at > datetime.utcnow())
+    ).all()
+    return jsonify({
+        'signals': [signal.to_dict() for signal in signals],
+        'count': len(signals)
+    }), 200
+
+
+@baseline_bp.route('/actions', methods=['GET'])
+def baseline_actions():
+    actions, next_cursor = action_log.query(limit=request.args.get('limit', 50, type=int))
+    return jsonify({
+        'actions': actions,
+        'count': len(actions),
+        'next_cursor': next_cursor
+    }), 200
+
+
+def action_items(count):
+    now = datetime.utcnow()
+    return [{
+        'action_type': 'LIGHT_CHANGE',
+        'target_id': f"TL_{i % 1000:06d}",
+        'action_data': json.dumps({'previous_state': 'RED', 'new_state': 'GREEN'}),
+        'status': 'EXECUTED',
+        'created_at': now - timedelta(seconds=i),
+        'executed_at': now - timedelta(seconds=i),
+        'created_by': 'BENCH'
+    } for i in range(count)]
+
+
+def timed(client, path, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        body = response.get_data()
+        best = min(best, time.perf_counter() - started)
+        if response.status_code != 200:
+            raise SystemExit(body)
+    return best, body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--limit', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    report = {'limit': args.limit, 'endpoints': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        app.config['ACTION_LOG_DIR'] = os.path.join(tmp, 'action_log')
+        app.register_blueprint(control_bp, url_prefix='/api')
+        app.register_blueprint(baseline_bp, url_prefix='/baseline')
+        with app.app_context():
+            db.create_all()
+            states = get_light_states()
+            expiry = get_signal_expiry()
+        client = app.test_client()
+        client.post('/api/traffic-lights/bulk', json={'traffic_lights': light_items(args.limit, 120)})
+        client.post('/api/signals/bulk', json={'signals': signal_items(args.limit, 'MEDIUM')})
+        action_log.append(action_items(args.limit))
+
+        action_limit = min(args.limit, MAX_QUERY_LIMIT)
+        for path in ('/traffic-lights', '/signals', f"/actions?limit={action_limit}"):
+            baseline_seconds, baseline_body = timed(client, '/baseline' + path, args.repeat)
+            seconds, body = timed(client, '/api' + path, args.repeat)
+            if baseline_body != body:
+                raise SystemExit(f"{path}: response bodies differ")
+            report['endpoints'][path.split('?')[0]] = {
+                'rows': json.loads(body)['count'],
+                'bytes': len(body),
+                'baseline_ms': round(baseline_seconds * 1000, 1),
+                'chunked_ms': round(seconds * 1000, 1),
+                'speedup': round(baseline_seconds / seconds, 1)
+            }
+
+        states.stop(5)
+        expiry.stop(5)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
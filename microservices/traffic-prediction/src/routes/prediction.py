@@ -1,16 +1,67 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 import requests
-import statistics
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
 import math
+import os
+import threading
+from common.event_log import FileEventLog, EventSubscriber
+from common.reading_window import ReadingWindow
+from common import metrics
+from src.services.route_estimator import estimate_route, DEFAULT_CORRIDOR_M, MAX_CORRIDOR_M
+from src.services.prediction_cache import PredictionCache, hour_bucket
+from src.services.online_forecaster import OnlineForecaster
+from src.services.congestion_model import compute_congestion_predictions, compute_online_predictions
 
 prediction_bp = Blueprint('prediction', __name__)
 
 # Configuration for other services
-DATA_INGESTION_URL = "http://localhost:5000/api"
 TRAFFIC_ANALYSIS_URL = "http://localhost:5001/api"
 
+# Bump when the prediction logic changes so cached answers are not reused
+MODEL_VERSION = '3'
+
+# Cached predictions are dropped when new readings arrive near their cell
+prediction_cache = PredictionCache()
+
+# Online per-sensor model, restored from its checkpoint on startup and fed
+# every new reading from the ingestion event log
+FORECASTER_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'online_forecaster.npz')
+online_forecaster = OnlineForecaster(checkpoint_path=FORECASTER_CHECKPOINT_PATH)
+forecaster_restored = online_forecaster.restore()
+forecaster_subscriber = None
+
+# Recent readings for route times and the fallback model, kept warm from the
+# same log. Tests can set the EVENT_LOG app config key to a MemoryEventLog.
+READING_WINDOW_SECONDS = 3600
+ROUTE_CONDITIONS_SECONDS = 15 * 60
+reading_window = ReadingWindow(READING_WINDOW_SECONDS)
+_event_log_init_lock = threading.Lock()
+
+def follow_event_log():
+    """Start following the ingestion event log (inside an app context)"""
+    global forecaster_subscriber
+    if forecaster_subscriber is None:
+        with _event_log_init_lock:
+            if forecaster_subscriber is None:
+                log = current_app.config.get('EVENT_LOG') or FileEventLog(current_app.config.get('EVENT_LOG_DIR'))
+                reading_window.follow(log, 'traffic-prediction-window')
+                # Without a checkpoint the model is rebuilt from the whole log. The
+                # offset is committed only together with a checkpoint, so a restart
+                # replays everything the restored model has not seen.
+                subscriber = EventSubscriber(log, 'traffic-prediction-forecaster', {'readings': feed_online_forecaster},
+                                             start='committed' if forecaster_restored else 'earliest',
+                                             auto_commit=False)
+                subscriber.poll_once()
+                subscriber.start()
+                forecaster_subscriber = subscriber
+                metrics.register_stats('forecaster_subscriber', subscriber.stats)
+    return reading_window
+
+def feed_online_forecaster(readings):
+    """Fold readings into the online model, skipping ones its checkpoint already has"""
+    last_reading_id = online_forecaster.last_reading_id
+    online_forecaster.update_from_dicts([reading for reading in readings if reading['id'] > last_reading_id])
+
 @prediction_bp.route('/predict-congestion', methods=['POST'])
 def predict_congestion():
     """Predict traffic congestion for a specific location and time"""
@@ -27,95 +78,29 @@ def predict_congestion():
         location_lng = data['location_lng']
         prediction_hours = data['prediction_hours']
         
-        # Get historical traffic data for the area
-        response = requests.get(f"{DATA_INGESTION_URL}/traffic-data?limit=200")
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch historical traffic data'}), 500
-        
-        traffic_data = response.json()['data']
-        
-        # Filter data for nearby locations (within ~0.01 degrees)
-        nearby_data = []
-        for traffic in traffic_data:
-            lat_diff = abs(traffic['location_lat'] - location_lat)
-            lng_diff = abs(traffic['location_lng'] - location_lng)
-            
-            if lat_diff <= 0.01 and lng_diff <= 0.01:
-                nearby_data.append(traffic)
-        
-        if not nearby_data:
-            # If no nearby data, use general patterns
-            nearby_data = traffic_data[:50]  # Use recent general data
-        
-        # Simple prediction model based on historical patterns
-        predictions = []
         current_time = datetime.utcnow()
-        
-        for hour in range(1, prediction_hours + 1):
-            prediction_time = current_time + timedelta(hours=hour)
-            hour_of_day = prediction_time.hour
-            day_of_week = prediction_time.weekday()  # 0=Monday, 6=Sunday
-            
-            # Calculate base prediction from historical data
-            if nearby_data:
-                base_vehicle_count = statistics.mean([d['vehicle_count'] for d in nearby_data])
-                base_speed = statistics.mean([d['average_speed'] for d in nearby_data])
+        bucket = hour_bucket(current_time)
+        
+        # Serve repeated requests for the same cell and hour from the cache,
+        # as long as no new reading has reached the sensors near the cell
+        window = follow_event_log()
+        cache_key = PredictionCache.make_key(location_lat, location_lng, prediction_hours, bucket, MODEL_VERSION)
+        cell_lat, cell_lng = cache_key[0]
+        nearby_rows = online_forecaster.nearby_rows(cell_lat, cell_lng)
+        watermark = online_forecaster.observed(nearby_rows)
+        result = prediction_cache.get(cache_key, watermark)
+        cache_hit = result is not None
+        
+        if not cache_hit:
+            # Prefer the online model when it has sensors near the location
+            if len(nearby_rows):
+                result = compute_online_predictions(online_forecaster, nearby_rows, prediction_hours, bucket)
             else:
-                base_vehicle_count = 40
-                base_speed = 50
-            
-            # Apply time-based adjustments
-            # Rush hour patterns (7-9 AM, 5-7 PM)
-            rush_hour_multiplier = 1.0
-            if (7 <= hour_of_day <= 9) or (17 <= hour_of_day <= 19):
-                rush_hour_multiplier = 1.5
-            elif (22 <= hour_of_day or hour_of_day <= 6):
-                rush_hour_multiplier = 0.6
-            
-            # Weekend patterns
-            weekend_multiplier = 1.0
-            if day_of_week >= 5:  # Weekend
-                weekend_multiplier = 0.8
-                if 10 <= hour_of_day <= 16:  # Weekend afternoon
-                    weekend_multiplier = 1.2
-            
-            # Calculate predicted values
-            predicted_vehicle_count = int(base_vehicle_count * rush_hour_multiplier * weekend_multiplier)
-            predicted_speed = base_speed / (rush_hour_multiplier * 0.8 + 0.2)
-            
-            # Add some randomness to make it more realistic
-            predicted_vehicle_count += random.randint(-10, 10)
-            predicted_speed += random.uniform(-5, 5)
-            
-            # Ensure reasonable bounds
-            predicted_vehicle_count = max(5, min(predicted_vehicle_count, 150))
-            predicted_speed = max(10, min(predicted_speed, 80))
-            
-            # Determine congestion level
-            congestion_level = 'LOW'
-            if predicted_vehicle_count > 50 and predicted_speed < 30:
-                congestion_level = 'HIGH'
-            elif predicted_vehicle_count > 30 or predicted_speed < 50:
-                congestion_level = 'MEDIUM'
-            
-            # Calculate confidence based on amount of historical data
-            confidence = min(0.95, 0.5 + (len(nearby_data) / 100))
-            
-            predictions.append({
-                'prediction_time': prediction_time.isoformat(),
-                'hour_offset': hour,
-                'predicted_vehicle_count': round(predicted_vehicle_count),
-                'predicted_speed': round(predicted_speed, 1),
-                'predicted_congestion_level': congestion_level,
-                'confidence': round(confidence, 2),
-                'factors': {
-                    'hour_of_day': hour_of_day,
-                    'day_of_week': day_of_week,
-                    'is_rush_hour': rush_hour_multiplier > 1.0,
-                    'is_weekend': day_of_week >= 5
-                }
-            })
+                # Get historical traffic data for the area. Cells without nearby
+                # sensors fall back to general patterns, refreshed on the TTL.
+                traffic_data = window.readings()
+                result = compute_congestion_predictions(cell_lat, cell_lng, prediction_hours, bucket, traffic_data)
+            prediction_cache.put(cache_key, result, watermark)
         
         return jsonify({
             'prediction_timestamp': current_time.isoformat(),
@@ -123,72 +108,116 @@ def predict_congestion():
                 'lat': location_lat,
                 'lng': location_lng
             },
-            'historical_data_points': len(nearby_data),
-            'predictions': predictions
+            'historical_data_points': result['historical_data_points'],
+            'predictions': result['predictions'],
+            'model': result['model'],
+            'model_version': MODEL_VERSION,
+            'cache_hit': cache_hit
         }), 200
         
-    except requests.RequestException as e:
-        return jsonify({'error': f'Failed to connect to data service: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@prediction_bp.route('/online-model/stats', methods=['GET'])
+def get_online_model_stats():
+    """Get the size and progress of the online forecasting model"""
+    return jsonify({
+        'sensors': online_forecaster.size,
+        'observations': int(online_forecaster.observations[:online_forecaster.size].sum()),
+        'last_reading_id': online_forecaster.last_reading_id,
+        'params': {'alpha': online_forecaster.alpha, 'gamma': online_forecaster.gamma},
+        'restored_params': online_forecaster.restored_params,
+        'subscriber': forecaster_subscriber.stats() if forecaster_subscriber else None,
+        'state_bytes': online_forecaster.state_bytes(),
+        'checkpoint_path': online_forecaster.checkpoint_path,
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
+@prediction_bp.route('/online-model/sync', methods=['POST'])
+def sync_online_model():
+    """Feed pending event log readings into the online model and checkpoint it"""
+    try:
+        follow_event_log()
+        forecaster_subscriber.poll_once()
+        forecaster_subscriber.commit(online_forecaster.checkpoint)
+        
+        return jsonify({
+            'message': 'Online model synchronized',
+            'sensors': online_forecaster.size,
+            'last_reading_id': online_forecaster.last_reading_id
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@prediction_bp.route('/prediction-cache/stats', methods=['GET'])
+def get_prediction_cache_stats():
+    """Get prediction cache size and hit/miss counters"""
+    stats = prediction_cache.stats()
+    stats['model_version'] = MODEL_VERSION
+    return jsonify(stats), 200
+
+@prediction_bp.route('/prediction-cache/invalidate', methods=['POST'])
+def invalidate_prediction_cache():
+    """Drop all cached predictions"""
+    prediction_cache.invalidate()
+    return jsonify({
+        'message': 'Prediction cache invalidated',
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
 @prediction_bp.route('/predict-route-time', methods=['POST'])
 def predict_route_time():
     """Predict travel time for a route"""
     try:
         data = request.get_json()
         
-        required_fields = ['start_lat', 'start_lng', 'end_lat', 'end_lng']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        start_lat = data['start_lat']
-        start_lng = data['start_lng']
-        end_lat = data['end_lat']
-        end_lng = data['end_lng']
-        
-        # Calculate approximate distance (simplified)
-        lat_diff = abs(end_lat - start_lat)
-        lng_diff = abs(end_lng - start_lng)
-        distance_km = math.sqrt(lat_diff**2 + lng_diff**2) * 111  # Rough conversion to km
-        
-        # Get current traffic conditions along the route
-        response = requests.get(f"{DATA_INGESTION_URL}/traffic-data?limit=100")
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch traffic data'}), 500
-        
-        traffic_data = response.json()['data']
-        
-        # Find traffic data along the route (simplified - check points near the route)
-        route_traffic = []
-        for traffic in traffic_data:
-            # Check if traffic point is roughly along the route
-            if (min(start_lat, end_lat) - 0.01 <= traffic['location_lat'] <= max(start_lat, end_lat) + 0.01 and
-                min(start_lng, end_lng) - 0.01 <= traffic['location_lng'] <= max(start_lng, end_lng) + 0.01):
-                route_traffic.append(traffic)
-        
-        # Calculate average speed along route
-        if route_traffic:
-            avg_speed = statistics.mean([t['average_speed'] for t in route_traffic])
-            congestion_levels = [t['congestion_level'] for t in route_traffic]
-            high_congestion_count = congestion_levels.count('HIGH')
-            medium_congestion_count = congestion_levels.count('MEDIUM')
+        # A route is either a full polyline of waypoints or a straight start/end pair
+        waypoints = data.get('waypoints')
+        if waypoints:
+            if len(waypoints) < 2:
+                return jsonify({'error': 'waypoints must contain at least 2 points'}), 400
+            route_lats = [point['lat'] for point in waypoints]
+            route_lngs = [point['lng'] for point in waypoints]
         else:
-            avg_speed = 50  # Default speed
-            high_congestion_count = 0
-            medium_congestion_count = 0
-        
-        # Adjust speed based on congestion
-        if high_congestion_count > len(route_traffic) * 0.3:
-            avg_speed *= 0.6  # Reduce speed significantly
-        elif medium_congestion_count > len(route_traffic) * 0.5:
-            avg_speed *= 0.8  # Reduce speed moderately
+            required_fields = ['start_lat', 'start_lng', 'end_lat', 'end_lng']
+            for field in required_fields:
+                if field not in data:
+                    return jsonify({'error': f'Missing required field: {field}'}), 400
+            route_lats = [data['start_lat'], data['end_lat']]
+            route_lngs = [data['start_lng'], data['end_lng']]
+        
+        start_lat, start_lng = route_lats[0], route_lngs[0]
+        end_lat, end_lng = route_lats[-1], route_lngs[-1]
+        try:
+            corridor_m = float(data.get('corridor_m', DEFAULT_CORRIDOR_M))
+        except (TypeError, ValueError):
+            corridor_m = None
+        if corridor_m is None or not 0 < corridor_m <= MAX_CORRIDOR_M:
+            return jsonify({'error': f'corridor_m must be between 0 and {MAX_CORRIDOR_M}'}), 400
         
-        # Calculate travel time
-        travel_time_hours = distance_km / avg_speed
-        travel_time_minutes = travel_time_hours * 60
+        # Get current traffic conditions along the route
+        traffic_data = follow_event_log().readings(since_seconds=ROUTE_CONDITIONS_SECONDS)
+        
+        # Match readings to route segments within the corridor and sum
+        # per-segment travel times over great-circle segment lengths
+        estimate = estimate_route(
+            route_lats, route_lngs,
+            [t['location_lat'] for t in traffic_data],
+            [t['location_lng'] for t in traffic_data],
+            [t['average_speed'] for t in traffic_data],
+            [t['congestion_level'] for t in traffic_data],
+            corridor_m=corridor_m
+        )
+        route_traffic = [traffic_data[i] for i in estimate['matched_readings']]
+        
+        congestion_levels = [t['congestion_level'] for t in route_traffic]
+        high_congestion_count = congestion_levels.count('HIGH')
+        medium_congestion_count = congestion_levels.count('MEDIUM')
+        
+        distance_km = estimate['distance_km']
+        avg_speed = estimate['average_speed_kmh']
+        travel_time_minutes = estimate['travel_time_minutes']
         
         # Add buffer time based on congestion
         buffer_minutes = 0
@@ -211,7 +240,9 @@ def predict_route_time():
             'route': {
                 'start': {'lat': start_lat, 'lng': start_lng},
                 'end': {'lat': end_lat, 'lng': end_lng},
-                'distance_km': round(distance_km, 2)
+                'distance_km': round(distance_km, 2),
+                'segments': estimate['segments'],
+                'segments_with_data': estimate['segments_with_data']
             },
             'traffic_analysis': {
                 'data_points_analyzed': len(route_traffic),
@@ -227,8 +258,6 @@ def predict_route_time():
             }
         }), 200
         
-    except requests.RequestException as e:
-        return jsonify({'error': f'Failed to connect to data service: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -249,7 +278,8 @@ def predict_optimal_routes():
         end_lng = data['end_lng']
         
         # Get traffic analysis data
-        analysis_response = requests.get(f"{TRAFFIC_ANALYSIS_URL}/congestion-hotspots")
+        with metrics.upstream('traffic-analysis'):
+            analysis_response = requests.get(f"{TRAFFIC_ANALYSIS_URL}/congestion-hotspots")
         
         if analysis_response.status_code != 200:
             return jsonify({'error': 'Failed to fetch traffic analysis data'}), 500
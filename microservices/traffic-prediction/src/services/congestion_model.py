@@ -0,0 +1,150 @@
+"""Congestion prediction models shared by the API and the backtester.
+
+Both models are pure functions of their inputs so results can be cached,
+replayed and scored offline.
+"""
+import random
+import statistics
+from datetime import timedelta
+
+
+def compute_congestion_predictions(location_lat, location_lng, prediction_hours, base_time, traffic_data):
+    """Compute hourly predictions for a location from historical readings.
+
+    Deterministic for a given input: the jitter is seeded from the location
+    and prediction hour so cached and freshly computed answers agree.
+    """
+    # Filter data for nearby locations (within ~0.01 degrees)
+    nearby_data = []
+    for traffic in traffic_data:
+        lat_diff = abs(traffic['location_lat'] - location_lat)
+        lng_diff = abs(traffic['location_lng'] - location_lng)
+
+        if lat_diff <= 0.01 and lng_diff <= 0.01:
+            nearby_data.append(traffic)
+
+    if not nearby_data:
+        # If no nearby data, use general patterns
+        nearby_data = traffic_data[:50]  # Use recent general data
+
+    # Calculate base prediction from historical data
+    if nearby_data:
+        base_vehicle_count = statistics.mean([d['vehicle_count'] for d in nearby_data])
+        base_speed = statistics.mean([d['average_speed'] for d in nearby_data])
+    else:
+        base_vehicle_count = 40
+        base_speed = 50
+
+    # Simple prediction model based on historical patterns
+    predictions = []
+
+    for hour in range(1, prediction_hours + 1):
+        prediction_time = base_time + timedelta(hours=hour)
+        hour_of_day = prediction_time.hour
+        day_of_week = prediction_time.weekday()  # 0=Monday, 6=Sunday
+
+        # Apply time-based adjustments
+        # Rush hour patterns (7-9 AM, 5-7 PM)
+        rush_hour_multiplier = 1.0
+        if (7 <= hour_of_day <= 9) or (17 <= hour_of_day <= 19):
+            rush_hour_multiplier = 1.5
+        elif (22 <= hour_of_day or hour_of_day <= 6):
+            rush_hour_multiplier = 0.6
+
+        # Weekend patterns
+        weekend_multiplier = 1.0
+        if day_of_week >= 5:  # Weekend
+            weekend_multiplier = 0.8
+            if 10 <= hour_of_day <= 16:  # Weekend afternoon
+                weekend_multiplier = 1.2
+
+        # Calculate predicted values
+        predicted_vehicle_count = int(base_vehicle_count * rush_hour_multiplier * weekend_multiplier)
+        predicted_speed = base_speed / (rush_hour_multiplier * 0.8 + 0.2)
+
+        # Add some randomness to make it more realistic, seeded per location and hour
+        jitter = random.Random(f"{location_lat:.6f}:{location_lng:.6f}:{prediction_time.isoformat()}")
+        predicted_vehicle_count += jitter.randint(-10, 10)
+        predicted_speed += jitter.uniform(-5, 5)
+
+        # Ensure reasonable bounds
+        predicted_vehicle_count = max(5, min(predicted_vehicle_count, 150))
+        predicted_speed = max(10, min(predicted_speed, 80))
+
+        # Determine congestion level
+        congestion_level = 'LOW'
+        if predicted_vehicle_count > 50 and predicted_speed < 30:
+            congestion_level = 'HIGH'
+        elif predicted_vehicle_count > 30 or predicted_speed < 50:
+            congestion_level = 'MEDIUM'
+
+        # Calculate confidence based on amount of historical data
+        confidence = min(0.95, 0.5 + (len(nearby_data) / 100))
+
+        predictions.append({
+            'prediction_time': prediction_time.isoformat(),
+            'hour_offset': hour,
+            'predicted_vehicle_count': round(predicted_vehicle_count),
+            'predicted_speed': round(predicted_speed, 1),
+            'predicted_congestion_level': congestion_level,
+            'confidence': round(confidence, 2),
+            'factors': {
+                'hour_of_day': hour_of_day,
+                'day_of_week': day_of_week,
+                'is_rush_hour': rush_hour_multiplier > 1.0,
+                'is_weekend': day_of_week >= 5
+            }
+        })
+
+    return {
+        'model': 'historical_average',
+        'historical_data_points': len(nearby_data),
+        'predictions': predictions
+    }
+
+
+def compute_online_predictions(forecaster, rows, prediction_hours, base_time):
+    """Compute hourly predictions from the online model state of nearby sensors"""
+    prediction_times = [base_time + timedelta(hours=hour) for hour in range(1, prediction_hours + 1)]
+    vehicle_counts, speeds, slot_observations = forecaster.forecast(rows, prediction_times)
+
+    predictions = []
+    for index, prediction_time in enumerate(prediction_times):
+        hour_of_day = prediction_time.hour
+        day_of_week = prediction_time.weekday()
+
+        # Ensure reasonable bounds
+        predicted_vehicle_count = max(5, min(float(vehicle_counts[index]), 150))
+        predicted_speed = max(10, min(float(speeds[index]), 80))
+
+        # Determine congestion level
+        congestion_level = 'LOW'
+        if predicted_vehicle_count > 50 and predicted_speed < 30:
+            congestion_level = 'HIGH'
+        elif predicted_vehicle_count > 30 or predicted_speed < 50:
+            congestion_level = 'MEDIUM'
+
+        # Confidence grows with observations of this hour of the week per sensor
+        confidence = min(0.95, 0.5 + 0.05 * (int(slot_observations[index]) / len(rows)))
+
+        predictions.append({
+            'prediction_time': prediction_time.isoformat(),
+            'hour_offset': index + 1,
+            'predicted_vehicle_count': round(predicted_vehicle_count),
+            'predicted_speed': round(predicted_speed, 1),
+            'predicted_congestion_level': congestion_level,
+            'confidence': round(confidence, 2),
+            'factors': {
+                'hour_of_day': hour_of_day,
+                'day_of_week': day_of_week,
+                'is_rush_hour': (7 <= hour_of_day <= 9) or (17 <= hour_of_day <= 19),
+                'is_weekend': day_of_week >= 5,
+                'seasonal_observations': int(slot_observations[index])
+            }
+        })
+
+    return {
+        'model': 'online_seasonal',
+        'historical_data_points': int(forecaster.observations[rows].sum()),
+        'predictions': predictions
+    }
@@ -0,0 +1,207 @@
+"""Online per-sensor forecasting with hour-of-week seasonality.
+
+Each sensor keeps an additive Holt-Winters style state (a level plus one
+seasonal offset per hour of the week) for vehicle count and average speed.
+A new reading updates its sensor in O(1). State lives in compact NumPy
+arrays indexed by sensor row and is checkpointed atomically to disk so the
+service can restart without replaying history.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+HOURS_PER_WEEK = 168
+METRICS = ('vehicle_count', 'average_speed')
+DEFAULT_ALPHA = 0.02  # level smoothing
+DEFAULT_GAMMA = 0.3  # seasonal smoothing
+DEFAULT_CHECKPOINT_EVERY = 1000  # readings
+DEFAULT_CHECKPOINT_SECONDS = 60
+STATE_ARRAYS = ('lat', 'lng', 'level', 'seasonal', 'slot_counts', 'observations', 'last_seen')
+
+
+def hour_of_week(moment):
+    """Seasonal slot of a datetime, 0 = Monday 00:00"""
+    return moment.weekday() * 24 + moment.hour
+
+
+class OnlineForecaster:
+    """Per-sensor exponential smoothing with hour-of-week seasonal offsets"""
+
+    def __init__(self, checkpoint_path=None, alpha=DEFAULT_ALPHA, gamma=DEFAULT_GAMMA,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY, checkpoint_seconds=DEFAULT_CHECKPOINT_SECONDS,
+                 initial_capacity=64):
+        self.checkpoint_path = checkpoint_path
+        self.alpha = alpha
+        self.gamma = gamma
+        # (alpha, gamma) the restored state was built with; the configured
+        # parameters above keep applying to new readings
+        self.restored_params = None
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        self._lock = threading.Lock()
+
+        self.sensor_rows = {}
+        self.sensor_ids = []
+        self.size = 0
+        self.last_reading_id = 0
+        self._allocate(initial_capacity)
+
+        self._pending = 0
+        self._checkpointed_at = time.monotonic()
+
+    def _allocate(self, capacity):
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lng = np.zeros(capacity, dtype=np.float64)
+        self.level = np.zeros((capacity, len(METRICS)), dtype=np.float64)
+        self.seasonal = np.zeros((capacity, HOURS_PER_WEEK, len(METRICS)), dtype=np.float32)
+        self.slot_counts = np.zeros((capacity, HOURS_PER_WEEK), dtype=np.uint16)
+        self.observations = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+
+    def _grow(self):
+        capacity = len(self.lat) * 2
+        for name in STATE_ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _row(self, sensor_id, lat, lng):
+        row = self.sensor_rows.get(sensor_id)
+        if row is None:
+            if self.size == len(self.lat):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.sensor_rows[sensor_id] = row
+            self.sensor_ids.append(sensor_id)
+        self.lat[row] = lat
+        self.lng[row] = lng
+        return row
+
+    def update(self, sensor_id, lat, lng, timestamp, vehicle_count, average_speed, reading_id=None):
+        """Fold one reading into its sensor's state in O(1)"""
+        with self._lock:
+            row = self._row(sensor_id, lat, lng)
+            slot = hour_of_week(timestamp)
+            value = np.array((vehicle_count, average_speed), dtype=np.float64)
+
+            if self.observations[row] == 0:
+                self.level[row] = value
+            else:
+                seasonal = self.seasonal[row, slot].astype(np.float64)
+                level = self.alpha * (value - seasonal) + (1 - self.alpha) * self.level[row]
+                self.seasonal[row, slot] = self.gamma * (value - level) + (1 - self.gamma) * seasonal
+                self.level[row] = level
+
+            self.slot_counts[row, slot] = min(int(self.slot_counts[row, slot]) + 1, np.iinfo(np.uint16).max)
+            self.observations[row] += 1
+            # Stored timestamps are naive UTC; timestamp() alone would read them as local time
+            moment = timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+            self.last_seen[row] = max(self.last_seen[row], moment.timestamp())
+            if reading_id is not None:
+                self.last_reading_id = max(self.last_reading_id, reading_id)
+            self._pending += 1
+
+        self.maybe_checkpoint()
+
+    def update_from_dicts(self, readings):
+        """Fold readings shaped like TrafficData.to_dict() in order"""
+        for reading in readings:
+            self.update(
+                reading['sensor_id'],
+                reading['location_lat'],
+                reading['location_lng'],
+                datetime.fromisoformat(reading['timestamp']),
+                reading['vehicle_count'],
+                reading['average_speed'],
+                reading_id=reading.get('id')
+            )
+
+    def nearby_rows(self, lat, lng, radius_degrees=0.01):
+        """Rows of sensors within a lat/lng box around a point"""
+        with self._lock:
+            near = ((np.abs(self.lat[:self.size] - lat) <= radius_degrees) &
+                    (np.abs(self.lng[:self.size] - lng) <= radius_degrees))
+            return np.nonzero(near)[0]
+
+    def observed(self, rows):
+        """(sensors, readings) folded into rows so far; moves whenever one of them is updated"""
+        with self._lock:
+            return len(rows), int(self.observations[rows].sum())
+
+    def forecast(self, rows, moments):
+        """Forecast (vehicle_count, average_speed, slot observations) averaged over rows.
+
+        Returns arrays with one entry per moment. Slots a sensor has never
+        observed contribute no seasonal offset.
+        """
+        slots = np.array([hour_of_week(moment) for moment in moments], dtype=np.int64)
+        with self._lock:
+            level = self.level[rows]  # (rows, metrics)
+            seasonal = self.seasonal[rows][:, slots, :].astype(np.float64)  # (rows, slots, metrics)
+            counts = self.slot_counts[rows][:, slots]  # (rows, slots)
+        forecast = level[:, None, :] + np.where(counts[:, :, None] > 0, seasonal, 0.0)
+        mean = forecast.mean(axis=0)
+        return mean[:, 0], mean[:, 1], counts.sum(axis=0)
+
+    def state_bytes(self):
+        """Memory held by the per-sensor state arrays"""
+        return sum(getattr(self, name).nbytes for name in STATE_ARRAYS)
+
+    def maybe_checkpoint(self):
+        """Checkpoint when enough readings or time have accumulated"""
+        if not self.checkpoint_path or not self._pending:
+            return False
+        due = (self._pending >= self.checkpoint_every or
+               time.monotonic() - self._checkpointed_at >= self.checkpoint_seconds)
+        if due:
+            self.checkpoint()
+        return due
+
+    def checkpoint(self, path=None):
+        """Write state atomically (temp file + rename)"""
+        path = path or self.checkpoint_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            n = self.size
+            state = {
+                'sensor_ids': np.array(self.sensor_ids, dtype=str),
+                'lat': self.lat[:n],
+                'lng': self.lng[:n],
+                'level': self.level[:n],
+                'seasonal': self.seasonal[:n],
+                'slot_counts': self.slot_counts[:n],
+                'observations': self.observations[:n],
+                'last_seen': self.last_seen[:n],
+                'params': np.array([self.alpha, self.gamma]),
+                'last_reading_id': np.array([self.last_reading_id], dtype=np.int64),
+            }
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as fh:
+                np.savez(fh, **state)
+            os.replace(tmp_path, path)
+            self._pending = 0
+            self._checkpointed_at = time.monotonic()
+
+    def restore(self, path=None):
+        """Load state from a checkpoint, returning False if none exists"""
+        path = path or self.checkpoint_path
+        if not path or not os.path.exists(path):
+            return False
+        with np.load(path) as state, self._lock:
+            sensor_ids = [str(sensor_id) for sensor_id in state['sensor_ids']]
+            n = len(sensor_ids)
+            self._allocate(max(64, n * 2))
+            for name in STATE_ARRAYS:
+                getattr(self, name)[:n] = state[name]
+            self.restored_params = tuple(float(v) for v in state['params'])
+            self.last_reading_id = int(state['last_reading_id'][0])
+            self.sensor_ids = sensor_ids
+            self.sensor_rows = {sensor_id: row for row, sensor_id in enumerate(sensor_ids)}
+            self.size = n
+            self._pending = 0
+        return True
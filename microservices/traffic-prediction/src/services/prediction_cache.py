@@ -0,0 +1,103 @@
+"""Bounded LRU/TTL cache for congestion predictions.
+
+Entries are keyed on (grid cell, horizon, hour bucket, model version) so
+requests for nearly identical coordinates within the same hour share one
+computed answer. Each entry also records the watermark of the data it was
+derived from (for the online model, the readings folded into the sensors
+near its cell), and a lookup with a different watermark misses. New readings
+therefore only invalidate predictions for the cells they are near, instead
+of emptying the cache on every reading ingested anywhere in the city.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_CELL_DEGREES = 0.001  # roughly 100m
+
+
+def snap_to_cell(lat, lng, cell_degrees=DEFAULT_CELL_DEGREES):
+    """Return the (lat, lng) centre of the grid cell containing a point"""
+    row = int(lat // cell_degrees)
+    col = int(lng // cell_degrees)
+    return round((row + 0.5) * cell_degrees, 6), round((col + 0.5) * cell_degrees, 6)
+
+
+def hour_bucket(moment):
+    """Truncate a datetime to the start of its hour"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(lat, lng, horizon_hours, bucket, model_version, cell_degrees=DEFAULT_CELL_DEGREES):
+        cell = snap_to_cell(lat, lng, cell_degrees)
+        return cell, horizon_hours, bucket.isoformat(), model_version
+
+    def get(self, key, watermark=None):
+        """Cached value for key, or None if missing, expired or built from other data"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, entry_watermark, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if entry_watermark != watermark:
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, watermark=None):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, watermark, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry, e.g. after a model change"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'timestamp': datetime.utcnow().isoformat()
+            }
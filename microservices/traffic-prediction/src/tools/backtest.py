@@ -0,0 +1,306 @@
+"""Backtest the congestion prediction models against historical readings.
+
+Readings are replayed per sensor in time order. At every cutoff each model
+predicts the next ``horizon`` hours from what it has seen so far and the
+predictions are scored against the mean reading actually observed in each
+target hour (MAE plus a LOW/MEDIUM/HIGH confusion matrix). Sensors are
+sharded across a process pool; workers load or generate their own data so
+only shard specs and score totals cross process boundaries.
+
+Usage (from the traffic-prediction directory):
+
+    python -m src.tools.backtest --synthetic-sensors 100 --days 365
+    python -m src.tools.backtest --db ../data-ingestion/src/database/app.db
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from src.services.congestion_model import compute_congestion_predictions, compute_online_predictions
+from src.services.online_forecaster import OnlineForecaster
+from src.services.route_estimator import estimate_route
+
+LEVELS = ('LOW', 'MEDIUM', 'HIGH')
+MODELS = ('historical_average', 'online_seasonal')
+HISTORY_WINDOW = 200  # readings the API looks at per request
+SYNTHETIC_ORIGIN = (40.70, -74.02)
+SYNTHETIC_SPACING = 0.005
+
+
+def congestion_level(vehicle_count, average_speed):
+    """Same thresholds data-ingestion applies to incoming readings"""
+    level = np.zeros(np.shape(vehicle_count), dtype=np.int8)
+    level = np.where((np.asarray(vehicle_count) > 30) | (np.asarray(average_speed) < 50), 1, level)
+    level = np.where((np.asarray(vehicle_count) > 50) & (np.asarray(average_speed) < 30), 2, level)
+    return level
+
+
+def synthetic_sensor_location(index):
+    side = 32
+    return (SYNTHETIC_ORIGIN[0] + (index // side) * SYNTHETIC_SPACING,
+            SYNTHETIC_ORIGIN[1] + (index % side) * SYNTHETIC_SPACING)
+
+
+def synthetic_readings(index, start, end, interval_minutes, seed):
+    """Generate one sensor's readings with daily rush hours and quieter weekends"""
+    rng = np.random.default_rng(seed + index)
+    start_epoch = start.replace(tzinfo=timezone.utc).timestamp()
+    steps = int((end - start).total_seconds() // (interval_minutes * 60))
+    epochs = start_epoch + np.arange(steps) * interval_minutes * 60.0
+
+    hours = (epochs // 3600) % 24
+    weekdays = (epochs // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+    profile = np.where(((hours >= 7) & (hours <= 9)) | ((hours >= 17) & (hours <= 19)), 1.8, 1.0)
+    profile = np.where((hours >= 22) | (hours <= 5), 0.4, profile)
+    profile = np.where(weekdays >= 5, profile * 0.8, profile)
+
+    base = 20 + 15 * rng.random()
+    vehicle_counts = rng.poisson(base * profile)
+    speeds = np.clip(72 - 0.7 * vehicle_counts + rng.normal(0, 5, steps), 10, 90)
+    return epochs, vehicle_counts.astype(np.float64), speeds
+
+
+def sqlite_sensor_ids(db_path):
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        return [row[0] for row in conn.execute('SELECT DISTINCT sensor_id FROM traffic_data ORDER BY sensor_id')]
+
+
+def sqlite_readings(db_path, sensor_id):
+    """Load one sensor's readings from a data-ingestion database in time order"""
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        rows = conn.execute(
+            'SELECT location_lat, location_lng, timestamp, vehicle_count, average_speed '
+            'FROM traffic_data WHERE sensor_id = ? ORDER BY timestamp', (sensor_id,)
+        ).fetchall()
+    if not rows:
+        return (0.0, 0.0), np.empty(0), np.empty(0), np.empty(0)
+    location = (rows[0][0], rows[0][1])
+    epochs = np.array([datetime.fromisoformat(row[2]).replace(tzinfo=timezone.utc).timestamp() for row in rows])
+    return location, epochs, np.array([row[3] for row in rows], dtype=np.float64), np.array([row[4] for row in rows])
+
+
+class Scorecard:
+    """Running error totals for one model"""
+
+    def __init__(self, horizon):
+        self.predictions = 0
+        self.seconds = 0.0
+        self.count_abs_error = np.zeros(horizon)
+        self.speed_abs_error = np.zeros(horizon)
+        self.scored = np.zeros(horizon, dtype=np.int64)
+        self.confusion = np.zeros((len(LEVELS), len(LEVELS)), dtype=np.int64)
+
+    def add(self, predictions, actual_counts, actual_speeds, actual_levels, seconds):
+        self.seconds += seconds
+        self.predictions += len(predictions)
+        for offset, prediction in enumerate(predictions):
+            if np.isnan(actual_counts[offset]):
+                continue
+            self.count_abs_error[offset] += abs(prediction['predicted_vehicle_count'] - actual_counts[offset])
+            self.speed_abs_error[offset] += abs(prediction['predicted_speed'] - actual_speeds[offset])
+            self.scored[offset] += 1
+            predicted_level = LEVELS.index(prediction['predicted_congestion_level'])
+            self.confusion[actual_levels[offset], predicted_level] += 1
+
+    def merge(self, other):
+        self.predictions += other.predictions
+        self.seconds += other.seconds
+        self.count_abs_error += other.count_abs_error
+        self.speed_abs_error += other.speed_abs_error
+        self.scored += other.scored
+        self.confusion += other.confusion
+
+    def report(self):
+        scored = np.maximum(self.scored, 1)
+        return {
+            'predictions': self.predictions,
+            'scored': int(self.scored.sum()),
+            'mae_vehicle_count': round(float(self.count_abs_error.sum() / max(self.scored.sum(), 1)), 3),
+            'mae_speed': round(float(self.speed_abs_error.sum() / max(self.scored.sum(), 1)), 3),
+            'mae_vehicle_count_by_horizon': [round(float(v), 3) for v in self.count_abs_error / scored],
+            'mae_speed_by_horizon': [round(float(v), 3) for v in self.speed_abs_error / scored],
+            'level_accuracy': round(float(np.trace(self.confusion) / max(self.confusion.sum(), 1)), 4),
+            'confusion_matrix': {
+                'labels': list(LEVELS),
+                'rows_actual_cols_predicted': self.confusion.tolist()
+            },
+            'predictions_per_second': round(self.predictions / self.seconds, 1) if self.seconds else None
+        }
+
+
+def hourly_actuals(epochs, vehicle_counts, speeds):
+    """Mean count and speed per hour, keyed by hour index since the epoch"""
+    hour_index = (epochs // 3600).astype(np.int64)
+    first_hour = int(hour_index[0])
+    slots = hour_index - first_hour
+    counts = np.bincount(slots)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_counts = np.bincount(slots, weights=vehicle_counts) / counts
+        mean_speeds = np.bincount(slots, weights=speeds) / counts
+    return first_hour, mean_counts, mean_speeds, congestion_level(np.nan_to_num(mean_counts), np.nan_to_num(mean_speeds, nan=100))
+
+
+def backtest_sensor(sensor_id, location, epochs, vehicle_counts, speeds, horizon, cutoff_step_hours, scores):
+    """Replay one sensor's readings and score both models at every cutoff"""
+    if len(epochs) == 0:
+        return
+    lat, lng = location
+    first_hour, mean_counts, mean_speeds, levels = hourly_actuals(epochs, vehicle_counts, speeds)
+    n_hours = len(mean_counts)
+
+    history = [
+        {'location_lat': lat, 'location_lng': lng, 'vehicle_count': count, 'average_speed': speed}
+        for count, speed in zip(vehicle_counts.tolist(), speeds.tolist())
+    ]
+    forecaster = OnlineForecaster(initial_capacity=1)
+    fed = 0
+    hour_ends = np.searchsorted(epochs, (first_hour + np.arange(1, n_hours + 1)) * 3600.0)
+
+    # Warm up for a day so both models have some history at the first cutoff
+    for cutoff in range(24, n_hours - 1, cutoff_step_hours):
+        seen = int(hour_ends[cutoff - 1])
+        while fed < seen:
+            forecaster.update(sensor_id, lat, lng, datetime.utcfromtimestamp(epochs[fed]),
+                              vehicle_counts[fed], speeds[fed])
+            fed += 1
+
+        base_time = datetime.utcfromtimestamp((first_hour + cutoff - 1) * 3600)
+        targets = slice(cutoff, min(cutoff + horizon, n_hours))
+        actual_counts = np.full(horizon, np.nan)
+        actual_speeds = np.full(horizon, np.nan)
+        actual_levels = np.zeros(horizon, dtype=np.int8)
+        width = targets.stop - targets.start
+        actual_counts[:width] = mean_counts[targets]
+        actual_speeds[:width] = mean_speeds[targets]
+        actual_levels[:width] = levels[targets]
+
+        started = time.perf_counter()
+        result = compute_congestion_predictions(lat, lng, horizon, base_time, history[max(0, seen - HISTORY_WINDOW):seen])
+        scores['historical_average'].add(result['predictions'], actual_counts, actual_speeds, actual_levels,
+                                         time.perf_counter() - started)
+
+        started = time.perf_counter()
+        result = compute_online_predictions(forecaster, np.array([0]), horizon, base_time)
+        scores['online_seasonal'].add(result['predictions'], actual_counts, actual_speeds, actual_levels,
+                                      time.perf_counter() - started)
+
+
+def run_shard(shard):
+    """Process-pool entry point: backtest every sensor in a shard"""
+    scores = {model: Scorecard(shard['horizon']) for model in MODELS}
+    readings = 0
+    for sensor in shard['sensors']:
+        if shard['source'] == 'sqlite':
+            location, epochs, vehicle_counts, speeds = sqlite_readings(shard['db_path'], sensor)
+        else:
+            location = synthetic_sensor_location(sensor)
+            epochs, vehicle_counts, speeds = synthetic_readings(
+                sensor, shard['start'], shard['end'], shard['interval_minutes'], shard['seed'])
+        readings += len(epochs)
+        backtest_sensor(str(sensor), location, epochs, vehicle_counts, speeds,
+                        shard['horizon'], shard['cutoff_step_hours'], scores)
+    return readings, scores
+
+
+def backtest_routes(sensor_count, samples, vertices, seed):
+    """Throughput of estimate_route on synthetic polylines over the sensor grid"""
+    rng = np.random.default_rng(seed)
+    locations = np.array([synthetic_sensor_location(i) for i in range(sensor_count)])
+    speeds = rng.uniform(15, 80, sensor_count)
+    levels = np.array(LEVELS)[congestion_level(rng.integers(10, 100, sensor_count), speeds)]
+    span = locations.max(axis=0) - locations.min(axis=0)
+
+    elapsed = 0.0
+    for _ in range(samples):
+        start = locations.min(axis=0) + rng.random(2) * span
+        end = locations.min(axis=0) + rng.random(2) * span
+        t = np.linspace(0, 1, vertices)[:, None]
+        route = start + (end - start) * t + rng.normal(0, 0.0003, (vertices, 2))
+        started = time.perf_counter()
+        estimate_route(route[:, 0], route[:, 1], locations[:, 0], locations[:, 1], speeds, levels)
+        elapsed += time.perf_counter() - started
+    return {
+        'routes': samples,
+        'vertices_per_route': vertices,
+        'sensors': sensor_count,
+        'mean_latency_ms': round(elapsed / samples * 1000, 3) if samples else None,
+        'predictions_per_second': round(samples / elapsed, 1) if elapsed else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', help='data-ingestion SQLite database to replay')
+    parser.add_argument('--synthetic-sensors', type=int, default=50)
+    parser.add_argument('--days', type=int, default=30, help='synthetic history length')
+    parser.add_argument('--interval-minutes', type=int, default=5, help='synthetic reading interval')
+    parser.add_argument('--horizon', type=int, default=6, help='hours predicted at each cutoff')
+    parser.add_argument('--cutoff-step-hours', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shards', type=int, default=None, help='defaults to 4 per worker')
+    parser.add_argument('--route-samples', type=int, default=200)
+    parser.add_argument('--route-vertices', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if args.db:
+        sensors = sqlite_sensor_ids(args.db)
+        source = 'sqlite'
+    else:
+        sensors = list(range(args.synthetic_sensors))
+        source = 'synthetic'
+
+    end = datetime(2026, 1, 5)
+    n_shards = max(1, min(len(sensors), args.shards or args.workers * 4))
+    shards = [{
+        'source': source,
+        'db_path': args.db,
+        'sensors': sensors[i::n_shards],
+        'start': end - timedelta(days=args.days),
+        'end': end,
+        'interval_minutes': args.interval_minutes,
+        'seed': args.seed,
+        'horizon': args.horizon,
+        'cutoff_step_hours': args.cutoff_step_hours
+    } for i in range(n_shards)]
+
+    started = time.perf_counter()
+    totals = {model: Scorecard(args.horizon) for model in MODELS}
+    readings = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for shard_readings, scores in pool.map(run_shard, shards):
+            readings += shard_readings
+            for model in MODELS:
+                totals[model].merge(scores[model])
+    wall_seconds = time.perf_counter() - started
+
+    report = {
+        'source': source,
+        'sensors': len(sensors),
+        'readings_replayed': readings,
+        'horizon_hours': args.horizon,
+        'workers': args.workers,
+        'shards': n_shards,
+        'wall_seconds': round(wall_seconds, 2),
+        'models': {model: totals[model].report() for model in MODELS},
+        'overall_predictions_per_second': round(
+            sum(totals[model].predictions for model in MODELS) / wall_seconds, 1) if wall_seconds else None
+    }
+    if args.route_samples:
+        report['route_estimator'] = backtest_routes(len(sensors) if source == 'synthetic' else args.synthetic_sensors,
+                                                    args.route_samples, args.route_vertices, args.seed)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()